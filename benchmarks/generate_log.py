@@ -0,0 +1,175 @@
+"""Deterministic synthetic access log generator.
+
+The same options and seed always produce the same file, so numbers of
+different runs and machines can be compared.
+
+    python -m benchmarks.generate_log --size 100M --output access.log
+"""
+import sys
+import bisect
+import random
+import argparse
+import datetime
+from itertools import accumulate
+from botstat.botstat import BOT_LIST
+
+
+NGINX_LOG_FORMAT = ('$remote_addr $host $remote_user [$time_local] "$request" $status '
+                    '$body_bytes_sent "$http_referer" "$http_user_agent" $request_time')
+APACHE_LOG_FORMAT = '%h %v %l %u %t "%r" %>s %b "%{Referer}i" "%{User-Agent}i" %D'
+LOG_FORMATS = {"nginx": NGINX_LOG_FORMAT, "apache": APACHE_LOG_FORMAT}
+
+# client address and vhost are followed by $remote_user or %l %u
+LINE_TEMPLATES = {"nginx": '%s %s - [%s] "GET %s HTTP/1.1" %d %d "-" "%s" %s\n',
+                  "apache": '%s %s - - [%s] "GET %s HTTP/1.1" %d %d "-" "%s" %s\n'}
+STATUSES = [(200, 80), (301, 8), (304, 5), (404, 5), (500, 2)]
+START = datetime.datetime(2018, 6, 1)
+BATCH_SIZE = 10000
+SIZE_UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+
+def parse_size(value):
+    # "512K", "100M", "20G" or plain bytes
+    unit = SIZE_UNITS.get(value[-1:].upper())
+    if unit is None:
+        return int(value)
+    return int(float(value[:-1]) * unit)
+
+
+def draw(rng, population, cum_weights=None, k=1):
+    """rng.choices(population, cum_weights=cum_weights, k=k), which is new
+    in Python 3.6, the same items are drawn on every Python."""
+    random_value = rng.random
+    if cum_weights is None:
+        size = len(population)
+        return [population[int(random_value() * size)] for i in range(k)]
+    total, last = cum_weights[-1], len(cum_weights) - 1
+    return [population[bisect.bisect(cum_weights, random_value() * total, 0, last)] for i in range(k)]
+
+
+class LogGenerator(object):
+    """Access log lines with a fixed share of bot requests.
+
+    Lines are spread evenly over days starting at START, user agents,
+    paths, client addresses and virtual hosts are taken from pools of
+    fixed size to control cardinality of the statistic.
+    """
+
+    def __init__(self, server_type="nginx", bot_ratio=0.2, user_agents=1000,
+                 hosts=10, days=7, seed=0):
+        if server_type not in LOG_FORMATS:
+            raise ValueError("Unknown server type %s" % (server_type,))
+        self.server_type = server_type
+        self.log_format = LOG_FORMATS[server_type]
+        self.line_template = LINE_TEMPLATES[server_type]
+        self.days = days
+        self.seed = seed
+        rng = random.Random(seed)
+        tokens = sorted(BOT_LIST)
+        bot_count = min(user_agents, max(1, int(round(user_agents * bot_ratio))))
+        browser_count = user_agents - bot_count
+        bots = ["Mozilla/5.0 (compatible; %s/%d.%d; +http://www.example.com/bot.html)"
+                % (tokens[i % len(tokens)], 1 + i // len(tokens), rng.randint(0, 9))
+                for i in range(bot_count)]
+        browsers = ["Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                    "(KHTML, like Gecko) Chrome/%d.0.%d.%d Safari/537.36"
+                    % (60 + i % 40, i, rng.randint(0, 199)) for i in range(browser_count)]
+        self.user_agents = bots + browsers
+        weights = [bot_ratio / bot_count] * bot_count
+        if browser_count:
+            weights += [(1 - bot_ratio) / browser_count] * browser_count
+        self.user_agent_weights = list(accumulate(weights))
+        self.hosts = ["www.site%d.example.com" % i for i in range(hosts)]
+        self.paths = ["/category-%d/item-%d.html" % (i % 50, i) for i in range(10000)]
+        self.addresses = ["%d.%d.%d.%d" % (rng.randint(1, 223), rng.randint(0, 255),
+                                           rng.randint(0, 255), rng.randint(1, 254))
+                          for i in range(5000)]
+        self.statuses = [status for status, weight in STATUSES]
+        self.status_weights = list(accumulate(weight for status, weight in STATUSES))
+
+    def average_line_length(self):
+        lines = list(self.lines(1000))
+        return sum(len(line.encode("utf-8")) for line in lines) / len(lines)
+
+    def lines_for_size(self, size):
+        return max(1, int(size / self.average_line_length()))
+
+    def time_local(self, seconds):
+        moment = START + datetime.timedelta(seconds=seconds)
+        return moment.strftime("%d/%b/%Y:%H:%M:%S +0000")
+
+    def request_time(self, rng):
+        seconds = rng.expovariate(10)
+        if self.server_type == "apache":
+            return "%d" % (seconds * 1000000)
+        return "%.3f" % seconds
+
+    def lines(self, count):
+        rng = random.Random(self.seed)
+        template = self.line_template
+        step = self.days * 86400 / count
+        second = stamp = None
+        for batch_start in range(0, count, BATCH_SIZE):
+            size = min(BATCH_SIZE, count - batch_start)
+            user_agents = draw(rng, self.user_agents, self.user_agent_weights, size)
+            statuses = draw(rng, self.statuses, self.status_weights, size)
+            hosts = draw(rng, self.hosts, k=size)
+            paths = draw(rng, self.paths, k=size)
+            addresses = draw(rng, self.addresses, k=size)
+            for i in range(size):
+                line_second = int((batch_start + i) * step)
+                if line_second != second:
+                    second = line_second
+                    stamp = self.time_local(second)
+                yield template % (addresses[i], hosts[i], stamp, paths[i], statuses[i],
+                                  rng.randint(200, 60000), user_agents[i], self.request_time(rng))
+
+    def write(self, stream, size):
+        """Write about size bytes of log, return number of lines."""
+        count = self.lines_for_size(size)
+        batch = []
+        for line in self.lines(count):
+            batch.append(line)
+            if len(batch) == BATCH_SIZE:
+                stream.writelines(batch)
+                batch = []
+        stream.writelines(batch)
+        return count
+
+
+def add_generator_arguments(arg_parser):
+    arg_parser.add_argument("--server-type", choices=sorted(LOG_FORMATS), default="nginx")
+    arg_parser.add_argument("--size", type=parse_size, default=parse_size("50M"),
+                            help="Log size, with K, M or G suffix. Default 50M")
+    arg_parser.add_argument("--bot-ratio", type=float, default=0.2,
+                            help="Share of bot requests. Default 0.2")
+    arg_parser.add_argument("--user-agents", type=int, default=1000,
+                            help="Number of distinct user agents. Default 1000")
+    arg_parser.add_argument("--hosts", type=int, default=10,
+                            help="Number of virtual hosts. Default 10")
+    arg_parser.add_argument("--days", type=int, default=7,
+                            help="Days covered by the log. Default 7")
+    arg_parser.add_argument("--seed", type=int, default=0)
+
+
+def make_generator(args):
+    return LogGenerator(args.server_type, args.bot_ratio, args.user_agents,
+                        args.hosts, args.days, args.seed)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Generate synthetic access log")
+    add_generator_arguments(arg_parser)
+    arg_parser.add_argument("--output", help="Log file name. If not specify used stdout.")
+    args = arg_parser.parse_args()
+    generator = make_generator(args)
+    if args.output is None:
+        count = generator.write(sys.stdout, args.size)
+    else:
+        with open(args.output, "w") as stream:
+            count = generator.write(stream, args.size)
+    print("%d lines, log_format: %s" % (count, generator.log_format), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""Benchmarks of the log processing stages.
+
+Every benchmark runs in a fresh worker process, so the reported peak RSS
+belongs to that stage alone (input preparation included).
+
+    python -m benchmarks.run --size 200M --save baseline.json
+    python -m benchmarks.run --size 200M --baseline baseline.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import datetime
+import tempfile
+import traceback
+from multiprocessing import Pipe
+from multiprocessing import Process
+from botstat.botstat import build_log_parser
+from botstat.botstat import make_parallel_stats
+from botstat.botstat import make_stats
+from botstat.botstat import parse_argumets
+from botstat.botstat import process_apache
+from botstat.botstat import process_nginx
+from botstat.botstat import seek_to_date
+from botstat.botstat import stats_generator
+from botstat.botstat import write_csv_report
+from botstat.botstat import write_xlsx_report
+from .generate_log import START
+from .generate_log import add_generator_arguments
+from .generate_log import make_generator
+
+
+SEEK_REPEAT = 20
+# options which change the log, rates are comparable only when they match
+GENERATOR_OPTIONS = ["server_type", "size", "bot_ratio", "user_agents", "hosts", "days",
+                     "seed", "workers", "bot_prefilter", "engine"]
+
+
+def peak_rss():
+    # the largest of the process and its --workers children, ru_maxrss
+    # is in kilobytes on Linux and in bytes on macOS
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+              resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def botstat_args(options, log_format):
+    argv = ["--server-type", options.server_type, "--log-format", log_format,
+            "--workers", str(options.workers), "--engine", options.engine]
+    if options.bot_prefilter:
+        argv.append("--bot-prefilter")
+    return parse_argumets(argv)
+
+
+def parse_records(access_log, args):
+    if args.server_type == "apache":
+        return process_apache([access_log], args)
+    return process_nginx([access_log], args)
+
+
+def collect_stats(access_log, args):
+    if args.workers > 1:
+        return make_parallel_stats([access_log], args)
+    return make_stats(parse_records(access_log, args), args)
+
+
+def bench_parse(access_log, args, options):
+    # log format regex matching of every line
+    started = time.time()
+    count = sum(1 for record in parse_records(access_log, args))
+    return count, time.time() - started
+
+
+def bench_stats(access_log, args, options):
+    started = time.time()
+    collect_stats(access_log, args)
+    return options.lines, time.time() - started
+
+
+def bench_seek(access_log, args, options):
+    regex_parser = build_log_parser(args.server_type, args.log_format)
+    started = time.time()
+    with open(access_log) as stream:
+        for day in range(SEEK_REPEAT):
+            stream.seek(0)
+            seek_to_date(stream, (START + datetime.timedelta(days=day % options.days)).date(),
+                         regex_parser)
+    return SEEK_REPEAT, time.time() - started
+
+
+def bench_report(access_log, args, options):
+    stats = collect_stats(access_log, args)
+    started = time.time()
+    count = sum(1 for row in stats_generator(stats))
+    return count, time.time() - started
+
+
+def bench_csv(access_log, args, options):
+    stats = collect_stats(access_log, args)
+    started = time.time()
+    with tempfile.TemporaryFile(mode="w+") as stream:
+        write_csv_report(stats, stream)
+    return len(stats.row_keys), time.time() - started
+
+
+def bench_xlsx(access_log, args, options):
+    stats = collect_stats(access_log, args)
+    started = time.time()
+    with tempfile.NamedTemporaryFile(suffix=".xlsx") as stream:
+        write_xlsx_report(stats, stream.name)
+    return len(stats.row_keys), time.time() - started
+
+
+# name -> (function, unit of the counted items)
+BENCHMARKS = {"parse": (bench_parse, "lines"),
+              "stats": (bench_stats, "lines"),
+              "seek": (bench_seek, "seeks"),
+              "report": (bench_report, "rows"),
+              "csv": (bench_csv, "rows"),
+              "xlsx": (bench_xlsx, "rows")}
+BENCHMARK_ORDER = ["parse", "stats", "seek", "report", "csv", "xlsx"]
+
+
+def run_benchmark(task):
+    name, access_log, args, options = task
+    count, seconds = BENCHMARKS[name][0](access_log, args, options)
+    return {"name": name, "count": count, "unit": BENCHMARKS[name][1], "seconds": seconds,
+            "rate": count / seconds if seconds else 0.0, "peak_rss": peak_rss()}
+
+
+def run_child(connection, task):
+    try:
+        connection.send(run_benchmark(task))
+    except Exception:
+        connection.send(traceback.format_exc())
+        raise
+
+
+def run_isolated(task):
+    # not a Pool worker: daemonic processes can't start --workers pools
+    receiver, sender = Pipe(False)
+    process = Process(target=run_child, args=(sender, task))
+    process.start()
+    result = receiver.recv()
+    process.join()
+    if not isinstance(result, dict):
+        raise SystemExit("Benchmark %s failed:\n%s" % (task[0], result))
+    return result
+
+
+def compare(results, baseline, max_slowdown):
+    # names of benchmarks which rate dropped more than max_slowdown
+    previous = dict((result["name"], result) for result in baseline["results"])
+    slower = []
+    for result in results:
+        old = previous.get(result["name"])
+        if old and old["rate"]:
+            change = result["rate"] / old["rate"] - 1
+            result["change"] = change
+            if change < -max_slowdown:
+                slower.append(result["name"])
+    return slower
+
+
+def print_results(results):
+    print("%-8s %12s %10s %14s %12s %9s" % ("stage", "count", "seconds", "rate/sec", "peak RSS MB", "change"))
+    for result in results:
+        change = result.get("change")
+        print("%-8s %12d %10.3f %14.1f %12.1f %9s" % (
+            result["name"], result["count"], result["seconds"], result["rate"],
+            result["peak_rss"] / (1 << 20), "" if change is None else "%+.1f%%" % (change * 100)))
+
+
+def count_lines(access_log):
+    with open(access_log, "rb") as stream:
+        return sum(block.count(b"\n") for block in iter(lambda: stream.read(1 << 20), b""))
+
+
+def parse_arguments(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Benchmark log processing stages")
+    add_generator_arguments(arg_parser)
+    arg_parser.add_argument("--log", help="Use existing log generated with the same options")
+    arg_parser.add_argument("--benchmark", action="append", choices=BENCHMARK_ORDER,
+                            help="Benchmark to run, can be repeated. Default all")
+    arg_parser.add_argument("--workers", type=int, default=1)
+    arg_parser.add_argument("--bot-prefilter", action="store_true")
+    arg_parser.add_argument("--engine", choices=["python", "numpy"], default="python")
+    arg_parser.add_argument("--save", help="Save results to json file")
+    arg_parser.add_argument("--baseline", help="Compare with results saved by --save")
+    arg_parser.add_argument("--max-slowdown", type=float, default=0.1,
+                            help="Allowed rate drop against baseline. Default 0.1")
+    return arg_parser.parse_args(argv)
+
+
+def run(options):
+    generator = make_generator(options)
+    names = options.benchmark or BENCHMARK_ORDER
+    temp_dir = None
+    access_log = options.log
+    try:
+        if access_log is None:
+            temp_dir = tempfile.mkdtemp(prefix="botstat-bench-")
+            access_log = os.path.join(temp_dir, "access.log")
+            started = time.time()
+            with open(access_log, "w") as stream:
+                options.lines = generator.write(stream, options.size)
+            print("Generated %d lines, %d bytes in %.1f sec" % (
+                options.lines, os.path.getsize(access_log), time.time() - started))
+        else:
+            options.lines = count_lines(access_log)
+        args = botstat_args(options, generator.log_format)
+        return [run_isolated((name, access_log, args, options)) for name in names]
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir)
+
+
+def main(argv=None):
+    options = parse_arguments(argv)
+    results = run(options)
+    slower = []
+    if options.baseline:
+        with open(options.baseline) as fobj:
+            baseline = json.load(fobj)
+        changed = [key for key in GENERATOR_OPTIONS
+                   if baseline["options"].get(key) != getattr(options, key)]
+        if changed:
+            print("Warning: baseline log differs by %s" % ", ".join(changed), file=sys.stderr)
+        slower = compare(results, baseline, options.max_slowdown)
+    print_results(results)
+    if options.save:
+        with open(options.save, "w") as fobj:
+            json.dump({"options": dict((key, value) for key, value in vars(options).items()
+                                       if key not in ("save", "baseline")),
+                       "results": results}, fobj, indent=2)
+    if slower:
+        raise SystemExit("Slower than baseline: %s" % ", ".join(slower))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+from array import array
+from collections import Counter
+from .histogram import add_time
+from .histogram import merge_histograms
+from .heavy_hitters import SpaceSaving
+
+
+# Cells per row, one for every status class: 0xx, 1xx, ... 9xx
+STATUS_CLASSES = 10
+
+
+class StatsStore(object):
+    """Aggregated bots statistic.
+
+    Every (date, bot, host) key is mapped to a row of STATUS_CLASSES cells
+    in flat count/bytes/time arrays, so a record costs one dict lookup
+    and three array updates. Host names and dates or time buckets are
+    interned, the same object is shared by all rows with it. Request times of a cell are
+    also counted in a log-bucketed histogram for percentiles, a sparse
+    bucket -> count dict in latencies keyed by cell. Crawled URLs, when
+    counted, are kept in a SpaceSaving summary per row in urls.
+
+    For reading it also behaves like the nested mapping
+    date -> bot -> host -> status -> Counter({count, bytes, time}).
+    """
+
+    def __init__(self):
+        self.index = {}
+        self.row_keys = []
+        self.counts = array("q")
+        self.bytes = array("q")
+        self.times = array("d")
+        self.has_bytes = False
+        self.has_time = False
+        self.names = {}
+        self.latencies = {}
+        self.urls = {}
+
+    def row(self, date, bot, host):
+        key = (date, bot, host)
+        row = self.index.get(key)
+        if row is None:
+            row = self.index[key] = len(self.row_keys)
+            self.row_keys.append((self.names.setdefault(date, date), bot, self.names.setdefault(host, host)))
+            self.counts.extend([0] * STATUS_CLASSES)
+            self.bytes.extend([0] * STATUS_CLASSES)
+            self.times.extend([0.0] * STATUS_CLASSES)
+        return row
+
+    def add(self, date, bot, host, status, bytes_sent=None, request_time=None):
+        row = self.index.get((date, bot, host))
+        if row is None:
+            row = self.row(date, bot, host)
+        cell = row * STATUS_CLASSES + status // 100
+        self.counts[cell] += 1
+        if bytes_sent is not None:
+            self.bytes[cell] += bytes_sent
+            self.has_bytes = True
+        if request_time is not None:
+            self.times[cell] += request_time
+            self.has_time = True
+            histogram = self.latencies.get(cell)
+            if histogram is None:
+                histogram = self.latencies[cell] = {}
+            add_time(histogram, request_time)
+
+    def add_url(self, date, bot, host, url, capacity):
+        row = self.index.get((date, bot, host))
+        if row is None:
+            row = self.row(date, bot, host)
+        urls = self.urls.get(row)
+        if urls is None:
+            urls = self.urls[row] = SpaceSaving(capacity)
+        urls.add(url)
+
+    def merge_urls(self, date, bot, host, urls):
+        row = self.row(date, bot, host)
+        if row in self.urls:
+            self.urls[row].merge(urls)
+        else:
+            self.urls[row] = SpaceSaving(urls.capacity).load(urls.items())
+
+    def add_counter(self, date, bot, host, status, counter, latency=None):
+        cell = self.row(date, bot, host) * STATUS_CLASSES + status // 100
+        if latency:
+            merge_histograms(self.latencies.setdefault(cell, {}), latency)
+        self.counts[cell] += counter.get("count", 0)
+        if "bytes" in counter:
+            self.bytes[cell] += counter["bytes"]
+            self.has_bytes = True
+        if "time" in counter:
+            self.times[cell] += counter["time"]
+            self.has_time = True
+
+    def merge(self, other):
+        for other_row, key in enumerate(other.row_keys):
+            cell = self.row(*key) * STATUS_CLASSES
+            other_cell = other_row * STATUS_CLASSES
+            for status_class in range(STATUS_CLASSES):
+                self.counts[cell + status_class] += other.counts[other_cell + status_class]
+                self.bytes[cell + status_class] += other.bytes[other_cell + status_class]
+                self.times[cell + status_class] += other.times[other_cell + status_class]
+                histogram = other.latencies.get(other_cell + status_class)
+                if histogram is not None:
+                    merge_histograms(self.latencies.setdefault(cell + status_class, {}), histogram)
+        for other_row, urls in other.urls.items():
+            date, bot, host = other.row_keys[other_row]
+            self.merge_urls(date, bot, host, urls)
+        self.has_bytes = self.has_bytes or other.has_bytes
+        self.has_time = self.has_time or other.has_time
+        return self
+
+    def sorted_rows(self):
+        # row numbers ordered by date, bot and host
+        return sorted(range(len(self.row_keys)),
+                      key=lambda row: (self.row_keys[row][:2], self.row_keys[row][2] or ""))
+
+    def iter_rows(self, rows=None):
+        # (date, bot, host, counts, bytes, times) with values per status class
+        zeros = [0] * STATUS_CLASSES
+        for row in range(len(self.row_keys)) if rows is None else rows:
+            date, bot, host = self.row_keys[row]
+            cell = row * STATUS_CLASSES
+            yield (date, bot, host,
+                   self.counts[cell:cell + STATUS_CLASSES],
+                   self.bytes[cell:cell + STATUS_CLASSES],
+                   self.times[cell:cell + STATUS_CLASSES] if self.has_time else zeros)
+
+    def iter_counters(self, rows=None):
+        # (date, bot, host, status, Counter) for every status with hits
+        for row in range(len(self.row_keys)) if rows is None else rows:
+            date, bot, host = self.row_keys[row]
+            for status_class in range(STATUS_CLASSES):
+                cell = row * STATUS_CLASSES + status_class
+                if not self.counts[cell]:
+                    continue
+                counter = Counter(count=self.counts[cell])
+                if self.has_bytes:
+                    counter["bytes"] = self.bytes[cell]
+                if self.has_time:
+                    counter["time"] = self.times[cell]
+                yield date, bot, host, status_class * 100, counter
+
+    def latency(self, row, status_classes=range(STATUS_CLASSES)):
+        # histogram of request times of the row, all status classes merged
+        histogram = {}
+        for status_class in status_classes:
+            cell_histogram = self.latencies.get(row * STATUS_CLASSES + status_class)
+            if cell_histogram is not None:
+                merge_histograms(histogram, cell_histogram)
+        return histogram
+
+    def iter_latencies(self):
+        # (date, bot, host, status, histogram) for every status with times
+        for cell in sorted(self.latencies):
+            row, status_class = divmod(cell, STATUS_CLASSES)
+            date, bot, host = self.row_keys[row]
+            yield date, bot, host, status_class * 100, self.latencies[cell]
+
+    def iter_urls(self):
+        # (date, bot, host, SpaceSaving) for every row with counted URLs
+        for row in sorted(self.urls):
+            date, bot, host = self.row_keys[row]
+            yield date, bot, host, self.urls[row]
+
+    def top_urls(self, k):
+        """(bot, host, [(url, count, error)]) of k most crawled URLs, dates merged."""
+        merged = {}
+        for date, bot, host, urls in self.iter_urls():
+            if (bot, host) in merged:
+                merged[bot, host].merge(urls)
+            else:
+                merged[bot, host] = SpaceSaving(urls.capacity).load(urls.items())
+        for bot, host in sorted(merged):
+            yield bot, host, merged[bot, host].top(k)
+
+    def tree(self, rows=None):
+        tree = {}
+        for date, bot, host, status, counter in self.iter_counters(rows):
+            tree.setdefault(date, {}).setdefault(bot, {}).setdefault(host, {})[status] = counter
+        return tree
+
+    def select(self, predicate):
+        # New store with rows which keys (date, bot, host) match predicate
+        selected = StatsStore()
+        for row, key in enumerate(self.row_keys):
+            if predicate(key):
+                cell = row * STATUS_CLASSES
+                selected.index[key] = len(selected.row_keys)
+                selected.row_keys.append(key)
+                selected.names.setdefault(key[0], key[0])
+                selected.names.setdefault(key[2], key[2])
+                selected.counts.extend(self.counts[cell:cell + STATUS_CLASSES])
+                selected.bytes.extend(self.bytes[cell:cell + STATUS_CLASSES])
+                selected.times.extend(self.times[cell:cell + STATUS_CLASSES])
+                selected_cell = (len(selected.row_keys) - 1) * STATUS_CLASSES
+                for status_class in range(STATUS_CLASSES):
+                    histogram = self.latencies.get(cell + status_class)
+                    if histogram is not None:
+                        selected.latencies[selected_cell + status_class] = dict(histogram)
+                if row in self.urls:
+                    selected.urls[len(selected.row_keys) - 1] = self.urls[row]
+        selected.has_bytes = self.has_bytes
+        selected.has_time = self.has_time
+        return selected
+
+    def copy(self):
+        # independent store, histograms and URL summaries are copied too
+        copied = StatsStore()
+        copied.index = dict(self.index)
+        copied.row_keys = list(self.row_keys)
+        copied.counts = self.counts[:]
+        copied.bytes = self.bytes[:]
+        copied.times = self.times[:]
+        copied.has_bytes = self.has_bytes
+        copied.has_time = self.has_time
+        copied.names = dict(self.names)
+        copied.latencies = dict((cell, dict(histogram)) for cell, histogram in self.latencies.items())
+        copied.urls = dict((row, SpaceSaving(urls.capacity).load(urls.items(), urls.capacity))
+                           for row, urls in self.urls.items())
+        return copied
+
+    def keys(self):
+        return list(dict.fromkeys(key[0] for key in self.row_keys))
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __contains__(self, date):
+        return date in self.keys()
+
+    def __getitem__(self, date):
+        tree = self.tree(row for row, key in enumerate(self.row_keys) if key[0] == date)
+        if date not in tree:
+            raise KeyError(date)
+        return tree[date]
+
+    def items(self):
+        return self.tree().items()
+
+    def __eq__(self, other):
+        if isinstance(other, StatsStore):
+            return self.tree() == other.tree() and \
+                sorted(self.iter_latencies()) == sorted(other.iter_latencies())
+        if isinstance(other, dict):
+            return self.tree() == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
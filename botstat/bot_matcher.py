@@ -0,0 +1,154 @@
+import re
+from collections import Counter
+from functools import lru_cache
+
+
+BOT_CACHE_SIZE = 16384
+# Above this number of substrings one regex search is faster than
+# searching every substring separately
+PREFILTER_MAX_NEEDLES = 16
+
+
+def trie_pattern(words):
+    # Build a regex alternation from a prefix tree of the words, so the
+    # number of branches tried at each position does not grow with the list
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = None
+
+    def build(node):
+        end = "" in node
+        branches = [re.escape(char) + build(child)
+                    for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        if len(branches) == 1 and not end:
+            return branches[0]
+        pattern = "(?:%s)" % "|".join(branches)
+        if end:
+            pattern += "?"
+        return pattern
+
+    return build(trie)
+
+
+def parse_bot_definitions(definitions):
+    # "AhrefsBot=Ahrefs" -> ("AhrefsBot", "Ahrefs")
+    for definition in definitions or ():
+        token, separator, name = definition.partition("=")
+        token = token.strip()
+        if not token:
+            raise SystemExit("Bot definition \"%s\" has no user agent token" % (definition,))
+        yield token, (name.strip() if separator else token) or token
+
+
+class BotMatcher(object):
+    """Find a bot name by user agent.
+
+    All tokens are compiled once into a single regex which is searched
+    in lower cased user agent (that is several times faster than
+    re.IGNORECASE), results are cached by the raw user agent string.
+    Undecoded bytes user agents are matched by a bytes copy of the regex.
+    """
+
+    def __init__(self, bots, cache_size=BOT_CACHE_SIZE):
+        self.names = {}
+        for token, name in bots:
+            self.names.setdefault(token.lower(), name)
+        pattern = trie_pattern(sorted(self.names)) or "(?!)"
+        self.regex = re.compile(pattern)
+        self.bytes_regex = re.compile(pattern.encode("utf-8"))
+        self.match = lru_cache(maxsize=cache_size)(self._match)
+
+    def _match(self, user_agent):
+        if isinstance(user_agent, bytes):
+            found = self.bytes_regex.search(user_agent.lower())
+            if found is not None:
+                return self.names[found.group(0).decode("utf-8")]
+            return None
+        found = self.regex.search(user_agent.lower())
+        if found is not None:
+            return self.names[found.group(0).lower()]
+
+
+def cover_substrings(tokens, min_length=3):
+    # Greedy small set of substrings such that every token contains
+    # at least one of them, e.g. "bot" for googlebot, bingbot, yandexbot
+    uncovered = set(tokens)
+    needles = []
+    while uncovered:
+        counts = Counter()
+        for token in uncovered:
+            length = min(min_length, len(token))
+            counts.update(set(token[start:end]
+                              for start in range(len(token) - length + 1)
+                              for end in range(start + length, len(token) + 1)))
+        needle = max(counts, key=lambda substring: (counts[substring], len(substring), substring))
+        needles.append(needle)
+        uncovered = set(token for token in uncovered if needle not in token)
+    return needles
+
+
+def make_finders(tokens):
+    # Functions returning the next position of a possible bot token in text
+    needles = cover_substrings(tokens)
+    if len(needles) <= PREFILTER_MAX_NEEDLES:
+        return [lambda text, start, needle=needle: text.find(needle, start)
+                for needle in needles]
+    if needles and isinstance(needles[0], bytes):
+        pattern = trie_pattern([needle.decode("latin-1") for needle in needles]).encode("latin-1")
+    else:
+        pattern = trie_pattern(needles)
+    regex = re.compile(pattern)
+
+    def find(text, start):
+        found = regex.search(text, start)
+        return -1 if found is None else found.start()
+    return [find]
+
+
+class BotPrefilter(object):
+    """Drop log lines which can't belong to a bot before parsing them.
+
+    Works on blocks of lines: the block is lower cased at once and only
+    lines around occurrences of substrings common to bot tokens are
+    returned, so lines without any bot token cost nothing in Python code.
+    Returned lines still have to be checked by BotMatcher.
+    """
+
+    def __init__(self, tokens):
+        tokens = [token.lower() for token in tokens]
+        self.finders = {str: make_finders(tokens),
+                        bytes: make_finders([token.encode("utf-8") for token in tokens])}
+
+    def candidates(self, block):
+        newline = b"\n" if isinstance(block, bytes) else "\n"
+        lowered = block.lower()
+        if len(lowered) != len(block):
+            # some unicode characters change length when lower cased
+            return block.splitlines(True)
+        lines = {}
+        for find in self.finders[type(block)]:
+            position = find(lowered, 0)
+            while position != -1:
+                start = lowered.rfind(newline, 0, position) + 1
+                end = lowered.find(newline, position) + 1 or len(block)
+                lines[start] = end
+                position = find(lowered, end)
+        return [block[start:lines[start]] for start in sorted(lines)]
+
+    def filter(self, blocks):
+        rest = None
+        for block in blocks:
+            if rest:
+                block = rest + block
+            end = block.rfind(b"\n" if isinstance(block, bytes) else "\n") + 1
+            rest = block[end:]
+            for line in self.candidates(block[:end]):
+                yield line
+        if rest:
+            for line in self.candidates(rest):
+                yield line
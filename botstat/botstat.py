@@ -1,15 +1,18 @@
-from __future__ import absolute_import, division, print_function, unicode_literals
 import sys
+import atexit
 import logging
 import configargparse
 import os
+import io
+import re
+import mmap
 import socket
+import signal
+import asyncio
+import itertools
 from dateutil import parser
 import datetime
-from collections import defaultdict
-from collections import Counter
 import csv
-import apache_log_parser
 try:
     import xlsxwriter
     xlsxwriter_present = True
@@ -17,14 +20,58 @@ except ImportError:
     xlsxwriter_present = False
 from tempfile import TemporaryFile
 from tempfile import NamedTemporaryFile
+from multiprocessing import cpu_count
 from .mail import send_mail
-from six import iteritems
-from six import itervalues
-from six.moves import input
+from .mail import COMPRESSORS
+from .mail import check_mail_options
 from .log_processing import detect_log_config
+from .log_processing import detect_log_configs
+from .log_processing import detect_syslog_log_format
+from .log_processing import binary_regex
+from .log_processing import build_apache_log_format_regex
 from .log_processing import build_log_format_regex
 from .log_processing import check_regex_required_fields
 from .log_processing import DEFAULT_APACHE_LOG_FORMAT
+from .timestamp import BUCKETS
+from .timestamp import TimeLocalParser
+from .timestamp import bucket_start
+from .timestamp import format_bucket
+from .aggregation import StatsStore
+from .columnar import BatchAggregator
+from .columnar import batches
+from .columnar import np
+from .histogram import PERCENTILES
+from .histogram import percentiles
+from .parallel import TaskError
+from .parallel import map_parallel
+from .parallel import read_range
+from .parallel import split_ranges
+from .bot_matcher import BotMatcher
+from .bot_matcher import BotPrefilter
+from .profiling import NULL_PROFILER
+from .profiling import Profiler
+from .reader import expand_log_paths
+from .reader import is_compressed
+from .reader import open_log
+from .reader import order_log_files
+from .reader import read_blocks
+from .state import complete_lines_end
+from .state import load_state
+from .state import plan_segments
+from .state import save_state
+from .bot_matcher import parse_bot_definitions
+from .follow import FlushSchedule
+from .follow import FollowControl
+from .follow import LogFollower
+from .metrics import MetricsServer
+from .metrics import parse_listen_address
+from .partial import merge_partials
+from .partial import write_partial
+from .history import load_history
+from .history import save_history
+from .syslog import SYSLOG_QUEUE_SIZE
+from .syslog import SyslogReceiver
+from .syslog import syslog_regex
 
 # Bots list in format:
 # "bot name in user agent": "pretty name for report"
@@ -50,12 +97,22 @@ def configure_logging(args):
     logging.basicConfig(level=log_level, format="%(levelname)s: %(message)s")
 
 
-def parse_argumets():
+def parse_argumets(argv=None, merge=False):
+    # merge is botstat merge command, which takes partials instead of logs
     arg_parser = configargparse.ArgParser(
         default_config_files=["/etc/botstat.conf", "~/.botstat"],
-        prog="botstat",
-        description="Parse web server logs and make bots statistic",
+        prog="botstat merge" if merge else "botstat",
+        description="Merge partial statistic of several nodes written by "
+                    "--partial-output and send one report" if merge else
+                    "Parse web server logs and make bots statistic",
     )
+    if merge:
+        arg_parser.add_argument(
+            "partials",
+            nargs="+",
+            metavar="PARTIAL",
+            help="Partial statistic files, compressed with gzip if name ends with .gz"
+        )
     arg_parser.add(
         "-c", "--my-config",
         required=False,
@@ -83,7 +140,9 @@ def parse_argumets():
     )
     arg_parser.add_argument(
         "--access-log",
-        help="Access log file name. If not specify used stdin."
+        nargs="+",
+        help="Access log file names or glob patterns, files compressed with "
+             "gzip, bzip2 or xz are supported. If not specify used stdin."
     )
     arg_parser.add_argument(
         "--day-start",
@@ -96,11 +155,16 @@ def parse_argumets():
     )
     arg_parser.add_argument(
         "--mail-to",
-        help="Email address to send report"
+        help="Email address to send report, comma separated list for several recipients"
     )
     arg_parser.add_argument(
         "--mail-from", help="'Email FROM' address"
     )
+    arg_parser.add_argument(
+        "--mail-compress",
+        choices=sorted(COMPRESSORS),
+        help="Compress report attachments with gzip or zip"
+    )
     arg_parser.add_argument(
         "--mail-subject",
         help="Report email subject",
@@ -122,6 +186,104 @@ def parse_argumets():
         type=int,
         help="SMTP server port"
     )
+    arg_parser.add_argument(
+        "--bucket",
+        choices=BUCKETS,
+        default="day",
+        help="Time period of statistic rows (default: %(default)s)"
+    )
+    arg_parser.add_argument(
+        "--bot",
+        action="append",
+        help="Additional bot in format 'user agent token=Bot name', "
+             "can be set several times or as a list in config file"
+    )
+    arg_parser.add_argument(
+        "--bot-prefilter",
+        action="store_true",
+        help="Skip log lines without bot names before parsing them, "
+             "speeds up logs with small share of bots traffic"
+    )
+    arg_parser.add_argument(
+        "--top-urls",
+        type=int,
+        metavar="K",
+        help="Report K most crawled URLs of every bot and host, "
+             "counted in memory bounded by K"
+    )
+    arg_parser.add_argument(
+        "--top-urls-depth",
+        type=int,
+        metavar="DEPTH",
+        help="Count URL path prefixes of DEPTH segments instead of URLs "
+             "for --top-urls, e.g. /catalog/shoes/ for 2"
+    )
+    arg_parser.add_argument(
+        "--engine",
+        choices=["python", "numpy"],
+        default="python",
+        help="Aggregate records one by one or in batches with numpy, "
+             "numpy engine requires numpy module (default: %(default)s)"
+    )
+    arg_parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes to parse access log file with (default: %(default)s)"
+    )
+    arg_parser.add_argument(
+        "--all-logs",
+        action="store_true",
+        help="Process all access logs from nginx config concurrently, "
+             "with --workers processes or one per CPU"
+    )
+    arg_parser.add_argument(
+        "--state-file",
+        help="File to keep processed log offset and statistic between runs, "
+             "next run parses only new records of access log file"
+    )
+    arg_parser.add_argument(
+        "--follow",
+        action="store_true",
+        help="Keep access log open and aggregate new records like tail -F, "
+             "send report every --flush-interval seconds and on SIGUSR1"
+    )
+    arg_parser.add_argument(
+        "--flush-interval",
+        type=int,
+        default=300,
+        metavar="SECONDS",
+        help="Report interval of --follow and --syslog-listen modes (default: %(default)s)"
+    )
+    arg_parser.add_argument(
+        "--metrics-listen",
+        type=parse_listen_address,
+        metavar="HOST:PORT",
+        help="Serve live statistic of --follow or --syslog-listen mode over HTTP "
+             "on HOST:PORT, /metrics in Prometheus format and /metrics.json"
+    )
+    arg_parser.add_argument(
+        "--syslog-listen",
+        type=parse_listen_address,
+        metavar="HOST:PORT",
+        help="Receive access log lines of nginx access_log syslog: targets on "
+             "HOST:PORT over UDP and TCP instead of reading log files, send "
+             "report every --flush-interval seconds and on SIGUSR1"
+    )
+    arg_parser.add_argument(
+        "--syslog-queue",
+        type=int,
+        default=SYSLOG_QUEUE_SIZE,
+        metavar="MESSAGES",
+        help="Received syslog messages waiting for processing, UDP messages "
+             "above it are dropped (default: %(default)s)"
+    )
+    arg_parser.add_argument(
+        "--profile-stats",
+        metavar="JSON_FILE",
+        help="Show reading progress and write time spent in every processing "
+             "stage, number of lines and bytes read and peak memory to JSON_FILE"
+    )
     arg_parser.add_argument(
         "--server-type",
         choices=["nginx", "apache"],
@@ -138,7 +300,40 @@ def parse_argumets():
         action="store_true",
         help="Report in excel format{}".format(deps_text)
     )
-    return arg_parser.parse_args()
+    arg_parser.add_argument(
+        "--partial-output",
+        metavar="FILE",
+        help="Write mergeable partial statistic to FILE instead of sending "
+             "report, gzip compressed if FILE ends with .gz. Partials of "
+             "several nodes are reported by 'botstat merge FILE...'"
+    )
+    arg_parser.add_argument(
+        "--history-db",
+        metavar="FILE",
+        help="SQLite file where statistic rows of every run are upserted, "
+             "a row of the same date, bot, host and status is replaced. "
+             "The first date of a run without --state-file, --date-start "
+             "or --day-start, if the logs start after its beginning, "
+             "replaces stored rows only with at least as many hits"
+    )
+    arg_parser.add_argument(
+        "--history-days",
+        type=int,
+        metavar="DAYS",
+        help="Report statistic of --history-db for DAYS days from the "
+             "beginning of today instead of processed logs only"
+    )
+    arg_parser.add_argument(
+        "--history-start",
+        metavar="DATE",
+        help="Like --history-days, report statistic of --history-db from DATE"
+    )
+    arg_parser.add_argument(
+        "--history-end",
+        metavar="DATE",
+        help="Last date of --history-days and --history-start report (default: today)"
+    )
+    return arg_parser.parse_args(argv)
 
 
 def generate_start_date(args):
@@ -148,74 +343,194 @@ def generate_start_date(args):
         return datetime.date.today() - datetime.timedelta(days=args.day_start)
 
 
-def make_stats(records, args):
-    date_start = generate_start_date(args)
-    logging.debug("Date start: %s", date_start)
-    # date -> bot -> vhost -> {2xx, 3xx, 4xx, 5xx} -> { count, bytes, time }
-    stats = defaultdict(              # date
-        lambda: defaultdict(          # bot name
-            lambda: defaultdict(      # vhost
-                lambda: defaultdict(  # http code
-                    Counter
-                )
-            )
-        )
-    )
-    system_hostname = socket.gethostname()
-    for record in records:
-        if args.date_format:
-            record_date = datetime.datetime.strptime(record["time_local"], args.date_format).date()
-        else:
-            record_date = parser.parse(record["time_local"], fuzzy=True).date()
-        if date_start is None or record_date >= date_start:
-            for bot, bot_name in iteritems(BOT_LIST):
-                if bot.lower() in record["http_user_agent"].lower():
-                    status = (int(int(record["status"])/100))*100
-                    hostname = record.get("host", system_hostname)
-                    status_record = stats[record_date][bot_name][hostname][status]
-                    status_record["count"] += 1
-                    if "body_bytes_sent" in record:
-                        bytes_sent = 0 if record["body_bytes_sent"] == "-" else int(record["body_bytes_sent"])
-                        status_record["bytes"] += bytes_sent
-                    if "request_time" in record:
-                        status_record["time"] += float(record["request_time"])
-                    break
-    return stats
+def bot_definitions(args):
+    bots = list(BOT_LIST.items())
+    bots.extend(parse_bot_definitions(args.bot))
+    return bots
+
+
+def build_bot_matcher(args):
+    return BotMatcher(bot_definitions(args))
 
 
+def make_line_filter(args):
+    if args.bot_prefilter:
+        return BotPrefilter(token for token, bot_name in bot_definitions(args)).filter
+
+
+def count_blocks(blocks, profiler):
+    # lines and bytes read, before the prefilter drops lines
+    last = b""
+    for block in blocks:
+        profiler.count("lines_read", block.count(b"\n"))
+        profiler.count("bytes_read", len(block))
+        profiler.advance(len(block))
+        last = block
+        yield block
+    if last and not last.endswith(b"\n"):
+        profiler.count("lines_read", 1)
+
+
+def prefilter_lines(blocks, line_filter, profiler=NULL_PROFILER):
+    blocks = count_blocks(profiler.iterate("read", blocks), profiler)
+    return profiler.iterate("prefilter", line_filter(blocks), "lines_prefiltered")
+
+
+def read_lines(stream, args, profiler=NULL_PROFILER):
+    line_filter = make_line_filter(args)
+    if line_filter is None:
+        return profiler.iterate("read", stream, "lines_read", "bytes_read")
+    return prefilter_lines(read_blocks(stream), line_filter, profiler)
+
+
+# Space-Saving counters per reported top URL, counts of the last reported
+# URLs are more exact with more counters
+TOP_URLS_CAPACITY = 4
+
+
+def request_url(request, depth=None):
+    # "GET /path?query HTTP/1.1" -> "/path?query", str or bytes, with
+    # depth the path prefix of depth segments without query
+    parts = request.split()
+    if len(parts) < 2:
+        return request
+    url = parts[1]
+    if depth is None:
+        return url
+    slash, question = ("/", "?") if isinstance(url, str) else (b"/", b"?")
+    segments = url.split(question, 1)[0].split(slash, depth + 1)
+    if len(segments) > depth + 1:
+        return slash.join(segments[:depth + 1]) + slash
+    return slash.join(segments)
+
+
+def new_stats():
+    # date or time bucket -> bot -> vhost -> {2xx, 3xx, 4xx, 5xx} -> { count, bytes, time }
+    return StatsStore()
+
+
+class StatsAggregator(object):
+    """Adds parsed records to statistic.
+
+    The date parser and the bot matcher with its cache are built once,
+    long running modes add every batch of records by the same aggregator.
+    default_host is set for records without host, system host name if None.
+    """
+
+    def __init__(self, args, profiler=NULL_PROFILER, default_host=None):
+        self.args = args
+        self.profiler = profiler
+        self.date_start = bucket_start(generate_start_date(args), args.bucket)
+        logging.debug("Date start: %s", self.date_start)
+        self.default_host = default_host or socket.gethostname()
+        self.parse_date = profiler.wrap("date", TimeLocalParser(args.date_format, args.bucket).parse_bucket)
+        self.match_bot = profiler.wrap("bot", build_bot_matcher(args).match)
+        self.url_capacity = (args.top_urls or 0) * TOP_URLS_CAPACITY
+
+    def add(self, stats, records):
+        args, profiler = self.args, self.profiler
+        date_start, system_hostname = self.date_start, self.default_host
+        parse_date, match_bot, url_capacity = self.parse_date, self.match_bot, self.url_capacity
+        add = profiler.wrap("aggregate", stats.add)
+        add_url = profiler.wrap("urls", stats.add_url) if args.top_urls else None
+        if args.engine == "numpy" and np is not None:
+            if add_url is not None:
+                def add_request(date, bot_name, host, request):
+                    add_url(date, bot_name, host, request_url(request, args.top_urls_depth), url_capacity)
+            else:
+                add_request = None
+            aggregator = BatchAggregator(stats, parse_date, match_bot, date_start, system_hostname, add_request,
+                                         by_prefix=not args.date_format)
+            add_batch = profiler.wrap("aggregate", aggregator.add)
+            profiler.count("bot_hits", sum(add_batch(batch) for batch in batches(records)))
+            return stats
+        hits = 0
+        for record in records:
+            record_date = parse_date(record["time_local"])
+            if date_start is None or record_date >= date_start:
+                bot_name = match_bot(record["http_user_agent"])
+                if bot_name is not None:
+                    hits += 1
+                    bytes_sent = record.get("body_bytes_sent")
+                    if bytes_sent is not None:
+                        bytes_sent = int(bytes_sent) if bytes_sent.isdigit() else 0
+                    request_time = record.get("request_time")
+                    if request_time is not None:
+                        request_time = float(request_time)
+                    host = record.get("host", system_hostname)
+                    if isinstance(host, bytes):
+                        host = host.decode("utf-8", "replace")
+                    add(record_date, bot_name, host, int(record["status"]), bytes_sent, request_time)
+                    if add_url is not None and record.get("request") is not None:
+                        add_url(record_date, bot_name, host,
+                                request_url(record["request"], args.top_urls_depth), url_capacity)
+        profiler.count("bot_hits", hits)
+        return stats
+
+
+def make_stats(records, args, profiler=NULL_PROFILER, default_host=None):
+    return StatsAggregator(args, profiler, default_host).add(new_stats(), records)
+
+
+# status classes with request time percentile columns in the report
+PERCENTILE_STATUS_CLASSES = (2, 3, 4, 5)
+
 REPORT_HEADER = [
     "Date", "Bot", "Host", "Hits 2xx", "Hits 3xx", "Hits 4xx",
      "Hits 5xx", "All Hits", "Avg Time, ms", "Avg Time 2xx, ms",
      "Total Time, sec", "Total Time 2xx, sec", "Total Time 5xx, sec",
-     "KBytes Total", "Avg KBytes", "Avg 2xx KBytes"
-]
+     "KBytes Total", "Avg KBytes", "Avg 2xx KBytes",
+] + ["P%d Time %dxx, ms" % (int(round(100 * quantile)), status_class)
+     for status_class in PERCENTILE_STATUS_CLASSES for quantile in PERCENTILES]
+
+
+def percentiles_ms(histogram):
+    return [int(round(1000 * seconds)) if seconds is not None else 0
+            for seconds in percentiles(histogram, PERCENTILES)]
+
 
 def stats_generator(stats):
+    # rows ordered by date, bot and host
     yield REPORT_HEADER
-    for date, bot_data in iteritems(stats):
-        for bot, host_data in iteritems(bot_data):
-            for host, data in iteritems(host_data):
-                yield [
-                    date.strftime("%Y/%m/%d"), bot, host,       # date, bot, vhost
-                    data[200]["count"],                         # hits_2xx
-                    data[300]["count"],                         # hits_3xx
-                    data[400]["count"],                         # hits_4xx
-                    data[500]["count"],                         # hits_5xx
-                    sum(x["count"] for x in itervalues(data)),  # hits_all
-                    int(1000 * sum(
-                                   x["time"] for x in itervalues(data)
-                               ) / (sum(x["count"] for x in itervalues(data)) or 1)),  # avg_time_all
-                    int(1000 * data[200]["time"] / (data[200]["count"] or 1)),  # avg_time_2xx
-                    sum(x["time"] for x in itervalues(data)),   # total_time_all
-                    data[200]["time"],                          # total_time_2xx
-                    data[500]["time"],                          # total_time_5xx
-                    round(sum(x["bytes"] for x in itervalues(data)) / 1024., 2),  # bytes_all
-                    round(sum(x["bytes"] for x in itervalues(data)) / (float(sum(x["count"] for x in itervalues(data))) or 1) / 1024., 2),  # avg_bytes_all
-                    round(data[200]["bytes"] / (float(data[200]["count"]) or 1) / 1024., 2)  # avg_bytes_2xx
-                ]
+    rows = stats.sorted_rows()
+    for row, (date, bot, host, counts, bytes_sent, times) in zip(rows, stats.iter_rows(rows)):
+        hits = sum(counts)
+        yield [
+            format_bucket(date), bot, host,                       # date, bot, vhost
+            counts[2],                                            # hits_2xx
+            counts[3],                                            # hits_3xx
+            counts[4],                                            # hits_4xx
+            counts[5],                                            # hits_5xx
+            hits,                                                 # hits_all
+            int(1000 * sum(times) / (hits or 1)),                 # avg_time_all
+            int(1000 * times[2] / (counts[2] or 1)),              # avg_time_2xx
+            sum(times),                                           # total_time_all
+            times[2],                                             # total_time_2xx
+            times[5],                                             # total_time_5xx
+            round(sum(bytes_sent) / 1024., 2),                    # bytes_all
+            round(sum(bytes_sent) / (float(hits) or 1) / 1024., 2),  # avg_bytes_all
+            round(bytes_sent[2] / (float(counts[2]) or 1) / 1024., 2)  # avg_bytes_2xx
+        ] + [ms for status_class in PERCENTILE_STATUS_CLASSES    # p50, p90, p99 time of status class
+             for ms in percentiles_ms(stats.latency(row, [status_class]))]
+
+
+TOP_URLS_HEADER = ["Bot", "Host", "Rank", "URL", "Hits", "Max Overcount"]
+
+
+def top_urls_generator(stats, count):
+    # hits are upper bounds, true number is at least hits - max overcount
+    yield TOP_URLS_HEADER
+    for bot, host, urls in stats.top_urls(count):
+        for rank, (url, hits, error) in enumerate(urls, 1):
+            if isinstance(url, bytes):
+                url = url.decode("utf-8", "replace")
+            yield [bot, host, rank, url, hits, error]
 
 
 def make_email_text(args):
+    report_range = history_range(args) if args.history_db else None
+    if report_range is not None:
+        return "Search bot statistics from %s to %s" % report_range
     start_date = generate_start_date(args)
     if start_date:
         return "Search bot statistics from %s to %s" % (start_date, datetime.date.today())
@@ -223,191 +538,336 @@ def make_email_text(args):
         return "Search bot statistics for all time"
 
 
-def make_csv_report(stats, args):
-    with TemporaryFile(mode="w+") as csv_stream:
-        writer = csv.writer(csv_stream)
-        writer.writerows(stats_generator(stats))
-        csv_stream.flush()
-        csv_stream.seek(0)
-        filename = "report.csv"
-        send_mail(make_email_text(args), csv_stream, filename, args)
-
-
-def make_xlsx_report(stats, args):
-    with NamedTemporaryFile(mode="w+") as xlsx_stream:
-        workbook = xlsxwriter.Workbook(xlsx_stream.name)
-        sheet = workbook.add_worksheet("Data")
-        bold = workbook.add_format({"bold": 1})
-        for row, row_data in enumerate(stats_generator(stats)):
-            sheet.write_row(row, 0, row_data)
-        sheet.autofilter(0, 0, row + 1, len(REPORT_HEADER))
-        sheet.set_row(0, cell_format=bold)
-        pages_chart = workbook.add_chart({"type": "line"})
-        pages_chart.add_series({
-            "name": "Pages",
-            "categories": "=Data!$A$2:$C${}".format(row + 1),
-            "values": "=Data!$D$2:$D${}".format(row + 1),
-            'line': {
-                'color': '#3669C9',
-                'width': 2,
-            },
-        })
-        pages_chart.set_title({"name": "Pages crawled per day"})
-        pages_chart.set_x_axis({"name": "Date/Bot/Host"})
-        pages_chart.set_y_axis({"name": "Pages"})
-        pages_chart.set_style(10)
-        pages_chart.set_size({"width": 1280, "height": 600})
-        graphics_sheet = workbook.add_worksheet("Charts")
-        graphics_sheet.insert_chart("A1", pages_chart, {"x_offset": 5, "y_offset": 5})
-
-        bytes_chart = workbook.add_chart({"type": "line"})
-        bytes_chart.add_series({
-            "name": "KBytes",
-            "categories": "=Data!$A$2:$C${}".format(row + 1),
-            "values": "=Data!$N$2:$N${}".format(row + 1),
-            'line': {
-                'color': '#DA3B21',
-                'width': 2,
-            },
-        })
-        bytes_chart.set_title({"name": "KBytes downloaded per day"})
-        bytes_chart.set_x_axis({"name": "Date/Bot/Host"})
-        bytes_chart.set_y_axis({"name": "KBytes"})
-        bytes_chart.set_style(10)
-        bytes_chart.set_size({"width": 1280, "height": 600})
-        graphics_sheet.insert_chart("A1", bytes_chart, {"x_offset": 5, "y_offset": 610})
-
-        avgresponse_chart = workbook.add_chart({"type": "line"})
-        avgresponse_chart.add_series({
-            "name": "msec",
-            "categories": "=Data!$A$2:$C${}".format(row + 1),
-            "values": "=Data!$J$2:$J${}".format(row + 1),
-            'line': {
-                'color': '#1C9524',
-                'width': 2,
-            },
-        })
-        avgresponse_chart.set_title({"name": "Avg Response Time, ms"})
-        avgresponse_chart.set_x_axis({"name": "Date/Bot/Host"})
-        avgresponse_chart.set_y_axis({"name": "msec"})
-        avgresponse_chart.set_style(10)
-        avgresponse_chart.set_size({"width": 1280, "height": 600})
-        graphics_sheet.insert_chart("A1", avgresponse_chart, {"x_offset": 5, "y_offset": 610 + 605})
-
-        time_chart = workbook.add_chart({"type": "line"})
-        time_chart.add_series({
-            "name": "Sec",
-            "categories": "=Data!$A$2:$C${}".format(row + 1),
-            "values": "=Data!$L$2:$L${}".format(row + 1),
-            'line': {
-                'color': 'purple',
-                'width': 2,
-            },
-        })
-        time_chart.set_title({"name": "Time spent downloading all pages"})
-        time_chart.set_x_axis({"name": "Date/Bot/Host"})
-        time_chart.set_y_axis({"name": "sec"})
-        time_chart.set_style(10)
-        time_chart.set_size({"width": 1280, "height": 600})
-        graphics_sheet.insert_chart("A1", time_chart, {"x_offset": 5, "y_offset": 610 + 605 + 605})
-        workbook.close()
-        xlsx_stream.flush()
+def write_csv_report(stats, stream):
+    writer = csv.writer(stream)
+    writer.writerows(stats_generator(stats))
+
+
+def write_top_urls_csv(stats, stream, count):
+    writer = csv.writer(stream)
+    writer.writerows(top_urls_generator(stats, count))
+
+
+def make_csv_report(stats, args, profiler=NULL_PROFILER):
+    with TemporaryFile(mode="w+") as csv_stream, TemporaryFile(mode="w+") as urls_stream:
+        attachments = [(csv_stream, "report.csv")]
+        with profiler.stage("report"):
+            write_csv_report(stats, csv_stream)
+            if args.top_urls:
+                write_top_urls_csv(stats, urls_stream, args.top_urls)
+                attachments.append((urls_stream, "top_urls.csv"))
+        for stream, filename in attachments:
+            stream.flush()
+            stream.seek(0)
+        with profiler.stage("mail"):
+            send_mail(make_email_text(args), attachments, args)
+
+
+# chart titles of time buckets
+BUCKET_TITLES = {"day": "day", "hour": "hour", "15m": "15 minutes", "5m": "5 minutes", "1m": "minute"}
+
+
+# (title, column, series name, color, y axis name) of report charts
+XLSX_CHARTS = [
+    ("Pages crawled per {bucket}", 3, "Pages", "#3669C9", "Pages"),
+    ("KBytes downloaded per {bucket}", 13, "KBytes", "#DA3B21", "KBytes"),
+    ("Avg Response Time, ms", 9, "msec", "#1C9524", "msec"),
+    ("Time spent downloading all pages", 11, "Sec", "purple", "sec"),
+]
+XLSX_CHART_HEIGHT = 605
+XLSX_RESERVED_SHEETS = ["Data", "Charts", "Top URLs"]
+
+
+def xlsx_sheet_name(name, used):
+    # Excel sheet names are up to 31 characters without []:*?/\ and
+    # unique regardless of case
+    name = re.sub(r"[\[\]:*?/\\]", "_", name).strip("'")[:31] or "_"
+    candidate = name
+    number = 1
+    while candidate.lower() in used:
+        number += 1
+        suffix = " (%d)" % number
+        candidate = name[:31 - len(suffix)] + suffix
+    used.add(candidate.lower())
+    return candidate
+
+
+def add_line_chart(workbook, sheet_name, last_row, chart, bucket, prefix=""):
+    # chart of rows 1..last_row of sheet_name, categories are date/bot/host
+    title, column, name, color, y_axis = chart
+    line_chart = workbook.add_chart({"type": "line"})
+    line_chart.add_series({
+        "name": name,
+        "categories": [sheet_name, 1, 0, last_row, 2],
+        "values": [sheet_name, 1, column, last_row, column],
+        'line': {
+            'color': color,
+            'width': 2,
+        },
+    })
+    line_chart.set_title({"name": prefix + title.format(bucket=BUCKET_TITLES[bucket])})
+    line_chart.set_x_axis({"name": "Date/Bot/Host"})
+    line_chart.set_y_axis({"name": y_axis})
+    line_chart.set_style(10)
+    line_chart.set_size({"width": 1280, "height": 600})
+    return line_chart
+
+
+def add_xlsx_sheet(workbook, name, header, bold):
+    sheet = workbook.add_worksheet(name)
+    sheet.set_row(0, None, bold)
+    sheet.write_row(0, 0, header)
+    return sheet
+
+
+def write_xlsx_report(stats, filename, top_urls=None, bucket="day"):
+    """Write report rows in one pass with constant memory.
+
+    A row is flushed to a temporary file once the next row of the sheet
+    starts, so every sheet is written top down: all rows go to the Data
+    sheet and to the sheet of their bot, charts refer to the row ranges.
+    """
+    workbook = xlsxwriter.Workbook(filename, {"constant_memory": True})
+    bold = workbook.add_format({"bold": 1})
+    rows = stats_generator(stats)
+    header = next(rows)
+    sheet = add_xlsx_sheet(workbook, "Data", header, bold)
+    graphics_sheet = workbook.add_worksheet("Charts")
+    used_names = set(name.lower() for name in XLSX_RESERVED_SHEETS)
+    # bot -> [sheet, last row]
+    bot_sheets = {}
+    row = 0
+    for row, row_data in enumerate(rows, 1):
+        sheet.write_row(row, 0, row_data)
+        bot_sheet = bot_sheets.get(row_data[1])
+        if bot_sheet is None:
+            bot_sheet = bot_sheets[row_data[1]] = [
+                add_xlsx_sheet(workbook, xlsx_sheet_name(row_data[1], used_names), header, bold), 0]
+        bot_sheet[1] += 1
+        bot_sheet[0].write_row(bot_sheet[1], 0, row_data)
+    sheet.autofilter(0, 0, row, len(header) - 1)
+    for i, chart in enumerate(XLSX_CHARTS):
+        graphics_sheet.insert_chart("A1", add_line_chart(workbook, "Data", row, chart, bucket),
+                                    {"x_offset": 5, "y_offset": 5 + i * XLSX_CHART_HEIGHT})
+    for bot, (bot_sheet, last_row) in bot_sheets.items():
+        bot_sheet.autofilter(0, 0, last_row, len(header) - 1)
+        for i, chart in enumerate(XLSX_CHARTS):
+            bot_sheet.insert_chart(1, len(header) + 1,
+                                   add_line_chart(workbook, bot_sheet.name, last_row, chart, bucket, bot + ": "),
+                                   {"x_offset": 5, "y_offset": 5 + i * XLSX_CHART_HEIGHT})
+
+    if top_urls:
+        urls = top_urls_generator(stats, top_urls)
+        urls_sheet = add_xlsx_sheet(workbook, "Top URLs", next(urls), bold)
+        urls_sheet.set_column(3, 3, 80)
+        row = 0
+        for row, row_data in enumerate(urls, 1):
+            urls_sheet.write_row(row, 0, row_data)
+        urls_sheet.autofilter(0, 0, row, len(TOP_URLS_HEADER) - 1)
+    workbook.close()
+
+
+def make_xlsx_report(stats, args, profiler=NULL_PROFILER):
+    with NamedTemporaryFile(mode="w+b") as xlsx_stream:
+        with profiler.stage("report"):
+            write_xlsx_report(stats, xlsx_stream.name, args.top_urls, args.bucket)
+            xlsx_stream.flush()
         xlsx_stream.seek(0)
-        send_mail(make_email_text(args), xlsx_stream, "report.xlsx", args)
+        with profiler.stage("mail"):
+            send_mail(make_email_text(args), [(xlsx_stream, "report.xlsx")], args)
+
 
+def map_stream(stream):
+    # Whole stream content as a buffer with bytes or text positions
+    # matching stream.seek() offsets
+    try:
+        fileno = stream.fileno()
+    except (AttributeError, io.UnsupportedOperation):
+        fileno = None
+    if fileno is not None:
+        if os.fstat(fileno).st_size == 0:
+            return b""
+        return mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    if hasattr(stream, "getvalue"):
+        return stream.getvalue()
+    stream.seek(0)
+    return stream.read()
 
-def get_nearest_line(stream, start):
-    position = stream.tell()
-    while position >= start:
-        stream.seek(position)
-        if position == 0 or stream.read(1) == "\n":
-            return stream.readline()
-        position -= 1
+
+def find_date_offset(buf, start, date_start, parse_date):
+    """Binary search for the first line dated date_start or later.
+
+    Returns the line offset (or buffer size if there is no such line)
+    and the number of probes made.
+    """
+    newline = b"\n" if isinstance(buf, (bytes, mmap.mmap)) else "\n"
+    size = len(buf)
+    low, high = start, size
+    probes = 0
+    while low < high:
+        middle = (low + high) // 2
+        line_start = buf.rfind(newline, low, middle) + 1 or low
+        # lines without date (broken or not matched by format) are
+        # skipped until the nearest line with date
+        date = None
+        line_end = line_start
+        while date is None and line_end < high:
+            next_line = buf.find(newline, line_end)
+            next_line = size if next_line == -1 else next_line + 1
+            probes += 1
+            date = parse_date(buf[line_end:next_line])
+            line_end = next_line
+        if date is None or date >= date_start:
+            high = line_start
+        else:
+            low = line_end
+    return low, probes
 
 
 def seek_to_date(stream, date_start, regex_parser):
+    time_parser = TimeLocalParser()
+    encoding = getattr(stream, "encoding", None) or "utf-8"
+    binary_parser = isinstance(regex_parser.pattern, bytes)
 
     def parse_date(line):
+        if not binary_parser and isinstance(line, bytes):
+            line = line.decode(encoding, "replace")
         matches = regex_parser.match(line)
         if matches:
             record = matches.groupdict()
-            return parser.parse(record["time_local"], fuzzy=True).date()
+            return time_parser.parse_date(record["time_local"])
 
     start = stream.tell()
-    stream.seek(0, 2) # seek to the end and return position
-    stop = stream.tell() - 1
-    while start < stop:
-        middle = (start + stop)//2
-        stream.seek(middle)
-        line = get_nearest_line(stream, start)
-        if not line:
-            break
-        date = parse_date(line)
-        if date >= date_start:
-            stop = middle
-        else:
-            start = middle
-    if start == stop:
-        stream.seek(start)
-        while start > 0:
-            if stream.read(1) == "\n":
-                break
-            start -= 1
-            stream.seek(start)
-    else:
-        while stream.read(1) not in ("\n", ""):
-            pass
+    buf = map_stream(stream)
+    try:
+        offset, probes = find_date_offset(buf, start, date_start, parse_date)
+    finally:
+        if isinstance(buf, mmap.mmap):
+            buf.close()
+    logging.info("Date %s found at offset %d in %d probes", date_start, offset, probes)
+    stream.seek(offset)
+    return probes
+
+
+def select_access_logs(access_logs, args):
+    if access_logs == ["stdin"]:
+        return access_logs
+    access_logs = expand_log_paths(access_logs)
+    for access_log in access_logs:
+        if not os.path.exists(access_log):
+            raise SystemExit("Access log file \"%s\" does not exist" % access_log)
+    return order_log_files(access_logs, generate_start_date(args))
 
 
-def process_nginx(access_log, args):
-    if access_log is None:
+def nginx_log_config(access_logs, args):
+    if not access_logs:
         access_log, log_format = detect_log_config(args)
+        access_logs = [access_log]
     else:
         log_format = None
 
     if args.log_format:
         log_format = args.log_format
 
-    logging.info("access_log: %s", access_log)
+    logging.info("access_log: %s", ", ".join(access_logs))
     logging.info("log_format: %s", log_format)
-    if access_log != "stdin" and not os.path.exists(access_log):
-        raise SystemExit("Access log file \"%s\" does not exist" % access_log)
+    access_logs = select_access_logs(access_logs, args)
     if log_format is None:
         raise SystemExit("Nginx log_format is not set and can't be detected automatically")
+    return access_logs, log_format
+
+
+def build_nginx_parser(log_format):
     regex_parser = build_log_format_regex(log_format)
     check_regex_required_fields(
         regex_parser,
         ("status", "http_user_agent", "time_local",)
     )
-    if access_log == "stdin":
-        stream = sys.stdin
-    else:
-        stream = open(access_log)
-        date_start = generate_start_date(args)
-        if date_start is not None:
-            seek_to_date(stream, date_start, regex_parser)
-    matches = (regex_parser.match(l) for l in stream)
-    return (m.groupdict() for m in matches if m is not None)
-
-
-def convert_field_names(record):
-    translations = (("request_header_user_agent", "http_user_agent"),
-                    ("response_bytes", "body_bytes_sent"),
-                    ("time_us", "request_time"),
-                    ("time_received", "time_local"),
-                    ("server_name", "host"))
-    if "response_bytes" not in record and "response_bytes_clf" in record:
-        record["response_bytes"] = record["response_bytes_clf"]
-    for apache, nginx in translations:
-        if apache in record:
-            record[nginx] = record[apache]
-            del record[apache]
-    if "request_time" in record:
-        record["request_time"] = record["request_time"]/10000000.0  # convert time from microseconds to float like nginx
-    return record
-
-
-def process_apache(access_log, args):
+    return regex_parser
+
+
+def build_apache_parser(log_format):
+    regex_parser = build_apache_log_format_regex(log_format)
+    check_regex_required_fields(
+        regex_parser,
+        ("status", "http_user_agent", "time_local",)
+    )
+    return regex_parser
+
+
+def build_log_parser(server_type, log_format):
+    if server_type == "apache":
+        return build_apache_parser(log_format)
+    return build_nginx_parser(log_format)
+
+
+# Apache request time fields and their dividers to seconds
+APACHE_TIME_DIVIDERS = (("request_time_us", 1000000.0), ("request_time_ms", 1000.0))
+
+
+def make_record_converter(regex_parser):
+    # Convert Apache %D or %{ms}T to seconds like nginx $request_time,
+    # None if records need no conversion
+    for name, divider in APACHE_TIME_DIVIDERS:
+        if name in regex_parser.groupindex:
+            def convert(record):
+                record["request_time"] = int(record.pop(name)) / divider
+                return record
+            return convert
+
+
+def matched_records(matches):
+    unmatched = 0
+    for matched in matches:
+        if matched is None:
+            unmatched += 1
+        else:
+            yield matched.groupdict()
+    if unmatched:
+        logging.warning("%d lines do not match the log format", unmatched)
+
+
+def parse_records(lines, regex_parser, profiler=NULL_PROFILER):
+    match = profiler.wrap("parse", regex_parser.match)
+    records = matched_records(map(match, lines))
+    convert = make_record_converter(regex_parser)
+    if convert is not None:
+        records = map(convert, records)
+    return profiler.iterate(None, records, "lines_matched")
+
+
+def logs_size(access_logs):
+    # total size for reading progress, unknown for stdin and compressed logs
+    if any(access_log == "stdin" or is_compressed(access_log) for access_log in access_logs):
+        return None
+    return sum(os.path.getsize(access_log) for access_log in access_logs)
+
+
+def read_log_files(access_logs, args, regex_parser=None, profiler=NULL_PROFILER):
+    # undecoded lines
+    date_start = generate_start_date(args)
+    for access_log in access_logs:
+        if access_log == "stdin":
+            stream = getattr(sys.stdin, "buffer", sys.stdin)
+        else:
+            stream = open_log(access_log, binary=True)
+            if date_start is not None and regex_parser is not None and not is_compressed(access_log):
+                seek_to_date(stream, date_start, regex_parser)
+        for line in read_lines(stream, args, profiler):
+            yield line
+        if access_log != "stdin":
+            stream.close()
+
+
+def process_nginx(access_logs, args, profiler=NULL_PROFILER):
+    access_logs, log_format = nginx_log_config(access_logs, args)
+    profiler.expect(logs_size(access_logs))
+    regex_parser = binary_regex(build_nginx_parser(log_format))
+    lines = read_log_files(access_logs, args, regex_parser, profiler)
+    return parse_records(lines, regex_parser, profiler)
+
+
+def apache_log_config(access_logs, args):
     log_format = args.log_format
     if log_format is None:
         response = None
@@ -420,40 +880,518 @@ def process_apache(access_log, args):
             log_format = DEFAULT_APACHE_LOG_FORMAT
         else:
             raise SystemExit("Apache log_format is not set and can't be detected automatically.")
-    if access_log is None:
+    if not access_logs:
         raise SystemExit("Access log file is not set for apache and cannot be detected.")
-    line_parser = apache_log_parser.make_parser(log_format)
-    if access_log == "stdin":
-        stream = sys.stdin
+    return select_access_logs(access_logs, args), log_format
+
+
+def process_apache(access_logs, args, profiler=NULL_PROFILER):
+    access_logs, log_format = apache_log_config(access_logs, args)
+    profiler.expect(logs_size(access_logs))
+    regex_parser = binary_regex(build_apache_parser(log_format))
+    lines = read_log_files(access_logs, args, regex_parser, profiler)
+    return parse_records(lines, regex_parser, profiler)
+
+
+def range_stats(task):
+    access_log, begin, end, log_format, args = task
+    profiler = Profiler() if args.profile_stats else NULL_PROFILER
+    regex_parser = binary_regex(build_log_parser(args.server_type, log_format))
+    line_filter = make_line_filter(args)
+    if line_filter is None:
+        lines = profiler.iterate("read", read_range(access_log, begin, end), "lines_read", "bytes_read")
+    else:
+        lines = read_range(access_log, begin, end, lambda blocks: prefilter_lines(blocks, line_filter, profiler))
+    # logs of virtual hosts often have no $host, log name tells them apart
+    default_host = os.path.basename(access_log) if args.all_logs else None
+    stats = make_stats(parse_records(lines, regex_parser, profiler), args, profiler, default_host)
+    return stats, (profiler if args.profile_stats else None)
+
+
+def make_range_stats(task):
+    # returns statistic and profiler of the worker if --profile-stats is set
+    try:
+        return range_stats(task)
+    except SystemExit as error:
+        raise TaskError(str(error))
+
+
+def log_config(access_logs, args):
+    if args.server_type == "apache":
+        return apache_log_config(access_logs, args)
+    return nginx_log_config(access_logs, args)
+
+
+def find_start_offset(access_log, log_format, args):
+    date_start = generate_start_date(args)
+    if date_start is None:
+        return 0
+    with open(access_log, "rb") as stream:
+        seek_to_date(stream, date_start, binary_regex(build_log_parser(args.server_type, log_format)))
+        return stream.tell()
+
+
+def file_tasks(access_log, begin, end, log_format, args):
+    return [(access_log, range_begin, range_end, log_format, args)
+            for range_begin, range_end in split_ranges(access_log, args.workers, begin, end)]
+
+
+def log_tasks(access_logs, log_format, args):
+    # compressed logs can't be split and are processed whole by one worker
+    tasks = []
+    for access_log in access_logs:
+        if is_compressed(access_log):
+            tasks.append((access_log, 0, None, log_format, args))
+        else:
+            start = find_start_offset(access_log, log_format, args)
+            tasks.extend(file_tasks(access_log, start, None, log_format, args))
+    return tasks
+
+
+def check_tasks(tasks, args):
+    # a wrong log format or --bot fails in the parent, not in every worker
+    for log_format in set(task[3] for task in tasks):
+        build_log_parser(args.server_type, log_format)
+    build_bot_matcher(args)
+
+
+def run_tasks(stats, tasks, args, profiler=NULL_PROFILER, workers=None):
+    workers = workers or args.workers
+    check_tasks(tasks, args)
+    if workers > 1 and len(tasks) > 1:
+        logging.info("Processing %d parts of logs with %d workers", len(tasks), workers)
+        partials = map_parallel(make_range_stats, tasks, workers)
+    else:
+        partials = (make_range_stats(task) for task in tasks)
+    try:
+        for partial, task_profiler in partials:
+            stats.merge(partial)
+            if task_profiler is not None:
+                profiler.merge(task_profiler)
+    except TaskError as error:
+        raise SystemExit(str(error))
+    return stats
+
+
+def make_parallel_stats(access_logs, args, profiler=NULL_PROFILER):
+    access_logs, log_format = log_config(access_logs, args)
+    profiler.expect(logs_size(access_logs))
+    return run_tasks(new_stats(), log_tasks(access_logs, log_format, args), args, profiler)
+
+
+def task_size(task):
+    access_log, begin, end = task[:3]
+    return os.path.getsize(access_log) - begin if end is None else end - begin
+
+
+def make_all_logs_stats(args, profiler=NULL_PROFILER):
+    """Statistic of all access logs from nginx config, each with its log_format."""
+    if args.server_type != "nginx":
+        raise SystemExit("All access logs can be detected in nginx config only")
+    date_start = generate_start_date(args)
+    tasks = []
+    for access_log, log_format in detect_log_configs(args):
+        if "$" in access_log:
+            logging.warning("Skip access log %s, variables in file name are not supported", access_log)
+            continue
+        if not os.path.exists(access_log):
+            logging.warning("Skip access log %s, file does not exist", access_log)
+            continue
+        logging.info("access_log: %s, log_format: %s", access_log, log_format)
+        tasks.extend(log_tasks(order_log_files([access_log], date_start), log_format, args))
+    if not tasks:
+        raise SystemExit("No access log files from nginx config found")
+    # the largest first, so a big log does not finish last alone
+    tasks.sort(key=task_size, reverse=True)
+    profiler.expect(logs_size(sorted(set(task[0] for task in tasks))))
+    workers = args.workers if args.workers > 1 else cpu_count()
+    return run_tasks(new_stats(), tasks, args, profiler, workers)
+
+
+def prune_stats(stats, date_start):
+    if date_start is None:
+        return stats
+    return stats.select(lambda key: key[0] >= date_start)
+
+
+def incremental_stats(access_log, log_format, args, profiler=NULL_PROFILER):
+    # statistic updated with new records of access_log and its saved state
+    log_path = os.path.abspath(access_log)
+    stats = new_stats()
+    state = load_state(args.state_file)
+    if state is not None and state["log"]["path"] != log_path:
+        logging.warning("State file %s was saved for %s, ignored", args.state_file, state["log"]["path"])
+        state = None
+    if state is not None and state["log"].get("bucket", "day") != args.bucket:
+        logging.warning("State file %s was saved with %s buckets, ignored", args.state_file,
+                        state["log"].get("bucket", "day"))
+        state = None
+    if state is None:
+        start = find_start_offset(access_log, log_format, args)
+        segments = [(access_log, start, complete_lines_end(access_log, start, os.path.getsize(access_log)))]
+    else:
+        stats.merge(state["stats"])
+        segments = plan_segments(access_log, state["log"])
+    tasks = []
+    for path, begin, end in segments:
+        logging.info("Processing %s from offset %d to %d", path, begin, end)
+        tasks.extend(file_tasks(path, begin, end, log_format, args))
+    profiler.expect(sum(end - begin for path, begin, end in segments))
+    run_tasks(stats, tasks, args, profiler)
+    stats = prune_stats(stats, bucket_start(generate_start_date(args), args.bucket))
+    log_stat = os.stat(access_log)
+    log_state = {"path": log_path,
+                 "inode": log_stat.st_ino,
+                 "size": log_stat.st_size,
+                 "offset": segments[-1][2],
+                 "bucket": args.bucket}
+    save_state(args.state_file, log_state, stats)
+    return stats, log_state
+
+
+def single_log_config(access_logs, args, option):
+    access_logs, log_format = log_config(access_logs, args)
+    if len(access_logs) != 1 or access_logs == ["stdin"] or is_compressed(access_logs[0]):
+        raise SystemExit("%s can be used with one not compressed access log file only" % option)
+    return access_logs[0], log_format
+
+
+def make_incremental_stats(access_logs, args, profiler=NULL_PROFILER):
+    access_log, log_format = single_log_config(access_logs, args, "State file")
+    return incremental_stats(access_log, log_format, args, profiler)[0]
+
+
+def history_range(args):
+    # first and last dates of the report from history, None if not set
+    if args.history_start:
+        start = parser.parse(args.history_start).date()
+    elif args.history_days is not None:
+        start = datetime.date.today() - datetime.timedelta(days=args.history_days)
+    else:
+        return None
+    return start, parser.parse(args.history_end).date() if args.history_end else datetime.date.today()
+
+
+# lines read for the time of the first record of a log
+LOGS_START_LINES = 100
+
+
+def logs_start_time(access_logs, args):
+    """Minute of the first record of the oldest log, None if unknown."""
+    access_logs, log_format = log_config(access_logs, args)
+    if not access_logs or access_logs[0] == "stdin":
+        return None
+    regex_parser = binary_regex(build_log_parser(args.server_type, log_format))
+    parse_minute = TimeLocalParser(args.date_format, "1m").parse_bucket
+    with open_log(access_logs[0], binary=True) as stream:
+        for line in itertools.islice(stream, LOGS_START_LINES):
+            matches = regex_parser.match(line)
+            if matches:
+                return parse_minute(matches.group("time_local"))
+    return None
+
+
+def history_partial_dates(stats, args, run_start=None):
+    # the first bucket of a run misses records rotated away before the run,
+    # unless the state, --date-start or --day-start, or the first record of
+    # the logs (within its first minute) covers the start of the bucket
+    if args.state_file or generate_start_date(args) is not None or not len(stats):
+        return []
+    first = min(stats)
+    start = first if isinstance(first, datetime.datetime) else datetime.datetime.combine(first, datetime.time())
+    if run_start is not None and run_start <= start:
+        return []
+    return [first]
+
+
+def make_report(stats, args, profiler=NULL_PROFILER, run_start=None):
+    if args.history_db:
+        with profiler.stage("history"):
+            partial_dates = history_partial_dates(stats, args, run_start)
+            rows = save_history(args.history_db, stats, args.bucket, partial_dates)
+            logging.info("History %s updated with %d rows", args.history_db, rows)
+            report_range = history_range(args)
+            if report_range is not None:
+                stats = load_history(args.history_db, args.bucket, *report_range)
+    if args.partial_output:
+        with profiler.stage("report"):
+            write_partial(args.partial_output, stats, args.bucket)
+        logging.info("Partial statistic is written to %s", args.partial_output)
+    elif args.xlsx_report:
+        make_xlsx_report(stats, args, profiler)
     else:
-        stream = open(access_log)
-    return (convert_field_names(line_parser(line)) for line in stream)
+        make_csv_report(stats, args, profiler)
+
+
+# seconds between checks of the followed log for new lines
+FOLLOW_POLL_INTERVAL = 1.0
+
+
+def save_follow_state(stats, follower, args):
+    log_state = {"path": os.path.abspath(follower.path),
+                 "inode": follower.inode,
+                 "size": follower.offset,
+                 "offset": follower.offset,
+                 "bucket": args.bucket}
+    save_state(args.state_file, log_state, stats)
+
+
+def flush_follow_stats(stats, follower, args):
+    """Report statistic of the period and save state of followed log."""
+    stats = prune_stats(stats, bucket_start(generate_start_date(args), args.bucket))
+    if args.state_file:
+        save_follow_state(stats, follower, args)
+    try:
+        make_report(stats, args)
+    except SystemExit as error:
+        # a mail server failure should not stop following
+        logging.error("Report was not sent: %s", error)
+    return stats
+
+
+def follow_log(follower, stats, args, regex_parser, control, flush=flush_follow_stats, publish=None):
+    """Aggregate new lines of the log until control is stopped.
 
+    Every block of lines is parsed and added to stats once by the same
+    aggregator, so old records are never read again, flush is called every --flush-interval
+    seconds and on control.request_flush(). publish, if set, gets copies
+    of changed stats.
+    """
+    line_filter = make_line_filter(args)
+    aggregator = StatsAggregator(args)
+    schedule = FlushSchedule(control, args.flush_interval, lambda stats: flush(stats, follower, args), publish)
+    while True:
+        block = follower.read()
+        if block:
+            # lines end with "\n" only, as lines of a log file
+            lines = line_filter([block]) if line_filter is not None else io.BytesIO(block)
+            aggregator.add(stats, parse_records(lines, regex_parser))
+        if control.stopped:
+            return stats
+        stats = schedule.update(stats, bool(block))
+        if not block:
+            control.wait(min(FOLLOW_POLL_INTERVAL, schedule.timeout()))
 
-def main():
-    args = parse_argumets()
+
+def follow_stats(access_logs, args, profiler=NULL_PROFILER):
+    """Process the log and follow it until SIGINT or SIGTERM."""
+    access_log, log_format = single_log_config(access_logs, args, "--follow")
+    if args.state_file:
+        stats, log_state = incremental_stats(access_log, log_format, args, profiler)
+        offset = log_state["offset"]
+    else:
+        start = find_start_offset(access_log, log_format, args)
+        offset = complete_lines_end(access_log, start, os.path.getsize(access_log))
+        profiler.expect(offset - start)
+        stats = run_tasks(new_stats(), file_tasks(access_log, start, offset, log_format, args), args, profiler)
+    control = FollowControl()
+    handlers = {signal.SIGUSR1: control.request_flush, signal.SIGTERM: control.stop, signal.SIGINT: control.stop}
+    previous = dict((signum, signal.signal(signum, handler)) for signum, handler in handlers.items())
+    metrics = None
+    if args.metrics_listen:
+        metrics = MetricsServer(*args.metrics_listen)
+        metrics.start()
+    logging.info("Following %s from offset %d", access_log, offset)
+    follower = LogFollower(access_log, offset)
+    try:
+        stats = follow_log(follower, stats, args, binary_regex(build_log_parser(args.server_type, log_format)),
+                           control, publish=metrics.publish if metrics is not None else None)
+        if args.state_file:
+            save_follow_state(stats, follower, args)
+    finally:
+        follower.close()
+        if metrics is not None:
+            metrics.stop()
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+    return stats
+
+
+def syslog_records(messages, regex_parser, receiver, line_filter=None):
+    # records of received messages, regex_parser is made by syslog_regex,
+    # lines without $host get host name of the syslog header
+    if line_filter is not None:
+        messages = line_filter([b"\n".join(message.rstrip(b"\n") for message in messages) + b"\n"])
+    match = regex_parser.match
+    convert = make_record_converter(regex_parser)
+    has_host = "host" in regex_parser.groupindex
+    for message in messages:
+        matched = match(message)
+        if matched is None:
+            receiver.malformed += 1
+            continue
+        record = matched.groupdict()
+        hostname = record.pop("syslog_host", None)
+        hostname_5424 = record.pop("syslog_host_5424", None)
+        hostname = hostname or hostname_5424
+        if not has_host and hostname is not None and hostname != b"-":
+            record["host"] = hostname
+        yield convert(record) if convert is not None else record
+
+
+# seconds between batches of received syslog messages
+SYSLOG_BATCH_INTERVAL = 0.05
+# messages aggregated between reads of the sockets
+SYSLOG_CHUNK_SIZE = 1000
+
+
+def flush_syslog_stats(stats, receiver, args):
+    logging.info("Syslog messages received: %(syslog_messages_received)d, "
+                 "dropped: %(syslog_messages_dropped)d, malformed: %(syslog_messages_malformed)d",
+                 receiver.counters())
+    stats = prune_stats(stats, bucket_start(generate_start_date(args), args.bucket))
+    try:
+        make_report(stats, args)
+    except SystemExit as error:
+        logging.error("Report was not sent: %s", error)
+    return stats
+
+
+async def receive_syslog(receiver, stats, args, regex_parser, control, flush=flush_syslog_stats, publish=None):
+    """Aggregate received log lines by batches until control is stopped."""
+    line_filter = make_line_filter(args)
+    aggregator = StatsAggregator(args)
+    schedule = FlushSchedule(control, args.flush_interval, lambda stats: flush(stats, receiver, args),
+                             publish and (lambda stats: publish(stats, receiver.counters())))
+    await receiver.start()
+    try:
+        while True:
+            await asyncio.sleep(SYSLOG_BATCH_INTERVAL)
+            messages = receiver.queue.take()
+            for start in range(0, len(messages), SYSLOG_CHUNK_SIZE):
+                aggregator.add(stats, syslog_records(
+                    messages[start:start + SYSLOG_CHUNK_SIZE], regex_parser, receiver, line_filter))
+                # datagrams arrived meanwhile are read before the kernel buffer is full
+                await asyncio.sleep(0)
+            if control.stopped:
+                return stats
+            stats = schedule.update(stats, bool(messages))
+    finally:
+        receiver.close()
+
+
+def syslog_stats(args, profiler=NULL_PROFILER):
+    """Receive access log lines over syslog until SIGINT or SIGTERM."""
+    log_format = args.log_format
+    if log_format is None:
+        if args.server_type != "nginx":
+            raise SystemExit("Log format of syslog messages is not set")
+        log_format = detect_syslog_log_format(args)
+    logging.info("log_format: %s", log_format)
+    regex_parser = syslog_regex(binary_regex(build_log_parser(args.server_type, log_format)))
+    host, port = args.syslog_listen
+    receiver = SyslogReceiver(host, port, args.syslog_queue)
+    control = FollowControl()
+    metrics = None
+    if args.metrics_listen:
+        metrics = MetricsServer(*args.metrics_listen)
+        metrics.start()
+    loop = asyncio.new_event_loop()
+    for signum, handler in ((signal.SIGUSR1, control.request_flush),
+                            (signal.SIGTERM, control.stop), (signal.SIGINT, control.stop)):
+        loop.add_signal_handler(signum, handler)
+    try:
+        return loop.run_until_complete(receive_syslog(
+            receiver, new_stats(), args, regex_parser, control,
+            publish=metrics.publish if metrics is not None else None))
+    finally:
+        for signum in (signal.SIGUSR1, signal.SIGTERM, signal.SIGINT):
+            loop.remove_signal_handler(signum)
+        loop.close()
+        if metrics is not None:
+            metrics.stop()
+
+
+def merge_stats(args, profiler=NULL_PROFILER):
+    """Statistic of all partials, its bucket is set to args.bucket."""
+    paths = expand_log_paths(args.partials)
+    for path in paths:
+        if not os.path.exists(path):
+            raise SystemExit("Partial file \"%s\" does not exist" % path)
+    logging.info("Merging %d partials", len(paths))
+    with profiler.stage("merge"):
+        stats, bucket = merge_partials(paths)
+    if bucket is not None:
+        args.bucket = bucket
+    return prune_stats(stats, bucket_start(generate_start_date(args), args.bucket))
+
+
+def merge_main(argv):
+    args = parse_argumets(argv, merge=True)
     configure_logging(args)
     logging.debug("Arguments: %s", vars(args))
-    access_log = args.access_log
-    if access_log is None and not sys.stdin.isatty():
-        access_log = "stdin"
-    if args.server_type == "nginx":
-        records = process_nginx(access_log, args)
-    elif args.server_type == "apache":
-        records = process_apache(access_log, args)
-    else:
+    if not args.partial_output:
+        check_mail_options(args)
+    profiler = NULL_PROFILER
+    if args.profile_stats:
+        profiler = Profiler()
+        atexit.register(profiler.write, args.profile_stats)
+    stats = merge_stats(args, profiler)
+    make_report(stats, args, profiler)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["merge"]:
+        merge_main(argv[1:])
+        return
+    args = parse_argumets(argv)
+    configure_logging(args)
+    logging.debug("Arguments: %s", vars(args))
+    access_logs = args.access_log or []
+    if not access_logs and not sys.stdin.isatty():
+        access_logs = ["stdin"]
+    if args.server_type not in ("nginx", "apache"):
         raise SystemExit("Unknown server type %s" % (args.server_type,))
-    logging.info("Log processing started. May take a while")
+    if not args.partial_output:
+        # fail before processing, not at the first report of long running modes
+        check_mail_options(args)
     if args.xlsx_report:
         if not xlsxwriter_present:
             logging.error("xlsxwriter python module is not installed,"
                           "run 'pip install xlsxwriter' to install.")
-    stats = make_stats(records, args)
+    if args.engine == "numpy" and np is None:
+        logging.error("numpy python module is not installed, python engine is used, "
+                      "run 'pip install numpy' to install.")
+    profiler = NULL_PROFILER
+    if args.profile_stats:
+        profiler = Profiler(progress=True)
+        atexit.register(profiler.write, args.profile_stats)
+    if args.all_logs and args.state_file:
+        raise SystemExit("State file can't be used with --all-logs")
+    if (args.history_days is not None or args.history_start or args.history_end) and not args.history_db:
+        raise SystemExit("--history-days, --history-start and --history-end can be used with --history-db only")
+    if args.metrics_listen and not (args.follow or args.syslog_listen):
+        raise SystemExit("--metrics-listen can be used with --follow or --syslog-listen only")
+    if args.syslog_listen:
+        if args.follow or args.all_logs or args.state_file or args.access_log:
+            raise SystemExit("--syslog-listen can't be used with log files, --follow or --state-file")
+        syslog_stats(args, profiler)
+        return
+    if args.follow:
+        if args.all_logs:
+            raise SystemExit("--follow can't be used with --all-logs")
+        follow_stats(access_logs, args, profiler)
+        return
+    with profiler.stage("stats"):
+        if args.all_logs:
+            stats = make_all_logs_stats(args, profiler)
+        elif args.state_file and access_logs != ["stdin"]:
+            stats = make_incremental_stats(access_logs, args, profiler)
+        elif args.workers > 1 and access_logs != ["stdin"]:
+            stats = make_parallel_stats(access_logs, args, profiler)
+        else:
+            if args.server_type == "nginx":
+                records = process_nginx(access_logs, args, profiler)
+            else:
+                records = process_apache(access_logs, args, profiler)
+            logging.info("Log processing started. May take a while")
+            stats = make_stats(records, args, profiler)
     logging.info("Log processing finished")
-    if args.xlsx_report:
-        make_xlsx_report(stats, args)
-    else:
-        make_csv_report(stats, args)
+    run_start = None
+    if args.history_db and not args.all_logs and history_partial_dates(stats, args):
+        run_start = logs_start_time(access_logs, args)
+    make_report(stats, args, profiler, run_start)
 
 
 if __name__ == "__main__":
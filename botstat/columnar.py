@@ -0,0 +1,171 @@
+"""Batch aggregation of parsed records with NumPy.
+
+Records are taken in batches and turned into columns of codes: distinct
+time_local values, user agents and hosts are parsed, matched and decoded
+once per batch. Counters are updated in place through NumPy views of
+StatsStore arrays, np.add.at adds values in record order, so sums of
+request times are the same as from make_stats record by record.
+"""
+from itertools import islice
+from .aggregation import STATUS_CLASSES
+from .histogram import BUCKETS
+from .histogram import time_bucket
+from .timestamp import is_clf_time
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+BATCH_SIZE = 1 << 16
+
+
+def batches(records, size=None):
+    iterator = iter(records)
+    while True:
+        batch = list(islice(iterator, size or BATCH_SIZE))
+        if not batch:
+            return
+        yield batch
+
+
+def factorize(values):
+    # distinct values in order of appearance and code of every value
+    index = dict.fromkeys(values)
+    for code, value in enumerate(index):
+        index[value] = code
+    return list(index), np.fromiter(map(index.__getitem__, values), dtype=np.int64, count=len(values))
+
+
+def key_codes(values, convert):
+    # codes of converted distinct values, values converted to the same
+    # key share a code
+    uniques, codes = factorize(values)
+    keys = {}
+    key_list = []
+    mapping = []
+    for value in uniques:
+        key = convert(value)
+        if key not in keys:
+            keys[key] = len(key_list)
+            key_list.append(key)
+        mapping.append(keys[key])
+    return key_list, np.array(mapping, dtype=np.int64)[codes]
+
+
+def bucket_codes(values, parse_bucket, by_prefix=True):
+    # common log format times are parsed once per "[dd/Mon/yyyy:HH:MM"
+    # prefix, which defines the bucket, other times one by one, a parser
+    # of a date format needs whole times
+    if not by_prefix:
+        return key_codes(values, parse_bucket)
+    prefixes, codes = factorize([value[:18] for value in values])
+    keys = {}
+    key_list = []
+    mapping = []
+    for prefix in prefixes:
+        key = parse_bucket(prefix) if is_clf_time(prefix) else None
+        if key is not None and key not in keys:
+            keys[key] = len(key_list)
+            key_list.append(key)
+        mapping.append(keys.get(key, -1))
+    codes = np.array(mapping, dtype=np.int64)[codes]
+    others = np.flatnonzero(codes < 0).tolist()
+    if others:
+        other_keys, other_codes = key_codes([values[i] for i in others], parse_bucket)
+        codes[others] = other_codes + len(key_list)
+        key_list.extend(other_keys)
+    return key_list, codes
+
+
+def to_int(values):
+    # int() of digit strings, 0 for "-" and other values
+    column = np.array(values)
+    return np.where(np.char.isdigit(column), column, column.dtype.type("0")).astype(np.int64)
+
+
+def decode(value):
+    return value.decode("utf-8", "replace") if isinstance(value, bytes) else value
+
+
+class BatchAggregator(object):
+    """Adds batches of parsed records to StatsStore.
+
+    The result is the same as of make_stats adding records one by one:
+    rows are created in order of the first record of every row and
+    records are filtered by date_start and bot match the same way.
+    """
+
+    def __init__(self, stats, parse_bucket, match_bot, date_start, default_host, add_url=None, by_prefix=True):
+        self.stats = stats
+        self.parse_bucket = parse_bucket
+        # False if parse_bucket uses --date-format
+        self.by_prefix = by_prefix
+        self.match_bot = match_bot
+        self.date_start = date_start
+        self.default_host = default_host
+        # add_url(date, bot, host, request) of every bot hit, or None
+        self.add_url = add_url
+
+    def add(self, batch):
+        # returns number of added bot records
+        stats = self.stats
+        date_keys, date_codes = bucket_codes([record["time_local"] for record in batch], self.parse_bucket,
+                                             self.by_prefix)
+        bot_names, bot_codes = key_codes([record["http_user_agent"] for record in batch], self.match_bot)
+        if self.date_start is not None:
+            date_mask = np.array([key >= self.date_start for key in date_keys], dtype=bool)
+        else:
+            date_mask = np.ones(len(date_keys), dtype=bool)
+        bot_mask = np.array([name is not None for name in bot_names], dtype=bool)
+        selected = np.flatnonzero(date_mask[date_codes] & bot_mask[bot_codes])
+        if not len(selected):
+            return 0
+        records = [batch[i] for i in selected.tolist()]
+        date_codes = date_codes[selected]
+        bot_codes = bot_codes[selected]
+        if "host" in records[0]:
+            hosts, host_codes = key_codes([record["host"] for record in records], decode)
+        else:
+            hosts, host_codes = [self.default_host], np.zeros(len(records), dtype=np.int64)
+
+        # rows of (date, bot, host) groups in order of their first record
+        groups = (date_codes * len(bot_names) + bot_codes) * len(hosts) + host_codes
+        uniques, first, inverse = np.unique(groups, return_index=True, return_inverse=True)
+        order = np.argsort(first, kind="stable")
+        rows = np.empty(len(uniques), dtype=np.int64)
+        for group in order.tolist():
+            date_code, rest = divmod(int(uniques[group]), len(bot_names) * len(hosts))
+            bot_code, host_code = divmod(rest, len(hosts))
+            rows[group] = stats.row(date_keys[date_code], bot_names[bot_code], hosts[host_code])
+        statuses = np.array([record["status"] for record in records]).astype(np.int64)
+        cells = rows[inverse.reshape(-1)] * STATUS_CLASSES + statuses // 100
+
+        np.add.at(np.frombuffer(stats.counts, dtype=np.int64), cells, 1)
+        if records[0].get("body_bytes_sent") is not None:
+            np.add.at(np.frombuffer(stats.bytes, dtype=np.int64), cells,
+                      to_int([record["body_bytes_sent"] for record in records]))
+            stats.has_bytes = True
+        if records[0].get("request_time") is not None:
+            times, time_codes = factorize([record["request_time"] for record in records])
+            values = np.array([float(value) for value in times], dtype=np.float64)
+            np.add.at(np.frombuffer(stats.times, dtype=np.float64), cells, values[time_codes])
+            stats.has_time = True
+            self.add_latencies(cells, np.array([time_bucket(value) for value in values.tolist()],
+                                               dtype=np.int64)[time_codes])
+        if self.add_url is not None:
+            for record, date_code, bot_code, host_code in zip(
+                    records, date_codes.tolist(), bot_codes.tolist(), host_codes.tolist()):
+                if record.get("request") is not None:
+                    self.add_url(date_keys[date_code], bot_names[bot_code], hosts[host_code], record["request"])
+        return len(records)
+
+    def add_latencies(self, cells, buckets):
+        keys, counts = np.unique(cells * BUCKETS + buckets, return_counts=True)
+        latencies = self.stats.latencies
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            cell, bucket = divmod(key, BUCKETS)
+            histogram = latencies.get(cell)
+            if histogram is None:
+                histogram = latencies[cell] = {}
+            histogram[bucket] = histogram.get(bucket, 0) + count
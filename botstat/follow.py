@@ -0,0 +1,121 @@
+import os
+import time
+import logging
+import threading
+from .metrics import PUBLISH_INTERVAL
+from .reader import BLOCK_SIZE
+
+
+# largest block returned by LogFollower.read, a burst of lines is
+# aggregated by blocks
+FOLLOW_READ_SIZE = 16 * BLOCK_SIZE
+
+
+class LogFollower(object):
+    """Reads lines appended to a log like tail -F.
+
+    The log is kept open, read() returns bytes of complete lines written
+    since the previous call, a line which is still being written is kept
+    for the next call. A rotated log is read to the end before the new
+    file is opened by name, a truncated log is read from the beginning.
+    """
+
+    def __init__(self, path, offset=0):
+        self.path = path
+        self.stream = open(path, "rb")
+        self.stream.seek(offset)
+        self.partial = b""
+
+    def close(self):
+        self.stream.close()
+
+    @property
+    def inode(self):
+        return os.fstat(self.stream.fileno()).st_ino
+
+    @property
+    def offset(self):
+        # end of the last returned line
+        return self.stream.tell() - len(self.partial)
+
+    def check_rotation(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            # rotated, the new log is not created yet
+            return
+        if stat.st_ino != self.inode:
+            logging.info("Log %s was rotated, following the new file", self.path)
+            stream = open(self.path, "rb")
+            self.stream.close()
+            self.stream = stream
+            self.partial = b""
+        elif stat.st_size < self.stream.tell():
+            logging.warning("Log %s was truncated, following from the beginning", self.path)
+            self.stream.seek(0)
+            self.partial = b""
+
+    def read(self, size=FOLLOW_READ_SIZE):
+        data = self.stream.read(size)
+        if not data:
+            self.check_rotation()
+            data = self.stream.read(size)
+        data = self.partial + data
+        end = data.rfind(b"\n") + 1
+        self.partial = data[end:]
+        return data[:end]
+
+
+class FollowControl(object):
+    # flush and stop requests, set by signal handlers, wake up the follow loop
+
+    def __init__(self):
+        self.wakeup = threading.Event()
+        self.flush_requested = False
+        self.stopped = False
+
+    def request_flush(self, *args):
+        self.flush_requested = True
+        self.wakeup.set()
+
+    def stop(self, *args):
+        self.stopped = True
+        self.wakeup.set()
+
+    def wait(self, timeout):
+        self.wakeup.wait(timeout)
+        self.wakeup.clear()
+
+
+class FlushSchedule(object):
+    """Calls flush(stats) every interval seconds and on control request,
+    publish gets a copy of changed stats at most every PUBLISH_INTERVAL
+    seconds."""
+
+    def __init__(self, control, interval, flush, publish=None):
+        self.control = control
+        self.interval = interval
+        self.flush = flush
+        self.publish = publish
+        self.next_flush = time.time() + interval
+        self.next_publish = 0
+        self.changed = publish is not None
+
+    def update(self, stats, changed=False):
+        # stats, pruned by flush
+        if changed and self.publish is not None:
+            self.changed = True
+        if self.control.flush_requested or time.time() >= self.next_flush:
+            self.control.flush_requested = False
+            stats = self.flush(stats)
+            self.next_flush = time.time() + self.interval
+            self.changed = self.publish is not None
+        if self.changed and time.time() >= self.next_publish:
+            self.publish(stats.copy())
+            self.next_publish = time.time() + PUBLISH_INTERVAL
+            self.changed = False
+        return stats
+
+    def timeout(self):
+        # seconds until the next flush
+        return max(0, self.next_flush - time.time())
@@ -0,0 +1,93 @@
+class SpaceSaving(object):
+    """Space-Saving summary of the most frequent keys in a stream.
+
+    At most capacity keys are counted. A new key replaces one of the
+    least counted keys and takes its count, which is kept as the error
+    of the new key, so a count is never less than the true number of
+    occurrences and exceeds it by at most the error. Keys are grouped by
+    count, an update is O(1).
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        # count -> set of keys with that count
+        self.buckets = {}
+        self.min_count = 0
+
+    def _bucket_add(self, key, count):
+        bucket = self.buckets.get(count)
+        if bucket is None:
+            bucket = self.buckets[count] = set()
+        bucket.add(key)
+
+    def _bucket_remove(self, key, count):
+        bucket = self.buckets[count]
+        bucket.discard(key)
+        if not bucket:
+            del self.buckets[count]
+            if count == self.min_count:
+                self.min_count = count + 1
+
+    def add(self, key):
+        count = self.counts.get(key)
+        if count is not None:
+            self.counts[key] = count + 1
+            self._bucket_add(key, count + 1)
+            self._bucket_remove(key, count)
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[key] = 1
+            self.errors[key] = 0
+            self._bucket_add(key, 1)
+            self.min_count = 1
+            return
+        count = self.min_count
+        evicted = next(iter(self.buckets[count]))
+        del self.counts[evicted]
+        del self.errors[evicted]
+        self.counts[key] = count + 1
+        self.errors[key] = count
+        self._bucket_add(key, count + 1)
+        self._bucket_remove(evicted, count)
+
+    def floor(self):
+        # largest possible count of a key which is not counted
+        return self.min_count if len(self.counts) >= self.capacity else 0
+
+    def merge(self, other):
+        """Add summary of other stream, a key missing in one summary is
+        counted with the floor of it as both count and error."""
+        own_floor, other_floor = self.floor(), other.floor()
+        capacity = max(self.capacity, other.capacity)
+        merged = []
+        for key in set(self.counts).union(other.counts):
+            merged.append((self.counts.get(key, own_floor) + other.counts.get(key, other_floor),
+                           self.errors.get(key, own_floor) + other.errors.get(key, other_floor),
+                           key))
+        merged.sort(key=lambda item: item[0], reverse=True)
+        self.load(merged[:capacity], capacity)
+        return self
+
+    def load(self, items, capacity=None):
+        # replace summary with (count, error, key) items
+        self.capacity = capacity or self.capacity
+        self.counts = {}
+        self.errors = {}
+        self.buckets = {}
+        for count, error, key in items:
+            self.counts[key] = count
+            self.errors[key] = error
+            self._bucket_add(key, count)
+        self.min_count = min(self.buckets) if self.buckets else 0
+        return self
+
+    def items(self):
+        # (count, error, key) for all counted keys
+        return [(count, self.errors[key], key) for key, count in self.counts.items()]
+
+    def top(self, k):
+        """k most frequent (key, count, error), the most frequent first."""
+        ordered = sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))
+        return [(key, count, self.errors[key]) for key, count in ordered[:k]]
@@ -0,0 +1,66 @@
+import math
+
+
+# Request times are counted in buckets growing by GAMMA, a time in bucket
+# (GAMMA**(k-1), GAMMA**k] is reported as the middle of it with relative
+# error at most RELATIVE_ERROR. Times up to MIN_TIME share bucket 0 and
+# are reported as 0, times above MAX_TIME share the last bucket, so a
+# histogram never has more than BUCKETS entries.
+RELATIVE_ERROR = 0.01
+GAMMA = (1 + RELATIVE_ERROR) / (1 - RELATIVE_ERROR)
+LOG_GAMMA = math.log(GAMMA)
+MIN_TIME = 1e-6
+MAX_TIME = 1e5
+MIN_INDEX = int(math.floor(math.log(MIN_TIME) / LOG_GAMMA))
+MAX_BUCKET = int(math.ceil(math.log(MAX_TIME) / LOG_GAMMA)) - MIN_INDEX
+BUCKETS = MAX_BUCKET + 1
+PERCENTILES = (0.5, 0.9, 0.99)
+
+
+def time_bucket(seconds):
+    if seconds <= MIN_TIME:
+        return 0
+    return min(int(math.ceil(math.log(seconds) / LOG_GAMMA)) - MIN_INDEX, MAX_BUCKET)
+
+
+def bucket_time(bucket):
+    if bucket == 0:
+        return 0.0
+    return 2 * GAMMA ** (bucket + MIN_INDEX) / (GAMMA + 1)
+
+
+def bucket_bound(bucket):
+    # upper bound of times in bucket, None for the last unbounded one
+    if bucket == MAX_BUCKET:
+        return None
+    if bucket == 0:
+        return MIN_TIME
+    return GAMMA ** (bucket + MIN_INDEX)
+
+
+def add_time(histogram, seconds):
+    bucket = time_bucket(seconds)
+    histogram[bucket] = histogram.get(bucket, 0) + 1
+
+
+def merge_histograms(histogram, other):
+    # counts are added, so merging of parts is exact
+    for bucket, count in other.items():
+        histogram[bucket] = histogram.get(bucket, 0) + count
+    return histogram
+
+
+def percentiles(histogram, quantiles=PERCENTILES):
+    """Times in seconds for quantiles by nearest rank, None for an empty histogram."""
+    total = sum(histogram.values())
+    if not total:
+        return [None] * len(quantiles)
+    ranks = [max(1, int(math.ceil(quantile * total))) for quantile in quantiles]
+    results = [None] * len(quantiles)
+    seen = 0
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        for i, rank in enumerate(ranks):
+            if results[i] is None and rank <= seen:
+                results[i] = bucket_time(bucket)
+    return results
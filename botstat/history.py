@@ -0,0 +1,128 @@
+"""SQLite history of statistic rows, reports can cover any stored period.
+
+Every run upserts its (date, bot, host, status) rows in one transaction,
+a stored row is replaced by the newer one, so processing the same period
+again does not count it twice. The first date of a run whose logs start
+after its beginning misses records rotated away before the run, its rows
+replace stored rows of the date only if they have at least as many hits.
+The table is clustered by its primary key (date, bot, host, status),
+which covers all columns, so a date range is read by one index range scan.
+"""
+import json
+import sqlite3
+import datetime
+from .aggregation import STATUS_CLASSES
+from .aggregation import StatsStore
+from .state import parse_key
+
+
+HISTORY_VERSION = 1
+
+HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    date TEXT NOT NULL,
+    bot TEXT NOT NULL,
+    host TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    bytes INTEGER,
+    time REAL,
+    latency TEXT,
+    PRIMARY KEY (date, bot, host, status)
+) WITHOUT ROWID;
+"""
+
+UPSERT_COUNTER = "INSERT OR REPLACE INTO counters VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+
+SELECT_DATE_COUNT = "SELECT coalesce(sum(count), 0) FROM counters WHERE date = ?"
+
+SELECT_COUNTERS = ("SELECT date, bot, host, status, count, bytes, time, latency FROM counters "
+                   "WHERE date >= ? AND date < ?")
+
+
+def open_history(path, bucket):
+    """Connection to the history of bucket rows, created if missing."""
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.executescript(HISTORY_SCHEMA)
+        connection.execute("INSERT OR IGNORE INTO meta VALUES ('version', ?)", (str(HISTORY_VERSION),))
+        connection.execute("INSERT OR IGNORE INTO meta VALUES ('bucket', ?)", (bucket,))
+    meta = dict(connection.execute("SELECT key, value FROM meta"))
+    if meta["version"] != str(HISTORY_VERSION):
+        connection.close()
+        raise SystemExit("History %s has unsupported version %s" % (path, meta["version"]))
+    if meta["bucket"] != bucket:
+        connection.close()
+        raise SystemExit("History %s keeps %s buckets, statistic has %s buckets" % (path, meta["bucket"], bucket))
+    # a reader of the history does not block writes, a commit does not
+    # wait for fsync of the database file
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+def counter_rows(stats, skip_dates=()):
+    # table rows of every status with hits, read from the arrays directly
+    # as a day has thousands of them
+    for row, (date, bot, host, counts, bytes_sent, times) in enumerate(stats.iter_rows()):
+        if date in skip_dates:
+            continue
+        date, host = date.isoformat(), host or ""
+        for status_class, count in enumerate(counts):
+            if count:
+                latency = stats.latencies.get(row * STATUS_CLASSES + status_class)
+                yield (date, bot, host, status_class * 100, count,
+                       bytes_sent[status_class] if stats.has_bytes else None,
+                       times[status_class] if stats.has_time else None,
+                       json.dumps(sorted(latency.items())) if latency else None)
+
+
+def save_history(path, stats, bucket, partial_dates=()):
+    """Upsert rows of stats, returns number of rows.
+
+    Rows of partial_dates replace stored rows of a date only if they have
+    at least as many hits.
+    """
+    counts = dict((date, 0) for date in partial_dates)
+    for date, bot, host, row_counts, bytes_sent, times in stats.iter_rows():
+        if date in counts:
+            counts[date] += sum(row_counts)
+    connection = open_history(path, bucket)
+    try:
+        with connection:
+            skip_dates = set(date for date, count in counts.items()
+                             if connection.execute(SELECT_DATE_COUNT, (date.isoformat(),)).fetchone()[0] > count)
+            cursor = connection.executemany(UPSERT_COUNTER, counter_rows(stats, skip_dates))
+        return cursor.rowcount
+    finally:
+        connection.close()
+
+
+def load_history(path, bucket, date_start=None, date_end=None):
+    """Statistic of dates from date_start to date_end inclusive."""
+    start = date_start.isoformat() if date_start is not None else ""
+    # every bucket of the last day sorts before the next day
+    end = (date_end + datetime.timedelta(days=1)).isoformat() if date_end is not None else "9999"
+    stats = StatsStore()
+    dates = {}
+    decode = json.JSONDecoder().decode
+    connection = open_history(path, bucket)
+    try:
+        for date, bot, host, status, count, bytes_sent, time, latency in connection.execute(
+                SELECT_COUNTERS, (start, end)):
+            counter = {"count": count}
+            if bytes_sent is not None:
+                counter["bytes"] = bytes_sent
+            if time is not None:
+                counter["time"] = time
+            if date not in dates:
+                dates[date] = parse_key(date)
+            stats.add_counter(dates[date], bot, host or None, status, counter,
+                              dict(decode(latency)) if latency else None)
+    finally:
+        connection.close()
+    return stats
@@ -5,12 +5,73 @@ from pyparsing import Literal, Word, ZeroOrMore, OneOrMore, Group
 from pyparsing import printables, quotedString, pythonStyleComment
 from pyparsing import removeQuotes
 import logging
-from six.moves import input
 
 
 DEFAULT_APACHE_LOG_FORMAT = r'%h %l %u %t "%r" %s %b "%{Referer}i" "%{User-agent}i"'
 REGEX_SPECIAL_CHARS = r'([\.\*\+\?\|\(\)\{\}\[\]])'
 REGEX_LOG_FORMAT_VARIABLE = r'\$([a-z0-9\_]+)'
+# Patterns of nginx variables with known values, other variables
+# are matched up to the closing quote/bracket or to the next literal
+LOG_FORMAT_VARIABLE_PATTERNS = {"status": r'\d{3}',
+                                "body_bytes_sent": r'\d+|-',
+                                "bytes_sent": r'\d+|-',
+                                "request_length": r'\d+',
+                                "request_time": r'[\d.]+',
+                                "msec": r'[\d.]+',
+                                "connection": r'\d+',
+                                "connection_requests": r'\d+',
+                                "remote_port": r'\d+',
+                                "server_port": r'\d+',
+                                "remote_addr": r'\S+',
+                                "remote_user": r'\S+',
+                                "host": r'\S+',
+                                "server_name": r'\S+',
+                                "time_iso8601": r'\S+'}
+QUOTED_VARIABLE_PATTERN = r'[^"]*'
+BRACKETED_VARIABLE_PATTERN = r'[^\]]*'
+DEFAULT_VARIABLE_PATTERN = r'.*?'
+# lines of logs written on Windows end with CRLF
+LINE_END_PATTERN = r'\r?$'
+REGEX_APACHE_LOG_FORMAT_DIRECTIVE = r'%(?:!?\d{3}(?:,\d{3})*)?([<>]?)(?:\{([^}]*)\})?([a-zA-Z%])'
+# Apache escapes quotes in logged strings as \". Other escapes are not
+# looked for, full escape handling makes the whole regex twice slower
+APACHE_QUOTED_PATTERN = r'[^"]*(?:\\"[^"]*)*'
+APACHE_LOG_FORMAT_PATTERNS = {"s": r'\d{3}',
+                              "b": r'\d+|-',
+                              "B": r'\d+',
+                              "D": r'\d+',
+                              "T": r'\d+',
+                              "I": r'\d+',
+                              "O": r'\d+',
+                              "S": r'\d+',
+                              "k": r'\d+',
+                              "p": r'\d+',
+                              "P": r'\d+',
+                              "a": r'\S+',
+                              "A": r'\S+',
+                              "h": r'\S+',
+                              "l": r'\S+',
+                              "u": r'\S+',
+                              "v": r'\S+',
+                              "V": r'\S+',
+                              "H": r'\S+',
+                              "m": r'\S+',
+                              "U": r'\S+',
+                              "L": r'\S+',
+                              "X": r'[X+-]'}
+# Fields used for statistic, named as nginx variables. Candidates for a
+# field are listed by preference, e.g. final status %>s before %s, option
+# None matches any option: %{format}t
+APACHE_LOG_FORMAT_FIELDS = {"time_local": [("", "", "t"), ("", None, "t")],
+                            "status": [(">", "", "s"), ("", "", "s"), ("<", "", "s")],
+                            "body_bytes_sent": [("", "", "b"), ("", "", "B")],
+                            "request_time_us": [("", "", "D"), ("", "us", "T")],
+                            "request_time_ms": [("", "ms", "T")],
+                            "request_time": [("", "", "T"), ("", "s", "T")],
+                            "host": [("", "", "v"), ("", "", "V"), ("", "host", "i")],
+                            "http_user_agent": [("", "user-agent", "i")],
+                            "request": [("", "", "r")]}
+APACHE_REQUEST_TIME_FIELDS = ["request_time_us", "request_time_ms", "request_time"]
 LOG_FORMATS = {"combined": '$remote_addr - $remote_user [$time_local] ' +
                            '"$request" $status $body_bytes_sent ' +
                            '"$http_referer" "$http_user_agent"',
@@ -42,12 +103,13 @@ def detect_nginx_config_path():
     return '/etc/nginx/nginx.conf'
 
 
-def extract_access_logs(config):
+def extract_access_logs(config, syslog=False):
+    # log files, with syslog "syslog:server=..." targets
     access_log = Literal("access_log") + ZeroOrMore(parameter) + semicolon
     access_log.ignore(pythonStyleComment)
     for directive in access_log.searchString(config).asList():
         path = directive[1]
-        if path == 'off' or path.startswith('syslog:'):
+        if path == 'off' or path.startswith('syslog:') != syslog:
             continue
         format_name = 'combined'
         if len(directive) > 2 and '=' not in directive[2]:
@@ -78,19 +140,56 @@ def choose_one(choices, prompt):
     return choices[selected - 1]
 
 
-def detect_log_config(arguments):
+def read_nginx_config_file(arguments):
     config = arguments.nginx_config
     if config is None:
         config = detect_nginx_config_path()
     if not os.path.exists(config):
         raise SystemExit('Nginx config file not found: %s' % config)
     with open(config) as fobj:
-        config_str = fobj.read()
+        return config, fobj.read()
+
+
+def read_nginx_config(arguments):
+    config, config_str = read_nginx_config_file(arguments)
     access_logs = dict(extract_access_logs(config_str))
     if not access_logs:
         raise SystemExit('Access log file is not provided and ngxtop cannot detect '
                          'it from your config file (%s).' % config)
+    return access_logs, dict(extract_log_format(config_str))
+
+
+def detect_log_configs(arguments):
+    """All (access log, log format) pairs from nginx config."""
+    access_logs, log_formats = read_nginx_config(arguments)
+    log_formats.setdefault('combined', LOG_FORMATS['combined'])
+    configs = []
+    for log_path, format_name in access_logs.items():
+        if format_name not in log_formats:
+            raise SystemExit('Incorrect format name set in config for access log file "%s"' % log_path)
+        configs.append((log_path, log_formats[format_name]))
+    return configs
+
+
+def detect_syslog_log_format(arguments):
+    """Log format of access_log syslog: targets from nginx config."""
+    config, config_str = read_nginx_config_file(arguments)
+    format_names = set(format_name for target, format_name in extract_access_logs(config_str, syslog=True))
+    if not format_names:
+        raise SystemExit('No access_log with syslog: target found in nginx config file (%s).' % config)
+    if len(format_names) > 1:
+        raise SystemExit('Syslog access logs have different formats (%s), set --log-format'
+                         % ', '.join(sorted(format_names)))
+    format_name = format_names.pop()
     log_formats = dict(extract_log_format(config_str))
+    log_formats.setdefault('combined', LOG_FORMATS['combined'])
+    if format_name not in log_formats:
+        raise SystemExit('Incorrect format name set in config for syslog access log')
+    return log_formats[format_name]
+
+
+def detect_log_config(arguments):
+    access_logs, log_formats = read_nginx_config(arguments)
     if len(access_logs) == 1:
         log_path, format_name = next(iter(access_logs.items()))
         if format_name == 'combined':
@@ -106,15 +205,92 @@ def detect_log_config(arguments):
     return log_path, log_formats[format_name]
 
 
+def variable_pattern(name, prefix, suffix):
+    if name in LOG_FORMAT_VARIABLE_PATTERNS:
+        return LOG_FORMAT_VARIABLE_PATTERNS[name]
+    if prefix.count('"') % 2 == 1:
+        return QUOTED_VARIABLE_PATTERN
+    if prefix.endswith('[') and suffix.startswith(']'):
+        return BRACKETED_VARIABLE_PATTERN
+    return DEFAULT_VARIABLE_PATTERN
+
+
 def build_log_format_regex(log_format):
     if log_format in LOG_FORMATS:
         log_format = LOG_FORMATS[log_format]
-    pattern = re.sub(REGEX_SPECIAL_CHARS, r'\\\1', log_format)
-    pattern = re.sub(REGEX_LOG_FORMAT_VARIABLE, '(?P<\\1>.*)', pattern)
+    # literals and variable names alternate: [literal, name, literal, ...]
+    parts = re.split(REGEX_LOG_FORMAT_VARIABLE, log_format)
+    pattern = re.sub(REGEX_SPECIAL_CHARS, r'\\\1', parts[0])
+    for idx in range(1, len(parts), 2):
+        name, suffix = parts[idx], parts[idx + 1]
+        prefix = ''.join(parts[0:idx:2])
+        pattern += '(?P<%s>%s)' % (name, variable_pattern(name, prefix, suffix))
+        pattern += re.sub(REGEX_SPECIAL_CHARS, r'\\\1', suffix)
+    pattern += LINE_END_PATTERN
+    logging.debug("Log parse regexp: %s", pattern)
+    return re.compile(pattern)
+
+
+def apache_directive_pattern(directive, option, prefix, suffix):
+    if directive in APACHE_LOG_FORMAT_PATTERNS:
+        return APACHE_LOG_FORMAT_PATTERNS[directive]
+    if directive == "t" and not option:
+        return r'\[[^\]]*\]'
+    if prefix.count('"') % 2 == 1:
+        return APACHE_QUOTED_PATTERN
+    if prefix.endswith('[') and suffix.startswith(']'):
+        return BRACKETED_VARIABLE_PATTERN
+    return DEFAULT_VARIABLE_PATTERN
+
+
+def select_apache_fields(directives):
+    # directive index -> field name, the most preferred directive of every field
+    fields = {}
+    for name, candidates in APACHE_LOG_FORMAT_FIELDS.items():
+        for modifier, option, directive in candidates:
+            found = [idx for idx, (found_modifier, found_option, found_directive) in enumerate(directives)
+                     if (found_modifier, found_directive) == (modifier, directive)
+                     and option in (None, found_option)]
+            if found:
+                fields[found[0]] = name
+                break
+    # only the most precise of request times is kept
+    times = [name for name in APACHE_REQUEST_TIME_FIELDS if name in fields.values()]
+    return dict((idx, name) for idx, name in fields.items()
+                if name not in APACHE_REQUEST_TIME_FIELDS or name == times[0])
+
+
+def build_apache_log_format_regex(log_format):
+    """Regex for Apache LogFormat capturing only fields used for statistic."""
+    # literals and directives alternate: [literal, modifier, option, directive, literal, ...]
+    parts = re.split(REGEX_APACHE_LOG_FORMAT_DIRECTIVE, log_format)
+    directives = [(parts[idx], (parts[idx + 1] or "").lower(), parts[idx + 2])
+                  for idx in range(1, len(parts), 4)]
+    fields = select_apache_fields(directives)
+    literals = parts[0::4]
+    pattern = re.sub(REGEX_SPECIAL_CHARS, r'\\\1', literals[0])
+    for idx, (modifier, option, directive) in enumerate(directives):
+        prefix = ''.join(literals[:idx + 1])
+        suffix = literals[idx + 1]
+        if directive == "%":
+            pattern += '%'
+        elif directive == "t" and not option and idx in fields:
+            pattern += r'\[(?P<time_local>[^\]]*)\]'
+        elif idx in fields:
+            pattern += '(?P<%s>%s)' % (fields[idx], apache_directive_pattern(directive, option, prefix, suffix))
+        else:
+            pattern += '(?:%s)' % (apache_directive_pattern(directive, option, prefix, suffix),)
+        pattern += re.sub(REGEX_SPECIAL_CHARS, r'\\\1', suffix)
+    pattern += LINE_END_PATTERN
     logging.debug("Log parse regexp: %s", pattern)
     return re.compile(pattern)
 
 
+def binary_regex(regex):
+    # The same regex matching undecoded lines, captured fields are bytes
+    return re.compile(regex.pattern.encode('utf-8'), regex.flags & ~re.UNICODE)
+
+
 def check_regex_required_fields(re_expression, fields):
     for field in fields:
         if 'P<%s>' % (field,) not in re_expression.pattern:
@@ -1,38 +1,173 @@
+import gzip
+import shutil
+import uuid
+import base64
 import smtplib
 import logging
+import zipfile
 from os.path import basename
-from email.mime.application import MIMEApplication
-from email.mime.multipart import MIMEMultipart
+from email import policy
+from email.message import EmailMessage
 from email.mime.text import MIMEText
 from email.utils import formatdate
+from email.utils import make_msgid
+from tempfile import TemporaryFile
 
 
-def send_mail(text, stream, filename, args):
+# base64 of 57 bytes is a line of 76 characters
+BASE64_CHUNK = 57 * 1024
+SEND_CHUNK = 1 << 16
 
+
+def binary_stream(stream):
+    # bytes of a text temporary file are read from its buffer
+    return getattr(stream, "buffer", stream)
+
+
+def compress_gzip(stream, filename, output):
+    with gzip.GzipFile(basename(filename), "wb", fileobj=output, mtime=0) as compressed:
+        shutil.copyfileobj(binary_stream(stream), compressed)
+
+
+def compress_zip(stream, filename, output):
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(basename(filename), "w") as compressed:
+            shutil.copyfileobj(binary_stream(stream), compressed)
+
+
+# --mail-compress -> (file name suffix, content subtype, compressor)
+COMPRESSORS = {
+    "gzip": (".gz", "gzip", compress_gzip),
+    "zip": (".zip", "zip", compress_zip),
+}
+
+
+def format_headers(message):
+    return b"".join(message.policy.fold_binary(name, value) for name, value in message.items()) + b"\r\n"
+
+
+def write_attachment(output, stream, filename, boundary, compress=None):
+    """Write MIME part of the attachment, compressed and base64 encoded by chunks."""
+    subtype = "octet-stream"
+    compressed = None
+    if compress:
+        suffix, subtype, compressor = COMPRESSORS[compress]
+        compressed = TemporaryFile("w+b")
+        compressor(stream, filename, compressed)
+        compressed.seek(0)
+        stream = compressed
+        filename += suffix
+    part = EmailMessage(policy.SMTP)
+    part["Content-Type"] = 'application/%s; name="%s"' % (subtype, basename(filename))
+    part["Content-Transfer-Encoding"] = "base64"
+    part["Content-Disposition"] = 'attachment; filename="%s"' % basename(filename)
+    output.write(b"--%s\r\n" % boundary)
+    output.write(format_headers(part))
+    stream = binary_stream(stream)
+    try:
+        for chunk in iter(lambda: stream.read(BASE64_CHUNK), b""):
+            output.write(base64.encodebytes(chunk).replace(b"\n", b"\r\n"))
+    finally:
+        if compressed is not None:
+            compressed.close()
+
+
+def write_body(output, text, attachments, boundary, compress=None):
+    # multipart body with CRLF line ends, a text line starting with a dot
+    # is escaped for SMTP DATA
+    text_part = MIMEText(text).as_bytes(policy=policy.SMTP)
+    output.write(b"--%s\r\n" % boundary)
+    output.write(b"\r\n".join(b"." + line if line.startswith(b".") else line
+                              for line in text_part.split(b"\r\n")) + b"\r\n")
+    for stream, filename in attachments:
+        write_attachment(output, stream, filename, boundary, compress)
+    output.write(b"--%s--\r\n" % boundary)
+
+
+def message_headers(send_from, send_to, subject, boundary):
+    message = EmailMessage(policy.SMTP)
+    message["From"] = send_from
+    message["To"] = send_to
+    message["Date"] = formatdate(localtime=True)
+    message["Message-ID"] = make_msgid()
+    message["Subject"] = subject
+    message["MIME-Version"] = "1.0"
+    message["Content-Type"] = 'multipart/mixed; boundary="%s"' % boundary.decode("ascii")
+    return format_headers(message)
+
+
+def send_message(smtp, send_from, send_to, headers, body):
+    """Send message over open SMTP connection, body is streamed from file."""
+    smtp.ehlo_or_helo_if_needed()
+    code, response = smtp.mail(send_from)
+    if code != 250:
+        raise smtplib.SMTPSenderRefused(code, response, send_from)
+    code, response = smtp.rcpt(send_to)
+    if code not in (250, 251):
+        raise smtplib.SMTPRecipientsRefused({send_to: (code, response)})
+    code, response = smtp.docmd("data")
+    if code != 354:
+        raise smtplib.SMTPDataError(code, response)
+    smtp.send(headers)
+    body.seek(0)
+    for chunk in iter(lambda: body.read(SEND_CHUNK), b""):
+        smtp.send(chunk)
+    code, response = smtp.docmd(".")
+    if code != 250:
+        raise smtplib.SMTPDataError(code, response)
+
+
+def mail_recipients(args):
+    # comma separated --mail-to addresses
+    return [address.strip() for address in (args.mail_to or "").split(",") if address.strip()]
+
+
+def check_mail_options(args):
+    if not mail_recipients(args):
+        raise SystemExit("Report recipient is not set, use --mail-to or --partial-output")
+
+
+def send_mail(text, attachments, args):
+    """Send report to every --mail-to address over one SMTP connection.
+
+    attachments are (stream, filename) pairs. The message body is written
+    to a temporary file once and every recipient gets its own message
+    with the same body.
+    """
+    check_mail_options(args)
     send_from = args.mail_from
-    send_to = args.mail_to
-    subject = args.mail_subject
+    recipients = mail_recipients(args)
     smtp_host = args.smtp_host
     smtp_port = args.smtp_port or 25
-    msg = MIMEMultipart()
-    msg['From'] = send_from
-    msg['To'] = send_to
-    msg['Date'] = formatdate(localtime=True)
-    msg['Subject'] = subject
-    msg.attach(MIMEText(text))
-    part = MIMEApplication(
-        stream.read(),
-        Name=basename(filename)
-    )
-    part['Content-Disposition'] = 'attachment; filename="%s"' % filename
-    msg.attach(part)
-    try:
-        logging.debug("Sending report via SMTP server %s:%s", smtp_host, smtp_port)
-        smtp = smtplib.SMTP(smtp_host, smtp_port)
-        smtp.sendmail(send_from, send_to, msg.as_string())
-        smtp.close()
-    except:
-        logging.info("Report was successfully sent to %s", send_to)
-        logging.error("Sending report to %s failed" % send_to)
-        raise SystemExit("Please check your SMTP connection configuration. "
-                         "Botstat was not able to send email with your data")
+    boundary = ("botstat-" + uuid.uuid4().hex).encode("ascii")
+    failed = []
+    with TemporaryFile("w+b") as body:
+        write_body(body, text, attachments, boundary, args.mail_compress)
+        try:
+            logging.debug("Sending report via SMTP server %s:%s", smtp_host, smtp_port)
+            smtp = smtplib.SMTP(smtp_host, smtp_port)
+        except (smtplib.SMTPException, OSError):
+            logging.exception("Connection to SMTP server %s:%s failed", smtp_host, smtp_port)
+            raise SystemExit("Please check your SMTP connection configuration. "
+                             "Botstat was not able to send email with your data")
+        try:
+            for send_to in recipients:
+                try:
+                    send_message(smtp, send_from, send_to,
+                                 message_headers(send_from, send_to, args.mail_subject, boundary), body)
+                    logging.info("Report was successfully sent to %s", send_to)
+                except smtplib.SMTPResponseException as error:
+                    logging.error("Sending report to %s failed: %s %s", send_to, error.smtp_code, error.smtp_error)
+                    failed.append(send_to)
+                    smtp.rset()
+                except smtplib.SMTPRecipientsRefused:
+                    logging.error("Sending report to %s failed: recipient refused", send_to)
+                    failed.append(send_to)
+                    smtp.rset()
+            smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            logging.exception("Sending report failed")
+            raise SystemExit("Please check your SMTP connection configuration. "
+                             "Botstat was not able to send email with your data")
+    if failed:
+        raise SystemExit("Botstat was not able to send email to %s" % ", ".join(failed))
@@ -0,0 +1,241 @@
+"""HTTP endpoint with live statistic of long running modes.
+
+/metrics is in Prometheus text format, /metrics.json has the same
+counters and request time histograms as JSON. Ingest publishes copies of
+the statistic, the server only reads the last published snapshot.
+"""
+import json
+import asyncio
+import logging
+import argparse
+import threading
+from .aggregation import STATUS_CLASSES
+from .aggregation import StatsStore
+from .histogram import bucket_bound
+from .timestamp import format_bucket
+
+
+# seconds between snapshots published by ingest
+PUBLISH_INTERVAL = 1.0
+MAX_REQUEST_SIZE = 8192
+# asyncio.all_tasks is new in Python 3.7
+all_tasks = getattr(asyncio, "all_tasks", None) or asyncio.Task.all_tasks
+
+
+def parse_listen_address(address):
+    # "host:port" or ":port" for all interfaces
+    host, separator, port = address.rpartition(":")
+    if not separator or not port.isdigit():
+        raise argparse.ArgumentTypeError("address should be HOST:PORT or :PORT, got %r" % address)
+    return host.strip("[]") or None, int(port)
+
+
+def escape_label(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def histogram_buckets(histogram):
+    # (upper bound, cumulative count) of non-empty buckets, the last
+    # unbounded bucket is counted in +Inf only
+    cumulative = 0
+    for bucket in sorted(histogram):
+        cumulative += histogram[bucket]
+        bound = bucket_bound(bucket)
+        if bound is not None:
+            yield bound, cumulative
+
+
+def cell_latency(stats, date, bot, host, status):
+    return stats.latencies.get(stats.index[date, bot, host] * STATUS_CLASSES + status // 100)
+
+
+def render_prometheus(stats, counters=None):
+    requests, sent, times, latencies = [], [], [], []
+    for date, bot, host, status, counter in stats.iter_counters():
+        labels = 'date="%s",bot="%s",host="%s",status="%dxx"' % (
+            escape_label(format_bucket(date)), escape_label(bot), escape_label(host or ""), status // 100)
+        requests.append("botstat_requests_total{%s} %d" % (labels, counter["count"]))
+        if "bytes" in counter:
+            sent.append("botstat_response_bytes_total{%s} %d" % (labels, counter["bytes"]))
+        if "time" in counter:
+            times.append("botstat_request_time_seconds_total{%s} %r" % (labels, counter["time"]))
+        histogram = cell_latency(stats, date, bot, host, status)
+        if histogram:
+            for bound, cumulative in histogram_buckets(histogram):
+                latencies.append('botstat_request_time_seconds_bucket{%s,le="%.6g"} %d' % (labels, bound, cumulative))
+            latencies.append('botstat_request_time_seconds_bucket{%s,le="+Inf"} %d' % (labels, sum(histogram.values())))
+            latencies.append("botstat_request_time_seconds_count{%s} %d" % (labels, sum(histogram.values())))
+            latencies.append("botstat_request_time_seconds_sum{%s} %r" % (labels, counter.get("time", 0.0)))
+    lines = []
+    for name, kind, description, samples in (
+            ("botstat_requests_total", "counter", "Bot requests", requests),
+            ("botstat_response_bytes_total", "counter", "Bytes sent to bots", sent),
+            ("botstat_request_time_seconds_total", "counter", "Time spent on bot requests", times),
+            ("botstat_request_time_seconds", "histogram", "Request time of bot requests", latencies)):
+        if samples:
+            lines.append("# HELP %s %s by time bucket, bot, host and status class." % (name, description))
+            lines.append("# TYPE %s %s" % (name, kind))
+            lines.extend(samples)
+    for name, value in sorted((counters or {}).items()):
+        lines.append("# HELP botstat_%s_total %s." % (name, name.replace("_", " ").capitalize()))
+        lines.append("# TYPE botstat_%s_total counter" % name)
+        lines.append("botstat_%s_total %d" % (name, value))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def render_json(stats, counters=None):
+    rows = []
+    for date, bot, host, status, counter in stats.iter_counters():
+        row = {"date": format_bucket(date), "bot": bot, "host": host, "status": status}
+        row.update(counter)
+        histogram = cell_latency(stats, date, bot, host, status)
+        if histogram:
+            # [upper bound in seconds or null, count] of non-empty buckets
+            row["latency"] = [[bucket_bound(bucket), histogram[bucket]] for bucket in sorted(histogram)]
+        rows.append(row)
+    return json.dumps({"rows": rows, "counters": counters or {}}).encode("utf-8")
+
+
+# path -> (content type, renderer)
+ROUTES = {
+    "/metrics": ("text/plain; version=0.0.4; charset=utf-8", render_prometheus),
+    "/metrics.json": ("application/json", render_json),
+}
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}
+
+
+class MetricsServer(object):
+    """Serves the last published statistic from an asyncio loop in a thread.
+
+    publish() swaps a reference, so ingest never waits for the server,
+    counters are totals of the ingest itself, like dropped messages.
+    A body is rendered once per snapshot and path in an executor thread,
+    while a new snapshot is rendered requests get the previous body, so
+    only the first request of a path waits for rendering.
+    """
+
+    def __init__(self, host=None, port=0):
+        self.host = host
+        self.port = port
+        # (stats, counters)
+        self.snapshot = (StatsStore(), {})
+        # path -> (snapshot, body) of the last rendered body
+        self.rendered = {}
+        # path -> future of the body being rendered
+        self.rendering = {}
+        self.writers = set()
+        self.loop = None
+        self.server = None
+        self.error = None
+        self.thread = None
+
+    def publish(self, stats, counters=None):
+        self.snapshot = (stats, dict(counters or {}))
+
+    def render(self, path, snapshot):
+        future = self.rendering.get(path)
+        if future is None:
+            future = self.rendering[path] = self.loop.run_in_executor(None, ROUTES[path][1], *snapshot)
+
+            def done(future):
+                del self.rendering[path]
+                if not future.cancelled() and future.exception() is None:
+                    self.rendered[path] = (snapshot, future.result())
+            future.add_done_callback(done)
+        return future
+
+    async def body(self, path):
+        snapshot = self.snapshot
+        rendered = self.rendered.get(path)
+        if rendered is not None and rendered[0] is snapshot:
+            return rendered[1]
+        future = self.render(path, snapshot)
+        if rendered is not None:
+            return rendered[1]
+        return await asyncio.shield(future)
+
+    async def response(self, method, path):
+        if method not in ("GET", "HEAD"):
+            return 405, "text/plain", b"Method not allowed\n"
+        if path not in ROUTES:
+            return 404, "text/plain", b"Not found\n"
+        return 200, ROUTES[path][0], await self.body(path)
+
+    async def handle(self, reader, writer):
+        # HTTP/1.1 keep-alive connection, requests have no body
+        self.writers.add(writer)
+        try:
+            while True:
+                try:
+                    request = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    return
+                lines = request.decode("latin-1").split("\r\n")
+                parts = lines[0].split()
+                if len(parts) != 3:
+                    code, content_type, body = 400, "text/plain", b"Bad request\n"
+                    method, keep_alive = "GET", False
+                else:
+                    method, target, version = parts
+                    code, content_type, body = await self.response(method, target.split("?", 1)[0])
+                    headers = [line.lower() for line in lines[1:]]
+                    keep_alive = version == "HTTP/1.1" and "connection: close" not in headers
+                writer.write(("HTTP/1.1 %d %s\r\nContent-Type: %s\r\nContent-Length: %d\r\n%s\r\n" % (
+                    code, REASONS[code], content_type, len(body),
+                    "" if keep_alive else "Connection: close\r\n")).encode("latin-1"))
+                if method != "HEAD":
+                    writer.write(body)
+                await writer.drain()
+                if not keep_alive:
+                    return
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    def run(self, started):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(
+                asyncio.start_server(self.handle, self.host, self.port, limit=MAX_REQUEST_SIZE))
+        except OSError as error:
+            self.error = error
+            return
+        finally:
+            started.set()
+        self.loop.run_forever()
+        self.server.close()
+        # closed keep-alive connections end their handlers
+        for writer in list(self.writers):
+            writer.close()
+        tasks = all_tasks(self.loop)
+        if tasks:
+            self.loop.run_until_complete(asyncio.wait(tasks, timeout=1))
+        self.loop.run_until_complete(self.server.wait_closed())
+        # before Python 3.9 close() shuts the executor down without waiting
+        if hasattr(self.loop, "shutdown_default_executor"):
+            self.loop.run_until_complete(self.loop.shutdown_default_executor())
+        self.loop.close()
+
+    def start(self):
+        """Start serving in a daemon thread, returns the listening port."""
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+        self.thread = threading.Thread(target=self.run, args=(started,), name="metrics")
+        self.thread.daemon = True
+        self.thread.start()
+        started.wait()
+        if self.server is None:
+            self.thread.join()
+            self.thread = None
+            self.loop.close()
+            raise SystemExit("Metrics server can't listen on %s:%s: %s" % (self.host or "*", self.port, self.error))
+        self.port = self.server.sockets[0].getsockname()[1]
+        logging.info("Serving metrics on %s:%d", self.host or "*", self.port)
+        return self.port
+
+    def stop(self):
+        if self.thread is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.thread = None
@@ -0,0 +1,67 @@
+import os
+from multiprocessing import Pool
+from .reader import BLOCK_SIZE
+from .reader import open_log
+from .reader import read_blocks
+
+
+class TaskError(Exception):
+    """SystemExit of a task, a pool worker exits on SystemExit and the pool
+    waits for its result forever, an exception is passed to the parent."""
+
+
+def next_line_offset(stream, position):
+    # Offset of the first line starting at or after position
+    if position == 0:
+        return 0
+    stream.seek(position - 1)
+    stream.readline()
+    return stream.tell()
+
+
+def split_ranges(path, parts, start=0, end=None):
+    """Split file into at most parts byte ranges aligned to line starts."""
+    size = os.path.getsize(path) if end is None else end
+    offsets = [start]
+    with open(path, "rb") as stream:
+        for part in range(1, parts):
+            position = start + (size - start) * part // parts
+            if position <= offsets[-1]:
+                continue
+            position = next_line_offset(stream, position)
+            if offsets[-1] < position < size:
+                offsets.append(position)
+    offsets.append(size)
+    return [(begin, end) for begin, end in zip(offsets, offsets[1:]) if begin < end]
+
+
+def read_range(path, begin, end, line_filter=None):
+    # undecoded lines, end is None for the whole file, compressed logs
+    # are read that way
+    if end is None:
+        stream = open_log(path, binary=True)
+    else:
+        stream = open(path, "rb", BLOCK_SIZE)
+        stream.seek(begin)
+    with stream:
+        if line_filter is not None:
+            for line in line_filter(read_blocks(stream, None if end is None else end - begin)):
+                yield line
+            return
+        remaining = end - begin if end is not None else None
+        for line in stream:
+            if remaining is not None:
+                if remaining <= 0:
+                    break
+                remaining -= len(line)
+            yield line
+
+
+def map_parallel(function, tasks, workers):
+    pool = Pool(workers)
+    try:
+        for result in pool.imap_unordered(function, tasks):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
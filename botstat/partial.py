@@ -0,0 +1,91 @@
+"""Partial statistic of one node, merged by botstat merge into one report.
+
+A partial is JSON lines, gzip compressed if the file name ends with .gz.
+The first line is a header, every next line is a counter or top URLs row
+in the format of the state file:
+
+    {"format": "botstat-partial", "version": 1, "bucket": "day", "node": "web1"}
+    ["counter", "2018-06-25", "Google", "web1", 200, {"count": 2, ...}, [[bucket, count], ...]]
+    ["urls", "2018-06-25", "Google", "web1", 1000, [[count, error, url], ...]]
+
+Rows are sums, so partials merge in any order and grouping, merged
+partials are read line by line into one statistic.
+"""
+import os
+import gzip
+import json
+import socket
+from .aggregation import StatsStore
+from .heavy_hitters import SpaceSaving
+from .reader import open_log
+from .state import parse_key
+from .state import stats_to_rows
+from .state import urls_to_rows
+
+
+PARTIAL_FORMAT = "botstat-partial"
+PARTIAL_VERSION = 1
+
+
+def write_partial(path, stats, bucket, node=None):
+    header = {"format": PARTIAL_FORMAT, "version": PARTIAL_VERSION,
+              "bucket": bucket, "node": node or socket.gethostname()}
+    temp_path = path + ".tmp"
+    with (gzip.open(temp_path, "wt") if path.endswith(".gz") else open(temp_path, "w")) as fobj:
+        fobj.write(json.dumps(header) + "\n")
+        for row in stats_to_rows(stats):
+            fobj.write(json.dumps(["counter"] + row) + "\n")
+        for row in urls_to_rows(stats):
+            fobj.write(json.dumps(["urls"] + row) + "\n")
+    os.replace(temp_path, path)
+
+
+def read_partial_header(path, fobj):
+    try:
+        header = json.loads(fobj.readline())
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or header.get("format") != PARTIAL_FORMAT:
+        raise SystemExit("%s is not a botstat partial" % path)
+    if header.get("version") != PARTIAL_VERSION:
+        raise SystemExit("Partial %s has unsupported version %s" % (path, header.get("version")))
+    return header
+
+
+def merge_partial(stats, path, bucket=None):
+    """Add rows of the partial to stats, returns its bucket."""
+    with open_log(path) as fobj:
+        header = read_partial_header(path, fobj)
+        if bucket is not None and header["bucket"] != bucket:
+            raise SystemExit("Partial %s has %s buckets, other partials have %s buckets"
+                             % (path, header["bucket"], bucket))
+        # repeated keys are parsed once
+        dates = {}
+        add_counter = stats.add_counter
+        decode = json.JSONDecoder().decode
+        # the header is the first line
+        for line_number, line in enumerate(fobj, 2):
+            try:
+                row = decode(line)
+            except ValueError:
+                raise SystemExit("Partial %s has malformed line %d" % (path, line_number))
+            date = dates.get(row[1])
+            if date is None:
+                date = dates[row[1]] = parse_key(row[1])
+            if row[0] == "counter":
+                bot, host, status, counter, latency = row[2:]
+                add_counter(date, bot, host, status, counter, dict(latency))
+            elif row[0] == "urls":
+                bot, host, capacity, items = row[2:]
+                stats.merge_urls(date, bot, host, SpaceSaving(capacity).load(
+                    (count, error, url.encode("utf-8", "surrogateescape")) for count, error, url in items))
+    return header["bucket"]
+
+
+def merge_partials(paths, stats=None):
+    """(statistic, bucket) of all partials, bucket is None without partials."""
+    stats = StatsStore() if stats is None else stats
+    bucket = None
+    for path in paths:
+        bucket = merge_partial(stats, path, bucket)
+    return stats, bucket
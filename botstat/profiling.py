@@ -0,0 +1,216 @@
+import sys
+import json
+import time
+import logging
+import datetime
+from collections import Counter
+from collections import OrderedDict
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+PROGRESS_INTERVAL = 1.0
+# lines between checks of the clock for progress output, larger pieces
+# (parts of logs done by workers) are checked every time
+PROGRESS_CHECK_EVERY = 1024
+PROGRESS_CHECK_SIZE = 1 << 16
+_END = object()
+
+
+def peak_memory():
+    # bytes, the largest of the process and its workers
+    if resource is None:
+        return None
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+              resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def format_duration(seconds):
+    return str(datetime.timedelta(seconds=int(seconds)))
+
+
+class NullProfiler(object):
+    """Profiler interface doing nothing, used when profiling is off."""
+
+    @contextmanager
+    def stage(self, name):
+        yield
+
+    def iterate(self, name, iterable, count=None, size=None):
+        return iterable
+
+    def wrap(self, name, function):
+        return function
+
+    def count(self, name, value):
+        pass
+
+    def expect(self, total_bytes):
+        pass
+
+    def advance(self, size):
+        pass
+
+    def merge(self, other):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class Profiler(NullProfiler):
+    """Time and throughput of log processing stages.
+
+    Coarse stages (stats, report, mail) record wall and CPU time. Stages
+    run for every line (read, prefilter, parse, date, bot, aggregate)
+    record only wall time without time of nested stages, e.g. reading
+    of lines pulled by regex matching is not counted as parse time:
+    reading of the CPU clock costs about as much as processing a line.
+    """
+
+    def __init__(self, progress=False):
+        self.started = time.time()
+        self.cpu_started = time.process_time()
+        self.stages = OrderedDict()
+        self.breakdown = OrderedDict()
+        self.counters = Counter()
+        self.stack = []
+        self.total_bytes = None
+        self.done_bytes = 0
+        self.progress = progress
+        self.progress_shown = False
+        self.next_progress = self.started + PROGRESS_INTERVAL
+        self.items = 0
+
+    @contextmanager
+    def stage(self, name):
+        wall, cpu = time.time(), time.process_time()
+        try:
+            yield
+        finally:
+            stage = self.stages.setdefault(name, {"wall": 0.0, "cpu": 0.0})
+            stage["wall"] += time.time() - wall
+            stage["cpu"] += time.process_time() - cpu
+
+    def enter(self):
+        self.stack.append([time.perf_counter(), 0.0])
+
+    def exit(self, name):
+        started, nested = self.stack.pop()
+        elapsed = time.perf_counter() - started
+        stage = self.breakdown.get(name)
+        if stage is None:
+            stage = self.breakdown[name] = {"wall": 0.0, "calls": 0}
+        stage["wall"] += elapsed - nested
+        stage["calls"] += 1
+        if self.stack:
+            self.stack[-1][1] += elapsed
+
+    def iterate(self, name, iterable, count=None, size=None):
+        # name None only counts items
+        if name is None:
+            for item in iterable:
+                self.counters[count] += 1
+                yield item
+            return
+        iterator = iter(iterable)
+        while True:
+            self.enter()
+            try:
+                item = next(iterator, _END)
+            finally:
+                self.exit(name)
+            if item is _END:
+                return
+            if count is not None:
+                self.counters[count] += 1
+            if size is not None:
+                self.counters[size] += len(item)
+                self.advance(len(item))
+            yield item
+
+    def wrap(self, name, function):
+        def timed(*args):
+            self.enter()
+            try:
+                return function(*args)
+            finally:
+                self.exit(name)
+        return timed
+
+    def count(self, name, value):
+        self.counters[name] += value
+
+    def expect(self, total_bytes):
+        self.total_bytes = total_bytes
+
+    def advance(self, size):
+        self.done_bytes += size
+        self.items += 1
+        if self.progress and (self.items % PROGRESS_CHECK_EVERY == 0 or size >= PROGRESS_CHECK_SIZE):
+            now = time.time()
+            if now >= self.next_progress:
+                self.next_progress = now + PROGRESS_INTERVAL
+                self.show_progress(now)
+
+    def show_progress(self, now):
+        elapsed = now - self.started
+        rate = self.done_bytes / elapsed if elapsed else 0.0
+        text = "%.1f MB read, %.1f MB/s" % (self.done_bytes / 1e6, rate / 1e6)
+        if self.total_bytes and rate and self.done_bytes <= self.total_bytes:
+            text += ", %d%%, ETA %s" % (self.done_bytes * 100 // self.total_bytes,
+                                        format_duration((self.total_bytes - self.done_bytes) / rate))
+        if sys.stderr.isatty():
+            sys.stderr.write("\r%s\033[K" % text)
+        else:
+            sys.stderr.write(text + "\n")
+        sys.stderr.flush()
+        self.progress_shown = True
+
+    def finish_progress(self):
+        if self.progress_shown and sys.stderr.isatty():
+            sys.stderr.write("\n")
+
+    def merge(self, other):
+        # add stages of a worker process profiler
+        for name, stage in other.breakdown.items():
+            merged = self.breakdown.setdefault(name, {"wall": 0.0, "calls": 0})
+            merged["wall"] += stage["wall"]
+            merged["calls"] += stage["calls"]
+        self.counters.update(other.counters)
+        self.advance(other.done_bytes)
+
+    def summary(self):
+        wall = time.time() - self.started
+        counters = dict(self.counters)
+        lines_read = counters.get("lines_read", 0)
+        # lines dropped by --bot-prefilter are not parsed
+        parsed = counters.get("lines_prefiltered", lines_read)
+        counters["lines_unmatched"] = parsed - counters.get("lines_matched", 0)
+        counters.setdefault("bot_hits", 0)
+        stats_wall = self.stages.get("stats", {}).get("wall")
+        return {
+            "started": datetime.datetime.fromtimestamp(self.started).isoformat(),
+            "wall": wall,
+            "cpu": time.process_time() - self.cpu_started,
+            "peak_memory": peak_memory(),
+            "stages": self.stages,
+            "stats_breakdown": self.breakdown,
+            "counters": counters,
+            "lines_per_sec": lines_read / stats_wall if stats_wall else None,
+            "bytes_per_sec": counters.get("bytes_read", 0) / stats_wall if stats_wall else None,
+        }
+
+    def write(self, path):
+        self.finish_progress()
+        summary = self.summary()
+        for name, stage in summary["stages"].items():
+            logging.info("Stage %s: wall %.3f sec, cpu %.3f sec", name, stage["wall"], stage["cpu"])
+        for name, stage in summary["stats_breakdown"].items():
+            logging.info("Stats stage %s: wall %.3f sec, %d calls", name, stage["wall"], stage["calls"])
+        with open(path, "w") as fobj:
+            json.dump(summary, fobj, indent=2)
@@ -0,0 +1,70 @@
+import io
+import os
+import bz2
+import glob
+import gzip
+import logging
+import datetime
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+
+BLOCK_SIZE = 1 << 20
+
+COMPRESSED_LOG_OPENERS = {".gz": gzip.GzipFile, ".bz2": bz2.BZ2File}
+if lzma is not None:
+    COMPRESSED_LOG_OPENERS[".xz"] = lzma.LZMAFile
+
+
+def read_blocks(stream, limit=None, size=BLOCK_SIZE):
+    # Read stream by blocks of size, at most limit characters/bytes if set
+    while limit is None or limit > 0:
+        block = stream.read(size if limit is None else min(size, limit))
+        if not block:
+            break
+        if limit is not None:
+            limit -= len(block)
+        yield block
+
+
+def is_compressed(path):
+    return os.path.splitext(path)[1] in COMPRESSED_LOG_OPENERS
+
+
+def open_log(path, binary=False):
+    """Open plain or compressed log, decompression is streamed by blocks."""
+    opener = COMPRESSED_LOG_OPENERS.get(os.path.splitext(path)[1])
+    if opener is None:
+        return open(path, "rb", BLOCK_SIZE) if binary else open(path)
+    stream = io.BufferedReader(opener(path, "rb"), BLOCK_SIZE)
+    if binary:
+        return stream
+    return io.TextIOWrapper(stream)
+
+
+def expand_log_paths(patterns):
+    # Glob patterns to file names, a pattern without matches is kept as is
+    paths = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+
+def order_log_files(paths, date_start=None):
+    """Sort logs from the oldest to the newest by modification time.
+
+    A log modified before date_start has no records for the report
+    period, its mtime is the time of its last record.
+    """
+    ordered = []
+    for path in sorted(paths, key=os.path.getmtime):
+        modified = datetime.date.fromtimestamp(os.path.getmtime(path))
+        if date_start is not None and modified < date_start:
+            logging.info("Skip %s, last modified on %s", path, modified)
+            continue
+        ordered.append(path)
+    return ordered
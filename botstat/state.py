@@ -0,0 +1,119 @@
+import os
+import json
+import logging
+import datetime
+from .aggregation import StatsStore
+from .heavy_hitters import SpaceSaving
+
+
+STATE_VERSION = 2
+
+
+def complete_lines_end(path, begin, end):
+    # Offset after the last newline in [begin, end), a line which is still
+    # being written is left for the next run
+    with open(path, "rb") as stream:
+        position = end
+        while position > begin:
+            chunk_start = max(begin, position - 4096)
+            stream.seek(chunk_start)
+            newline = stream.read(position - chunk_start).rfind(b"\n")
+            if newline != -1:
+                return chunk_start + newline + 1
+            position = chunk_start
+    return begin
+
+
+def find_rotated_log(path, inode):
+    # Rotated file keeps inode of the log, look for it next to the log
+    directory = os.path.dirname(path) or "."
+    prefix = os.path.basename(path)
+    for name in sorted(os.listdir(directory)):
+        candidate = os.path.join(directory, name)
+        if name != prefix and name.startswith(prefix) and os.stat(candidate).st_ino == inode:
+            return candidate
+
+
+def plan_segments(path, log_state):
+    """Return list of (path, begin, end) byte ranges not processed yet."""
+    stat = os.stat(path)
+    offset = log_state["offset"]
+    if stat.st_ino == log_state["inode"] and stat.st_size >= offset:
+        return [(path, offset, complete_lines_end(path, offset, stat.st_size))]
+    segments = []
+    if stat.st_ino != log_state["inode"]:
+        rotated = find_rotated_log(path, log_state["inode"])
+        if rotated is None:
+            logging.warning("Log %s was rotated and rotated file is not found, "
+                            "records after offset %d are lost", path, offset)
+        else:
+            logging.info("Log %s was rotated to %s", path, rotated)
+            segments.append((rotated, offset, os.path.getsize(rotated)))
+    else:
+        logging.warning("Log %s was truncated, records after offset %d are lost", path, offset)
+    segments.append((path, 0, complete_lines_end(path, 0, stat.st_size)))
+    return segments
+
+
+def parse_key(text):
+    # date or start of a time bucket saved by isoformat
+    if "T" in text:
+        return datetime.datetime.strptime(text, "%Y-%m-%dT%H:%M:%S")
+    return datetime.datetime.strptime(text, "%Y-%m-%d").date()
+
+
+def stats_to_rows(stats):
+    # request times histogram is a list of [bucket, count] pairs
+    latencies = dict(((date, bot, host, status), histogram)
+                     for date, bot, host, status, histogram in stats.iter_latencies())
+    for date, bot, host, status, counter in stats.iter_counters():
+        histogram = latencies.get((date, bot, host, status), {})
+        yield [date.isoformat(), bot, host, status, dict(counter), sorted(histogram.items())]
+
+
+def rows_to_stats(rows):
+    stats = StatsStore()
+    for date, bot, host, status, counter, latency in rows:
+        date = parse_key(date)
+        stats.add_counter(date, bot, host, status, counter, dict(latency))
+    return stats
+
+
+def urls_to_rows(stats):
+    # undecoded URLs are kept as strings with surrogate escapes
+    for date, bot, host, urls in stats.iter_urls():
+        items = [[count, error, url.decode("utf-8", "surrogateescape") if isinstance(url, bytes) else url]
+                 for count, error, url in urls.items()]
+        yield [date.isoformat(), bot, host, urls.capacity, items]
+
+
+def rows_to_urls(stats, rows):
+    for date, bot, host, capacity, items in rows:
+        date = parse_key(date)
+        urls = SpaceSaving(capacity).load((count, error, url.encode("utf-8", "surrogateescape"))
+                                          for count, error, url in items)
+        stats.merge_urls(date, bot, host, urls)
+    return stats
+
+
+def load_state(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as fobj:
+        state = json.load(fobj)
+    if state.get("version") != STATE_VERSION:
+        logging.warning("State file %s has unsupported version, ignored", path)
+        return None
+    state["stats"] = rows_to_urls(rows_to_stats(state["stats"]), state.get("urls", []))
+    return state
+
+
+def save_state(path, log_state, stats):
+    state = {"version": STATE_VERSION,
+             "log": log_state,
+             "stats": list(stats_to_rows(stats)),
+             "urls": list(urls_to_rows(stats))}
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as fobj:
+        json.dump(state, fobj)
+    os.replace(temp_path, path)
@@ -0,0 +1,179 @@
+"""Receiver of access log lines sent by nginx access_log syslog: targets.
+
+Messages come as UDP datagrams or over TCP framed by octet counting or
+by newlines (RFC 6587), with RFC 3164 or RFC 5424 headers. Received
+messages wait in a bounded queue for the next batch: a datagram which
+does not fit is dropped and counted, a TCP connection stops reading
+until the queue is taken.
+"""
+import re
+import socket
+import asyncio
+import logging
+
+
+# messages kept until the next batch
+SYSLOG_QUEUE_SIZE = 100000
+MAX_MESSAGE_SIZE = 65536
+RECEIVE_BUFFER_SIZE = 8 << 20
+
+# datagrams read at once, the loop handles other events in between
+READ_BURST = 512
+
+# optional header before the log line:
+# <PRI>Mmm dd hh:mm:ss HOSTNAME TAG: MSG or
+# <PRI>1 TIMESTAMP HOSTNAME APP-NAME PROCID MSGID STRUCTURED-DATA MSG
+SYSLOG_HEADER = (br"(?:<\d{1,3}>(?:"
+                 br"[A-Z][a-z]{2} [ \d]\d \d\d:\d\d:\d\d (?P<syslog_host>\S+) [^ :\[]+(?:\[\d+\])?: ?|"
+                 br"1 \S+ (?P<syslog_host_5424>\S+) \S+ \S+ \S+ (?:-|(?:\[(?:[^\]\\]|\\.)*\])+) ?(?:\xef\xbb\xbf)?))?")
+SYSLOG_HOST_GROUPS = ("syslog_host", "syslog_host_5424")
+
+
+def syslog_regex(regex_parser):
+    """Binary log line regex which also matches and skips syslog header,
+    so a message is parsed by one match. Host name of the header is in
+    syslog_host or syslog_host_5424 group, "-" if unknown."""
+    return re.compile(SYSLOG_HEADER + regex_parser.pattern, regex_parser.flags)
+
+
+class SyslogQueue(object):
+    """Bounded list of received messages with counters."""
+
+    def __init__(self, size=SYSLOG_QUEUE_SIZE):
+        self.size = size
+        self.messages = []
+        self.received = 0
+        self.dropped = 0
+        # TCP transports paused until the queue is taken
+        self.paused = set()
+
+    def full(self):
+        return len(self.messages) >= self.size
+
+    def put(self, message):
+        self.received += 1
+        if len(self.messages) >= self.size:
+            self.dropped += 1
+            return False
+        self.messages.append(message)
+        return True
+
+    def take(self):
+        messages, self.messages = self.messages, []
+        for transport in self.paused:
+            if not transport.is_closing():
+                transport.resume_reading()
+        self.paused.clear()
+        return messages
+
+
+class SyslogStreamProtocol(asyncio.Protocol):
+    # octet counting "LEN MSG" or newline separated messages
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.buffer = b""
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        buffer = self.buffer + data
+        start = 0
+        while start < len(buffer):
+            if buffer[start:start + 1].isdigit():
+                space = buffer.find(b" ", start, start + 8)
+                if space == -1 or not buffer[start:space].isdigit():
+                    if len(buffer) - start >= 8:
+                        return self.framing_error()
+                    break
+                end = space + 1 + int(buffer[start:space])
+                if end - space > MAX_MESSAGE_SIZE:
+                    return self.framing_error()
+                if end > len(buffer):
+                    break
+                message, start = buffer[space + 1:end], end
+            else:
+                end = buffer.find(b"\n", start)
+                if end == -1:
+                    if len(buffer) - start > MAX_MESSAGE_SIZE:
+                        return self.framing_error()
+                    break
+                message, start = buffer[start:end], end + 1
+            if message.strip():
+                self.queue.put(message)
+        self.buffer = buffer[start:]
+        if self.queue.full() and self.transport not in self.queue.paused:
+            self.transport.pause_reading()
+            self.queue.paused.add(self.transport)
+
+    def framing_error(self):
+        logging.warning("Wrong syslog framing from %s, connection closed",
+                        self.transport.get_extra_info("peername"))
+        self.buffer = b""
+        self.transport.close()
+
+
+class SyslogReceiver(object):
+    """UDP and TCP syslog listeners on the same address.
+
+    Datagrams are read by a loop reader in bursts, which is several times
+    cheaper than a DatagramProtocol call per datagram.
+    """
+
+    def __init__(self, host=None, port=514, queue_size=SYSLOG_QUEUE_SIZE):
+        self.host = host
+        self.port = port
+        self.queue = SyslogQueue(queue_size)
+        self.sock = None
+        self.server = None
+        # messages which are not log lines of the log format
+        self.malformed = 0
+
+    async def start(self):
+        loop = asyncio.get_event_loop()
+        try:
+            self.server = await loop.create_server(lambda: SyslogStreamProtocol(self.queue), self.host, self.port)
+            if not self.port:
+                self.port = self.server.sockets[0].getsockname()[1]
+            self.sock = socket.socket(socket.AF_INET6 if ":" in (self.host or "") else socket.AF_INET,
+                                      socket.SOCK_DGRAM)
+            self.sock.bind((self.host or "", self.port))
+        except OSError as error:
+            self.close()
+            raise SystemExit("Syslog receiver can't listen on %s:%s: %s" % (self.host or "*", self.port, error))
+        try:
+            # bursts wait in the socket while a batch is processed
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_SIZE)
+        except OSError:
+            pass
+        self.sock.setblocking(False)
+        loop.add_reader(self.sock.fileno(), self.read_datagrams)
+        logging.info("Receiving syslog messages on %s:%d UDP and TCP", self.host or "*", self.port)
+        return self.port
+
+    def read_datagrams(self):
+        receive = self.sock.recv
+        put = self.queue.put
+        for i in range(READ_BURST):
+            try:
+                put(receive(MAX_MESSAGE_SIZE))
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as error:
+                logging.warning("Syslog receive error: %s", error)
+                return
+
+    def close(self):
+        if self.sock is not None:
+            asyncio.get_event_loop().remove_reader(self.sock.fileno())
+            self.sock.close()
+            self.sock = None
+        if self.server is not None:
+            self.server.close()
+
+    def counters(self):
+        return {"syslog_messages_received": self.queue.received,
+                "syslog_messages_dropped": self.queue.dropped,
+                "syslog_messages_malformed": self.malformed}
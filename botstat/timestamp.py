@@ -0,0 +1,125 @@
+import datetime
+from dateutil import parser
+
+
+# minutes in a time bucket of statistic, None for a day
+BUCKET_MINUTES = {"day": None, "hour": 60, "15m": 15, "5m": 5, "1m": 1}
+BUCKETS = ["day", "hour", "15m", "5m", "1m"]
+MONTHS = {"Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
+          "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12}
+
+
+class TimeLocalParser(object):
+    """Date parser for the 'time_local' log field.
+
+    Recognizes the nginx $time_local layout "10/Oct/2026:13:55:36 +0000"
+    and the apache %t layout "[10/Oct/2026:13:55:36 +0000]" directly,
+    remembering the last seen "dd/Mon/yyyy" prefix because consecutive
+    log lines almost always share a day. Unknown layouts go to dateutil.
+
+    parse_bucket returns the start of the time bucket of a record, the
+    date for day buckets, remembering the last "dd/Mon/yyyy:HH:MM" prefix
+    the same way.
+    """
+
+    def __init__(self, date_format=None, bucket=None):
+        self.date_format = date_format
+        self.minutes = BUCKET_MINUTES.get(bucket)
+        # hour buckets change with "dd/Mon/yyyy:HH", others with minutes
+        self._width = 14 if self.minutes == 60 else 17
+        self._prefix = None
+        self._date = None
+        self._bucket_prefix = None
+        self._bucket = None
+
+    def parse_date(self, value):
+        # value is str or undecoded bytes, bytes are decoded only when
+        # the day changes
+        if self.date_format:
+            if isinstance(value, bytes):
+                value = value.decode("utf-8", "replace")
+            return datetime.datetime.strptime(value, self.date_format).date()
+        start = 1 if value[:1] in ("[", b"[") else 0
+        prefix = value[start:start + 11]
+        if prefix == self._prefix:
+            return self._date
+        if isinstance(value, bytes):
+            value = value.decode("utf-8", "replace")
+        date = parse_clf_date(value[start:start + 11], value[start + 11:start + 12])
+        if date is None:
+            return parser.parse(value, fuzzy=True).date()
+        self._prefix = prefix
+        self._date = date
+        return date
+
+    def parse_bucket(self, value):
+        if self.minutes is None:
+            return self.parse_date(value)
+        if self.date_format:
+            if isinstance(value, bytes):
+                value = value.decode("utf-8", "replace")
+            return floor_time(datetime.datetime.strptime(value, self.date_format), self.minutes)
+        start = 1 if value[:1] in ("[", b"[") else 0
+        prefix = value[start:start + self._width]
+        if prefix == self._bucket_prefix:
+            return self._bucket
+        if isinstance(value, bytes):
+            value = value.decode("utf-8", "replace")
+        moment = parse_clf_bucket(value[start:start + 17], self.minutes)
+        if moment is None:
+            return floor_time(parser.parse(value, fuzzy=True), self.minutes)
+        self._bucket_prefix = prefix
+        self._bucket = moment
+        return moment
+
+
+def parse_clf_date(prefix, separator):
+    # "10/Oct/2026" followed by ":" as in common log format timestamps
+    if separator != ":" or prefix[2:3] != "/" or prefix[6:7] != "/":
+        return None
+    month = MONTHS.get(prefix[3:6])
+    if month is None:
+        return None
+    try:
+        return datetime.date(int(prefix[7:11]), month, int(prefix[0:2]))
+    except ValueError:
+        return None
+
+
+def parse_clf_bucket(text, minutes):
+    # "10/Oct/2026:13:55" to the start of its bucket of minutes
+    date = parse_clf_date(text[:11], text[11:12])
+    if date is None or text[14:15] != ":" or not (text[12:14] + text[15:17]).isdigit():
+        return None
+    minute = int(text[15:17])
+    try:
+        return datetime.datetime(date.year, date.month, date.day, int(text[12:14]), minute - minute % minutes)
+    except ValueError:
+        return None
+
+
+def is_clf_time(value):
+    # value starts with "dd/Mon/yyyy:HH:MM" or "[dd/Mon/yyyy:HH:MM"
+    start = 1 if value[:1] in ("[", b"[") else 0
+    text = value[start:start + 17]
+    if isinstance(text, bytes):
+        text = text.decode("utf-8", "replace")
+    return parse_clf_bucket(text, 1) is not None
+
+
+def floor_time(moment, minutes):
+    return moment.replace(minute=moment.minute - moment.minute % minutes, second=0, microsecond=0,
+                          tzinfo=None)
+
+
+def bucket_start(date, bucket):
+    # key of the first bucket of date, None for None
+    if date is None or BUCKET_MINUTES.get(bucket) is None:
+        return date
+    return datetime.datetime.combine(date, datetime.time())
+
+
+def format_bucket(key):
+    if isinstance(key, datetime.datetime):
+        return key.strftime("%Y/%m/%d %H:%M")
+    return key.strftime("%Y/%m/%d")
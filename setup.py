@@ -16,20 +16,28 @@ setup(
         'Environment :: Console',
         'Intended Audience :: Developers',
         'Intended Audience :: System Administrators',
-        'Programming Language :: Python :: 2',
-        'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
         'Programming Language :: Python :: 3.5',
         'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
     ],
     keywords='cli apache nginx system',
     packages=['botstat'],
+    python_requires='>=3.5',
     setup_requires=["pytest-runner"],
     tests_require=["pytest", "pytest-cov"],
     install_requires=['pyparsing', 'dateutils', 'ua-parser',
-                      'user-agents', 'apache-log-parser',
+                      'user-agents',
                       'ConfigArgParse'],
+    extras_require={
+        'numpy': ['numpy'],
+    },
     entry_points={
         'console_scripts': [
             'botstat = botstat.botstat:main',
@@ -0,0 +1,8 @@
+from botstat.botstat import parse_argumets
+
+
+def cli_args(*argv, **kwargs):
+    # defaults of the botstat command line, kwargs replace parsed values
+    args = parse_argumets(list(argv))
+    vars(args).update(kwargs)
+    return args
@@ -0,0 +1,157 @@
+import re
+import pickle
+import zipfile
+from collections import Counter
+from datetime import date
+from datetime import datetime
+import pytest
+from botstat.aggregation import StatsStore
+from botstat.botstat import stats_generator
+from botstat.botstat import write_xlsx_report
+from botstat.botstat import xlsx_sheet_name
+
+
+DAY = date(2018, 6, 25)
+NEXT_DAY = date(2018, 6, 26)
+
+
+def make_store():
+    stats = StatsStore()
+    stats.add(DAY, 'Google', 'localhost', 200, 100, 0.5)
+    stats.add(DAY, 'Google', 'localhost', 201, 200, 1.5)
+    stats.add(DAY, 'Google', 'localhost', 503, 0, 2.0)
+    stats.add(DAY, 'Bing', 'vhost', 301, 50, 0.25)
+    stats.add(NEXT_DAY, 'Google', 'localhost', 404, 10, 1.0)
+    return stats
+
+
+def test_mapping():
+    stats = make_store()
+    assert len(stats) == 2
+    assert list(stats) == [DAY, NEXT_DAY]
+    assert DAY in stats
+    assert stats[DAY]['Google']['localhost'] == {200: {'count': 2, 'bytes': 300, 'time': 2.0},
+                                                  500: {'count': 1, 'bytes': 0, 'time': 2.0}}
+    assert stats[NEXT_DAY] == {'Google': {'localhost': {400: {'count': 1, 'bytes': 10, 'time': 1.0}}}}
+    with pytest.raises(KeyError):
+        stats[date(2018, 6, 27)]
+
+
+def test_optional_fields():
+    stats = StatsStore()
+    stats.add(DAY, 'Google', 'localhost', 200)
+    assert stats[DAY]['Google']['localhost'][200] == {'count': 1}
+    stats.add(DAY, 'Google', 'localhost', 200, bytes_sent=5)
+    assert stats[DAY]['Google']['localhost'][200] == {'count': 2, 'bytes': 5}
+
+
+def test_interned_hosts():
+    stats = StatsStore()
+    stats.add(DAY, 'Google', ''.join(['local', 'host']), 200)
+    stats.add(NEXT_DAY, 'Google', ''.join(['local', 'host']), 200)
+    assert stats.row_keys[0][2] is stats.row_keys[1][2]
+
+
+def test_merge():
+    stats = make_store()
+    other = StatsStore()
+    other.add(DAY, 'Google', 'localhost', 200, 1, 1.0)
+    other.add(NEXT_DAY, 'Yandex', 'localhost', 200, 1, 1.0)
+    stats.merge(other)
+    assert stats[DAY]['Google']['localhost'][200] == {'count': 3, 'bytes': 301, 'time': 3.0}
+    assert stats[NEXT_DAY]['Yandex']['localhost'][200] == {'count': 1, 'bytes': 1, 'time': 1.0}
+
+
+def test_add_counter():
+    stats = StatsStore()
+    stats.add_counter(DAY, 'Google', 'localhost', 200, Counter(count=2, time=1.5))
+    assert stats == {DAY: {'Google': {'localhost': {200: {'count': 2, 'time': 1.5}}}}}
+
+
+def test_select():
+    stats = make_store().select(lambda key: key[0] >= NEXT_DAY)
+    assert list(stats) == [NEXT_DAY]
+    assert stats[NEXT_DAY]['Google']['localhost'][400] == {'count': 1, 'bytes': 10, 'time': 1.0}
+
+
+def test_pickle():
+    stats = make_store()
+    assert pickle.loads(pickle.dumps(stats)) == stats
+
+
+def test_stats_generator():
+    rows = list(stats_generator(make_store()))
+    assert rows[1][:8] == ['2018/06/25', 'Bing', 'vhost', 0, 1, 0, 0, 1]
+    assert rows[2] == ['2018/06/25', 'Google', 'localhost', 2, 0, 0, 1, 3, 1333, 1000,
+                       4.0, 2.0, 2.0, 0.29, 0.1, 0.15, 502, 1507, 1507, 0, 0, 0, 0, 0, 0, 1994, 1994, 1994]
+    assert len(rows) == 4
+    # percentiles of a status class are made of its request times only
+    assert rows[0][16:19] == ['P50 Time 2xx, ms', 'P90 Time 2xx, ms', 'P99 Time 2xx, ms']
+    assert rows[3][16:] == [0] * 6 + [990] * 3 + [0] * 3
+
+
+def test_sorted_rows():
+    stats = make_store()
+    stats.add(DAY, 'Bing', 'another', 200)
+    assert [stats.row_keys[row] for row in stats.sorted_rows()] == [
+        (DAY, 'Bing', 'another'), (DAY, 'Bing', 'vhost'),
+        (DAY, 'Google', 'localhost'), (NEXT_DAY, 'Google', 'localhost')]
+
+
+def test_stats_generator_no_time():
+    stats = StatsStore()
+    stats.add(DAY, 'Google', 'localhost', 200, 2048)
+    row = list(stats_generator(stats))[1]
+    assert row[8:19] == [0, 0, 0, 0, 0, 2.0, 2.0, 2.0, 0, 0, 0]
+
+
+def test_latency():
+    stats = make_store()
+    assert sum(stats.latency(0).values()) == 3
+    assert sum(stats.latency(0, [2]).values()) == 2
+    other = StatsStore()
+    other.add(DAY, 'Google', 'localhost', 200, 1, 1.5)
+    stats.merge(other)
+    assert sum(stats.latency(0).values()) == 4
+    selected = stats.select(lambda key: key[1] == 'Google')
+    assert selected.latency(0) == stats.latency(0)
+    assert selected != make_store().select(lambda key: key[1] == 'Google')
+
+
+def test_stats_generator_time_bucket():
+    stats = StatsStore()
+    stats.add(datetime(2018, 6, 25, 14, 5), 'Google', 'localhost', 200, 2048)
+    assert list(stats_generator(stats))[1][:3] == ['2018/06/25 14:05', 'Google', 'localhost']
+
+
+def test_xlsx_sheet_name():
+    used = set(['data'])
+    assert xlsx_sheet_name('Data', used) == 'Data (2)'
+    assert xlsx_sheet_name('Bot [a/b]?', used) == 'Bot _a_b__'
+    assert xlsx_sheet_name('x' * 40, used) == 'x' * 31
+    assert xlsx_sheet_name('X' * 40, used) == 'X' * 27 + ' (2)'
+
+
+def test_write_xlsx_report(tmp_path):
+    filename = str(tmp_path / 'report.xlsx')
+    write_xlsx_report(make_store(), filename)
+    with zipfile.ZipFile(filename) as workbook:
+        names = re.findall(r'<sheet name="([^"]+)"', workbook.read('xl/workbook.xml').decode())
+        assert names == ['Data', 'Charts', 'Bing', 'Google']
+        # rows of the bot sheet
+        google = workbook.read('xl/worksheets/sheet4.xml').decode()
+        assert re.findall(r'<row r="(\d+)"', google) == ['1', '2', '3']
+        assert len([name for name in workbook.namelist() if name.startswith('xl/charts/')]) == 12
+        chart = workbook.read('xl/charts/chart9.xml').decode()
+        assert 'Google!$D$2:$D$3' in chart
+
+
+def test_copy():
+    stats = make_store()
+    stats.add_url(DAY, 'Google', 'localhost', '/a', 4)
+    copied = stats.copy()
+    assert copied == stats
+    stats.add(DAY, 'Google', 'localhost', 200, 1, 0.5)
+    stats.add_url(DAY, 'Google', 'localhost', '/a', 4)
+    assert copied != stats
+    assert copied.urls[0].counts == {'/a': 1}
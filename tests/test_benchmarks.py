@@ -0,0 +1,77 @@
+import io
+import random
+from benchmarks.generate_log import LogGenerator
+from benchmarks.generate_log import draw
+from benchmarks.generate_log import parse_size
+from benchmarks.run import compare
+from benchmarks.run import parse_arguments
+from benchmarks.run import run
+from botstat.botstat import build_nginx_parser
+from botstat.botstat import make_stats
+from botstat.botstat import process_apache
+from . import cli_args
+
+
+def make_args(server_type, log_format):
+    return cli_args("--server-type", server_type, "--log-format", log_format)
+
+
+def test_parse_size():
+    assert parse_size("512") == 512
+    assert parse_size("2K") == 2048
+    assert parse_size("1.5M") == 3 << 19
+
+
+def test_draw():
+    population, cum_weights = list(range(5)), [1, 3, 3, 7, 8]
+    assert draw(random.Random(2), population, cum_weights, 100) == \
+        random.Random(2).choices(population, cum_weights=cum_weights, k=100)
+    assert draw(random.Random(2), population, k=100) == random.Random(2).choices(population, k=100)
+
+
+def test_generator_deterministic():
+    first, second = io.StringIO(), io.StringIO()
+    assert LogGenerator(seed=1).write(first, 50000) == LogGenerator(seed=1).write(second, 50000)
+    assert first.getvalue() == second.getvalue()
+    assert abs(len(first.getvalue()) - 50000) < 5000
+
+
+def test_generator_nginx_lines_match_format():
+    generator = LogGenerator(bot_ratio=0.5, user_agents=100, hosts=3, days=2)
+    regex_parser = build_nginx_parser(generator.log_format)
+    records = [regex_parser.match(line).groupdict() for line in generator.lines(2000)]
+    assert records[0]["time_local"] == "01/Jun/2018:00:00:00 +0000"
+    assert records[-1]["time_local"].startswith("02/Jun/2018:23:")
+    assert set(record["host"] for record in records) == set(generator.hosts)
+    args = make_args("nginx", generator.log_format)
+    stats = make_stats(iter(records), args)
+    bot_hits = sum(sum(row[3]) for row in stats.iter_rows())
+    assert 800 < bot_hits < 1200
+
+
+def test_generator_apache_lines_match_format(tmpdir):
+    generator = LogGenerator(server_type="apache", user_agents=10)
+    access_log = tmpdir.join("access.log")
+    with open(str(access_log), "w") as stream:
+        count = generator.write(stream, 2000)
+    args = make_args("apache", generator.log_format)
+    records = list(process_apache([str(access_log)], args))
+    assert len(records) == count
+    assert all(record["request_time"] < 10 for record in records)
+
+
+def test_run():
+    options = parse_arguments(["--size", "200K", "--benchmark", "stats",
+                               "--benchmark", "seek", "--benchmark", "csv"])
+    results = run(options)
+    assert [result["name"] for result in results] == ["stats", "seek", "csv"]
+    assert results[0]["count"] == options.lines
+    assert all(result["peak_rss"] > 0 for result in results)
+
+
+def test_compare():
+    baseline = {"results": [{"name": "parse", "rate": 100.0}, {"name": "stats", "rate": 100.0}]}
+    results = [{"name": "parse", "rate": 95.0}, {"name": "stats", "rate": 80.0},
+               {"name": "csv", "rate": 10.0}]
+    assert compare(results, baseline, 0.1) == ["stats"]
+    assert "change" not in results[2]
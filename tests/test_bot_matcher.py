@@ -0,0 +1,103 @@
+import re
+import pytest
+from botstat.bot_matcher import BotMatcher
+from botstat.bot_matcher import BotPrefilter
+from botstat.bot_matcher import cover_substrings
+from botstat.bot_matcher import parse_bot_definitions
+from botstat.bot_matcher import trie_pattern
+
+
+BOTS = [("Googlebot", "Google"),
+        ("Googlebot-Image", "Google Images"),
+        ("Bingbot", "Bing"),
+        ("Slurp", "Yahoo")]
+
+
+def test_trie_pattern():
+    regex = re.compile(trie_pattern(["bing", "bot", "botx"]))
+    assert regex.findall("botx bot bing bin") == ["botx", "bot", "bing"]
+
+
+def test_match_case_insensitive():
+    matcher = BotMatcher(BOTS)
+    user_agent = "Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)"
+    assert matcher.match(user_agent) == "Bing"
+
+
+def test_match_longest_token():
+    matcher = BotMatcher(BOTS)
+    assert matcher.match("Googlebot-Image/1.0") == "Google Images"
+    assert matcher.match("Googlebot/2.1 (+http://www.google.com/bot.html)") == "Google"
+
+
+def test_no_match():
+    matcher = BotMatcher(BOTS)
+    assert matcher.match("Mozilla/5.0 (X11; Linux x86_64)") is None
+    assert matcher.match("") is None
+
+
+def test_empty_bot_list():
+    matcher = BotMatcher([])
+    assert matcher.match("Googlebot") is None
+
+
+def test_parse_bot_definitions():
+    bots = list(parse_bot_definitions(["AhrefsBot=Ahrefs", " SemrushBot = Semrush ", "MJ12bot"]))
+    assert bots == [("AhrefsBot", "Ahrefs"), ("SemrushBot", "Semrush"), ("MJ12bot", "MJ12bot")]
+
+
+def test_parse_bot_definitions_no_token():
+    with pytest.raises(SystemExit):
+        list(parse_bot_definitions(["=Ahrefs"]))
+
+
+def test_cover_substrings():
+    tokens = ["googlebot", "bingbot", "yandexbot", "slurp"]
+    needles = cover_substrings(tokens)
+    assert needles == ["bot", "slurp"]
+    assert all(any(needle in token for needle in needles) for token in tokens)
+
+
+LINES = [u"1 Googlebot/2.1\n", u"2 Mozilla\n", u"3 SLURP\n", u"4 Chrome\n", u"5 bingbot\n", u"6 robot.txt\n"]
+
+
+@pytest.mark.parametrize("block_size", [1, 5, 16, 1000])
+def test_prefilter(block_size):
+    prefilter = BotPrefilter([token for token, name in BOTS])
+    text = u"".join(LINES)
+    blocks = [text[i:i + block_size] for i in range(0, len(text), block_size)]
+    assert list(prefilter.filter(blocks)) == [LINES[0], LINES[2], LINES[4], LINES[5]]
+
+
+def test_prefilter_bytes():
+    prefilter = BotPrefilter([token for token, name in BOTS])
+    text = u"".join(LINES).encode("utf-8")
+    assert list(prefilter.filter([text[:20], text[20:]])) == \
+        [LINES[0].encode(), LINES[2].encode(), LINES[4].encode(), LINES[5].encode()]
+
+
+def test_prefilter_no_trailing_newline():
+    prefilter = BotPrefilter(["Googlebot"])
+    assert list(prefilter.filter([u"1 Mozilla\n2 Goo", u"glebot"])) == [u"2 Googlebot"]
+
+
+def test_prefilter_lower_case_changes_length():
+    prefilter = BotPrefilter(["Googlebot"])
+    lines = list(prefilter.filter([u"İ Mozilla\n2 Googlebot\n"]))
+    assert u"2 Googlebot\n" in lines
+
+
+def test_prefilter_many_tokens():
+    tokens = ["bot%d" % i for i in range(100)] + ["crawler%s" % chr(97 + i) for i in range(26)] \
+        + ["%sspider" % chr(97 + i) for i in range(26)] + [chr(97 + i) * 4 for i in range(26)]
+    prefilter = BotPrefilter(tokens)
+    lines = [u"x BOT7\n", u"y Mozilla\n", u"z QQQQ\n", u"w qqq\n", u"v Zspider\n"]
+    assert list(prefilter.filter([u"".join(lines)])) == [lines[0], lines[2], lines[4]]
+    assert list(prefilter.filter([u"".join(lines).encode()])) == \
+        [lines[0].encode(), lines[2].encode(), lines[4].encode()]
+
+
+def test_match_bytes():
+    matcher = BotMatcher(BOTS)
+    assert matcher.match(b"Mozilla/5.0 (compatible; GOOGLEBOT-image/1.0) \xff") == "Google Images"
+    assert matcher.match(b"\xc3\xa9 Mozilla") is None
@@ -1,10 +1,15 @@
 from collections import namedtuple
 from datetime import date, timedelta
 from botstat.botstat import generate_start_date
+from botstat.botstat import build_nginx_parser
 from botstat.botstat import make_stats
+from botstat.botstat import parse_records
+from botstat.botstat import request_url
+from botstat.botstat import top_urls_generator
 
 
-Args = namedtuple("Args", ["date_start", "day_start", "date_format"])
+Args = namedtuple("Args", ["date_start", "day_start", "date_format", "bot", "top_urls", "top_urls_depth",
+                           "bucket", "engine"])
 # Make all fields are optional with default value None
 Args.__new__.__defaults__ = (None,) * len(Args._fields)
 
@@ -90,3 +95,56 @@ def test_make_stats_no_bytes_no_times():
     stats = make_stats(records, Args())
     assert len(stats) == 1
     assert stats[date(2018, 6, 25)]['Google']['localhost'][200] == {'count': 1}
+
+
+def test_make_stats_extra_bots():
+    header = ('time_local', 'host', 'status', 'http_user_agent')
+    rows = [('25/Jun/2018:14:06:24', 'localhost', '200', 'Mozilla/5.0 (compatible; AhrefsBot/7.0)'),
+            ('25/Jun/2018:14:06:25', 'localhost', '200', 'Mozilla/5.0 (compatible; bingbot/2.0)')]
+    records = (dict(zip(header, row)) for row in rows)
+    stats = make_stats(records, Args(bot=['AhrefsBot=Ahrefs']))
+    assert stats[date(2018, 6, 25)]['Ahrefs']['localhost'][200] == {'count': 1}
+    assert stats[date(2018, 6, 25)]['Bing']['localhost'][200] == {'count': 1}
+
+
+def test_make_stats_bytes_records():
+    header = ('time_local', 'host', 'status', 'body_bytes_sent', 'request_time', 'http_user_agent')
+    rows = [(b'25/Jun/2018:14:06:24', b'v\xc3\xa9host', b'200', b'-', b'0.5', b'Googlebot \xff\xfe'),
+            (b'25/Jun/2018:14:06:25', b'v\xc3\xa9host', b'200', b'100', b'1', b'\xffMozilla'),
+            (b'26/Jun/2018:14:06:25', b'bad\xffhost', b'404', b'100', b'1', b'BINGBOT')]
+    records = (dict(zip(header, row)) for row in rows)
+    stats = make_stats(records, Args())
+    assert stats[date(2018, 6, 25)]['Google'][u'v\xe9host'][200] == {'count': 1, 'bytes': 0, 'time': 0.5}
+    assert stats[date(2018, 6, 26)]['Bing'][u'bad�host'][400] == {'count': 1, 'bytes': 100, 'time': 1}
+
+
+def test_request_url():
+    assert request_url('GET /catalog/shoes/red?page=2 HTTP/1.1') == '/catalog/shoes/red?page=2'
+    assert request_url('GET /catalog/shoes/red?page=2 HTTP/1.1', 2) == '/catalog/shoes/'
+    assert request_url(b'GET /catalog?page=2 HTTP/1.1', 2) == b'/catalog'
+    assert request_url(b'GET / HTTP/1.1', 1) == b'/'
+    assert request_url('-') == '-'
+
+
+def test_make_stats_top_urls():
+    header = ('time_local', 'host', 'status', 'request', 'http_user_agent')
+    rows = [('25/Jun/2018:14:06:24', 'localhost', '200', 'GET /a/1 HTTP/1.1', 'Googlebot'),
+            ('25/Jun/2018:14:06:25', 'localhost', '200', 'GET /a/2 HTTP/1.1', 'Googlebot'),
+            ('26/Jun/2018:14:06:26', 'localhost', '200', 'GET /b/1 HTTP/1.1', 'Googlebot'),
+            ('26/Jun/2018:14:06:27', 'localhost', '200', 'GET /a/2 HTTP/1.1', 'Googlebot'),
+            ('26/Jun/2018:14:06:28', 'localhost', '200', 'GET /a/2 HTTP/1.1', 'Mozilla')]
+    stats = make_stats((dict(zip(header, row)) for row in rows), Args(top_urls=2))
+    assert list(top_urls_generator(stats, 2))[1:] == [['Google', 'localhost', 1, '/a/2', 2, 0],
+                                                      ['Google', 'localhost', 2, '/a/1', 1, 0]]
+    stats = make_stats((dict(zip(header, row)) for row in rows), Args(top_urls=2, top_urls_depth=1))
+    assert list(top_urls_generator(stats, 2))[1:] == [['Google', 'localhost', 1, '/a/', 3, 0],
+                                                      ['Google', 'localhost', 2, '/b/', 1, 0]]
+
+
+def test_parse_records_unmatched(caplog):
+    lines = ['1.1.1.1 - - [10/Oct/2026:13:55:36 +0000] "GET / HTTP/1.1" 200 1 "-" "Googlebot"\r\n',
+             '1.1.1.1 - - [10/Oct/2026:13:55:36 +0000] "GET / HTTP/1.1" 200 1 "-" "Googlebot" extra\n',
+             'broken\n']
+    records = list(parse_records(lines, build_nginx_parser("combined")))
+    assert [record["status"] for record in records] == ["200"]
+    assert "2 lines do not match the log format" in caplog.text
@@ -0,0 +1,52 @@
+import pytest
+from botstat.botstat import make_stats
+from botstat.botstat import process_apache
+from botstat.botstat import process_nginx
+from botstat.botstat import stats_generator
+from botstat.botstat import top_urls_generator
+from benchmarks.generate_log import LogGenerator
+from .test_parallel import make_args
+
+pytest.importorskip("numpy")
+
+
+def write_log(tmpdir, server_type):
+    generator = LogGenerator(server_type, user_agents=50, hosts=3, days=3)
+    access_log = tmpdir.join("access.log")
+    with open(str(access_log), "w") as stream:
+        generator.write(stream, 1 << 20)
+    return str(access_log), generator.log_format
+
+
+@pytest.mark.parametrize("server_type", ["nginx", "apache"])
+@pytest.mark.parametrize("options", [{}, {"date_start": "2018/06/02", "bucket": "15m"},
+                                     {"top_urls": 5, "top_urls_depth": 1, "bucket": "hour"}])
+def test_same_as_python_engine(tmpdir, server_type, options):
+    access_log, log_format = write_log(tmpdir, server_type)
+    process = process_apache if server_type == "apache" else process_nginx
+    args = make_args(server_type=server_type, log_format=log_format, workers=1, **options)
+    numpy_args = make_args(server_type=server_type, log_format=log_format, workers=1, engine="numpy", **options)
+    expected = make_stats(process([access_log], args), args)
+    stats = make_stats(process([access_log], numpy_args), numpy_args)
+    assert stats == expected
+    assert list(stats_generator(stats)) == list(stats_generator(expected))
+    assert list(top_urls_generator(stats, 5)) == list(top_urls_generator(expected, 5))
+
+
+def test_small_batches(tmpdir, monkeypatch):
+    access_log, log_format = write_log(tmpdir, "nginx")
+    monkeypatch.setattr("botstat.columnar.BATCH_SIZE", 1000)
+    args = make_args(log_format=log_format, workers=1)
+    expected = list(stats_generator(make_stats(process_nginx([access_log], args), args)))
+    numpy_args = make_args(log_format=log_format, workers=1, engine="numpy")
+    assert list(stats_generator(make_stats(process_nginx([access_log], numpy_args), numpy_args))) == expected
+
+
+def test_date_format(tmpdir):
+    access_log, log_format = write_log(tmpdir, "nginx")
+    for bucket in ("day", "hour"):
+        args = make_args(log_format=log_format, workers=1, bucket=bucket, date_format="%d/%b/%Y:%H:%M:%S %z")
+        numpy_args = make_args(log_format=log_format, workers=1, bucket=bucket, engine="numpy",
+                               date_format="%d/%b/%Y:%H:%M:%S %z")
+        expected = make_stats(process_nginx([access_log], args), args)
+        assert make_stats(process_nginx([access_log], numpy_args), numpy_args) == expected
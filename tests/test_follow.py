@@ -0,0 +1,119 @@
+import os
+import signal
+import threading
+from botstat import botstat
+from botstat.botstat import binary_regex
+from botstat.botstat import build_nginx_parser
+from botstat.botstat import follow_log
+from botstat.botstat import follow_stats
+from botstat.botstat import make_incremental_stats
+from botstat.botstat import new_stats
+from botstat.follow import FollowControl
+from botstat.follow import LogFollower
+from botstat.state import load_state
+from .test_state import full_stats
+from .test_state import make_args
+from .test_state import make_line
+
+
+def test_log_follower(tmpdir):
+    path = tmpdir.join("access.log")
+    path.write("123\n45")
+    follower = LogFollower(str(path))
+    assert follower.read() == b"123\n"
+    assert follower.read() == b""
+    assert follower.offset == 4
+    path.write("6\n789\n0", mode="a")
+    assert follower.read() == b"456\n789\n"
+    follower.close()
+
+
+def test_log_follower_rotated(tmpdir):
+    path = tmpdir.join("access.log")
+    path.write("1\n")
+    follower = LogFollower(str(path))
+    assert follower.read() == b"1\n"
+    path.write("2\n", mode="a")
+    path.rename(tmpdir.join("access.log.1"))
+    assert follower.read() == b"2\n"
+    assert follower.read() == b""
+    path.write("3\n")
+    assert follower.read() == b"3\n"
+    path.write("")
+    assert follower.read() == b""
+    path.write("4\n", mode="a")
+    assert follower.read() == b"4\n"
+    follower.close()
+
+
+def follow_in_thread(follower, args, flushes, publish=None):
+    # follow_log in a thread, flushed statistics are put in flushes
+    control = FollowControl()
+    flushed = threading.Event()
+
+    def flush(stats, follower, args):
+        flushes.append(stats.select(lambda key: True))
+        flushed.set()
+        return stats
+
+    def request_flush():
+        flushed.clear()
+        control.request_flush()
+        assert flushed.wait(10)
+
+    regex_parser = binary_regex(build_nginx_parser(args.log_format))
+    thread = threading.Thread(target=follow_log, args=(follower, new_stats(), args, regex_parser, control, flush, publish))
+    thread.start()
+    return control, thread, request_flush
+
+
+def test_follow_log(tmpdir, monkeypatch):
+    matchers = []
+    build = botstat.build_bot_matcher
+
+    def build_bot_matcher(args):
+        matchers.append(threading.current_thread())
+        return build(args)
+
+    monkeypatch.setattr("botstat.botstat.build_bot_matcher", build_bot_matcher)
+    args = make_args(tmpdir, flush_interval=3600)
+    path = tmpdir.join("access.log")
+    # lines are split on "\n" only, as lines of a log file
+    lines = [make_line(25, idx) for idx in range(9)] + [make_line(25, 9, "Googlebot\x0b\x1c\r")]
+    new_lines = [make_line(26, idx, "bingbot") for idx in range(10, 20)]
+    path.write(u"".join(lines) + new_lines[0][:20])
+    flushes = []
+    published = []
+    control, thread, request_flush = follow_in_thread(LogFollower(str(path)), args, flushes, published.append)
+    try:
+        request_flush()
+        assert flushes[-1] == full_stats(lines, args)
+        path.write(u"".join(new_lines)[20:], mode="a")
+        lines += new_lines
+        request_flush()
+        assert flushes[-1] == full_stats(lines, args)
+    finally:
+        control.stop()
+        thread.join()
+    assert len(flushes) == 2
+    # blocks are added by one aggregator, the matcher keeps its cache
+    assert matchers.count(thread) == 1
+    assert load_state(args.state_file) is None
+    assert published[0] == full_stats(lines[:10], args)
+    assert all(snapshot is not flushes[-1] for snapshot in published)
+
+
+def test_follow_stats_state(tmpdir):
+    args = make_args(tmpdir, flush_interval=3600, metrics_listen=None)
+    path = tmpdir.join("access.log")
+    lines = [make_line(25, idx) for idx in range(10)]
+    path.write(u"".join(lines))
+    timer = threading.Timer(0.5, os.kill, (os.getpid(), signal.SIGTERM))
+    timer.start()
+    stats = follow_stats([str(path)], args)
+    timer.join()
+    assert stats == full_stats(lines, args)
+    assert load_state(args.state_file)["log"]["offset"] == len(u"".join(lines))
+    lines += [make_line(26, idx, "bingbot") for idx in range(10, 20)]
+    path.write(u"".join(lines))
+    assert make_incremental_stats([str(path)], args) == full_stats(lines, args)
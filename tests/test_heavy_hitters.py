@@ -0,0 +1,46 @@
+import random
+from collections import Counter
+from botstat.heavy_hitters import SpaceSaving
+
+
+def zipf_stream(count, keys, seed):
+    rng = random.Random(seed)
+    weights = [1.0 / (i + 1) for i in range(keys)]
+    return rng.choices(["/page-%d" % i for i in range(keys)], weights=weights, k=count)
+
+
+def test_exact_below_capacity():
+    summary = SpaceSaving(10)
+    for key in "abracadabra":
+        summary.add(key)
+    assert summary.top(3) == [("a", 5, 0), ("b", 2, 0), ("r", 2, 0)]
+
+
+def test_bounded_and_overcount():
+    stream = zipf_stream(20000, 5000, 0)
+    exact = Counter(stream)
+    summary = SpaceSaving(100)
+    for key in stream:
+        summary.add(key)
+    assert len(summary.counts) == 100
+    assert sum(len(bucket) for bucket in summary.buckets.values()) == 100
+    for key, count, error in summary.top(100):
+        assert count - error <= exact[key] <= count
+    assert [key for key, count, error in summary.top(5)] == [key for key, count in exact.most_common(5)]
+
+
+def test_merge():
+    stream = zipf_stream(30000, 5000, 1)
+    exact = Counter(stream)
+    merged = SpaceSaving(100)
+    for part in range(3):
+        summary = SpaceSaving(100)
+        for key in stream[part::3]:
+            summary.add(key)
+        merged.merge(summary)
+    assert len(merged.counts) == 100
+    for key, count, error in merged.top(100):
+        assert count - error <= exact[key] <= count
+    assert [key for key, count, error in merged.top(5)] == [key for key, count in exact.most_common(5)]
+    merged.add("/new")
+    assert merged.counts["/new"] == merged.errors["/new"] + 1
@@ -0,0 +1,53 @@
+import random
+from botstat.histogram import BUCKETS
+from botstat.histogram import MAX_TIME
+from botstat.histogram import RELATIVE_ERROR
+from botstat.histogram import add_time
+from botstat.histogram import merge_histograms
+from botstat.histogram import percentiles
+from botstat.histogram import time_bucket
+
+
+def test_relative_error():
+    rng = random.Random(0)
+    for i in range(1000):
+        seconds = rng.lognormvariate(-2, 2)
+        histogram = {}
+        add_time(histogram, seconds)
+        assert abs(percentiles(histogram, [0.5])[0] - seconds) <= seconds * RELATIVE_ERROR
+
+
+def test_bounded_buckets():
+    assert time_bucket(0) == 0
+    assert time_bucket(MAX_TIME * 10) == BUCKETS - 1
+    histogram = {}
+    for i in range(100000):
+        add_time(histogram, i / 1000.0)
+    assert len(histogram) < BUCKETS
+
+
+def test_percentiles():
+    histogram = {}
+    for i in range(1, 101):
+        add_time(histogram, i / 100.0)
+    p50, p90, p99 = percentiles(histogram)
+    assert abs(p50 - 0.5) <= 0.5 * RELATIVE_ERROR
+    assert abs(p90 - 0.9) <= 0.9 * RELATIVE_ERROR
+    assert abs(p99 - 0.99) <= 0.99 * RELATIVE_ERROR
+    assert percentiles({}) == [None, None, None]
+    assert percentiles({0: 3}) == [0.0, 0.0, 0.0]
+
+
+def test_merge_is_exact():
+    rng = random.Random(1)
+    times = [rng.expovariate(10) for i in range(10000)]
+    whole = {}
+    parts = [{}, {}, {}]
+    for i, seconds in enumerate(times):
+        add_time(whole, seconds)
+        add_time(parts[i % 3], seconds)
+    merged = {}
+    for part in reversed(parts):
+        merge_histograms(merged, part)
+    assert merged == whole
+    assert percentiles(merged) == percentiles(whole)
@@ -0,0 +1,121 @@
+import sqlite3
+from datetime import date
+from datetime import datetime
+import pytest
+from botstat.aggregation import StatsStore
+from botstat.botstat import main
+from botstat.history import load_history
+from botstat.history import save_history
+from botstat.partial import merge_partials
+from .test_state import make_line
+
+
+def make_store(day, count):
+    stats = StatsStore()
+    for idx in range(count):
+        stats.add(day, "Google", "localhost", 200, 100, 0.25)
+    stats.add(day, "Bing", "localhost", 404, 50, 1.5)
+    return stats
+
+
+def test_save_load_history(tmpdir):
+    path = str(tmpdir.join("history.db"))
+    days = [date(2018, 6, 24), date(2018, 6, 25), date(2018, 6, 26)]
+    for day in days:
+        assert save_history(path, make_store(day, 2), "day") == 2
+    stats = load_history(path, "day")
+    expected = StatsStore()
+    for day in days:
+        expected.merge(make_store(day, 2))
+    assert stats == expected
+    assert sorted(stats.iter_latencies()) == sorted(expected.iter_latencies())
+    assert sorted(load_history(path, "day", days[1], days[1])) == [days[1]]
+    assert sorted(load_history(path, "day", days[1])) == days[1:]
+    # the newer statistic of a date replaces the stored one
+    save_history(path, make_store(days[1], 3), "day")
+    assert load_history(path, "day", days[1], days[1]) == make_store(days[1], 3)
+    assert sqlite3.connect(path).execute("SELECT count(*) FROM counters").fetchone() == (6,)
+
+
+def test_history_bucket(tmpdir):
+    path = str(tmpdir.join("history.db"))
+    stats = make_store(datetime(2018, 6, 25, 23), 1)
+    save_history(path, stats, "hour")
+    assert load_history(path, "hour", date(2018, 6, 25), date(2018, 6, 25)) == stats
+    assert len(load_history(path, "hour", date(2018, 6, 26))) == 0
+    with pytest.raises(SystemExit, match="keeps hour buckets"):
+        save_history(path, stats, "day")
+
+
+def test_main_history(tmpdir):
+    path = str(tmpdir.join("history.db"))
+    output = str(tmpdir.join("report.jsonl"))
+    for day in (24, 25):
+        log = tmpdir.join("access-%d.log" % day)
+        log.write(u"".join(make_line(day, idx) for idx in range(day - 20)))
+        main(["--access-log", str(log), "--log-format", "combined", "--history-db", path, "--partial-output", output])
+        assert sorted(merge_partials([output])[0]) == [date(2018, 6, day)]
+    main(["--access-log", str(log), "--log-format", "combined", "--history-db", path,
+          "--partial-output", output, "--history-start", "2018-06-24", "--history-end", "2018-06-25"])
+    stats = merge_partials([output])[0]
+    assert [sum(counters[200]["count"] for counters in stats[date(2018, 6, day)]["Google"].values())
+            for day in (24, 25)] == [4, 5]
+
+
+def test_history_partial_date(tmpdir):
+    path = str(tmpdir.join("history.db"))
+    days = [date(2018, 6, 24), date(2018, 6, 25)]
+    save_history(path, make_store(days[0], 3), "day")
+    stats = make_store(days[0], 1)
+    stats.merge(make_store(days[1], 2))
+    # the stored first date with more hits is kept, a new one is stored
+    assert save_history(path, stats, "day", days) == 2
+    assert load_history(path, "day", days[0], days[0]) == make_store(days[0], 3)
+    assert load_history(path, "day", days[1], days[1]) == make_store(days[1], 2)
+    # more hits of the date, as the next flush of --follow, replace it
+    save_history(path, make_store(days[1], 4), "day", days[1:])
+    assert load_history(path, "day", days[1], days[1]) == make_store(days[1], 4)
+
+
+def test_main_history_rotated(tmpdir):
+    path = str(tmpdir.join("history.db"))
+    output = str(tmpdir.join("report.jsonl"))
+    log = tmpdir.join("access.log")
+    log.write(u"".join(make_line(24, idx) for idx in range(6)))
+    main(["--access-log", str(log), "--log-format", "combined", "--history-db", path, "--partial-output", output])
+    # the log rotated in the middle of the day keeps its end only
+    log.write(u"".join(make_line(24, idx) for idx in range(2)) + u"".join(make_line(25, idx) for idx in range(3)))
+    main(["--access-log", str(log), "--log-format", "combined", "--history-db", path, "--partial-output", output,
+          "--history-start", "2018-06-24", "--history-end", "2018-06-25"])
+    stats = merge_partials([output])[0]
+    assert [sum(counters[200]["count"] for counters in stats[date(2018, 6, day)]["Google"].values())
+            for day in (24, 25)] == [6, 3]
+
+
+def day_lines(day, count, hour=14):
+    return u"".join(make_line(day, idx).replace(":14:06:", ":%02d:00:" % hour) for idx in range(count))
+
+
+def history_counts(path, output, days):
+    main(["--access-log", str(output.dirpath("access.log")), "--log-format", "combined", "--history-db", path,
+          "--partial-output", str(output), "--history-start", "2018-06-24", "--history-end", "2018-06-26"])
+    stats = merge_partials([str(output)])[0]
+    return [sum(counters[200]["count"] for counters in stats[date(2018, 6, day)]["Google"].values())
+            for day in days]
+
+
+def test_main_history_cron(tmpdir):
+    path = str(tmpdir.join("history.db"))
+    output = tmpdir.join("report.jsonl")
+    log = tmpdir.join("access.log")
+    # daily runs from the start of the previous day
+    log.write(day_lines(24, 24) + day_lines(25, 1))
+    main(["--access-log", str(log), "--log-format", "combined", "--history-db", path,
+          "--partial-output", str(output), "--date-start", "2018-06-24"])
+    log.write(day_lines(25, 24) + day_lines(26, 1))
+    main(["--access-log", str(log), "--log-format", "combined", "--history-db", path,
+          "--partial-output", str(output), "--date-start", "2018-06-25"])
+    assert history_counts(path, output, (24, 25, 26)) == [24, 24, 1]
+    # a log starting with the beginning of the day replaces it
+    log.write(day_lines(26, 3, hour=0))
+    assert history_counts(path, output, (26,)) == [3]
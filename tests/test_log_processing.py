@@ -1,7 +1,12 @@
 import pytest
 import re
+from argparse import Namespace
 from botstat.log_processing import check_regex_required_fields
 from botstat.log_processing import build_log_format_regex
+from botstat.log_processing import build_apache_log_format_regex
+from botstat.log_processing import detect_log_configs
+from botstat.log_processing import detect_syslog_log_format
+from botstat.log_processing import DEFAULT_APACHE_LOG_FORMAT
 from botstat.log_processing import LOG_FORMATS
 from botstat.log_processing import extract_access_logs
 from botstat.log_processing import extract_log_format
@@ -24,20 +29,75 @@ def test_check_regex_required_fields_pass():
 
 def test_build_log_format_regex_combined():
     expression = build_log_format_regex(LOG_FORMATS['combined'])
-    pattern = re.compile(r'(?P<remote_addr>.*) - (?P<remote_user>.*) \[(?P<time_local>.*)\] '
-                         r'"(?P<request>.*)" (?P<status>.*) (?P<body_bytes_sent>.*) '
-                         r'"(?P<http_referer>.*)" "(?P<http_user_agent>.*)"')
+    pattern = re.compile(r'(?P<remote_addr>\S+) - (?P<remote_user>\S+) \[(?P<time_local>[^\]]*)\] '
+                         r'"(?P<request>[^"]*)" (?P<status>\d{3}) (?P<body_bytes_sent>\d+|-) '
+                         r'"(?P<http_referer>[^"]*)" "(?P<http_user_agent>[^"]*)"\r?$')
     assert expression == pattern
 
 
 def test_build_log_format_regex_common():
     expression = build_log_format_regex(LOG_FORMATS['common'])
-    pattern = re.compile(r'(?P<remote_addr>.*) - (?P<remote_user>.*) \[(?P<time_local>.*)\] '
-                         r'"(?P<request>.*)" (?P<status>.*) (?P<body_bytes_sent>.*) '
-                         r'"(?P<http_x_forwarded_for>.*)"')
+    pattern = re.compile(r'(?P<remote_addr>\S+) - (?P<remote_user>\S+) \[(?P<time_local>[^\]]*)\] '
+                         r'"(?P<request>[^"]*)" (?P<status>\d{3}) (?P<body_bytes_sent>\d+|-) '
+                         r'"(?P<http_x_forwarded_for>[^"]*)"\r?$')
     assert expression == pattern
 
 
+def test_build_log_format_regex_custom():
+    expression = build_log_format_regex('$remote_addr $host $remote_user [$time_local] "$request" '
+                                        '$status $body_bytes_sent "$http_referer" '
+                                        '"$http_user_agent" $request_time -$http_x_forwarded_for-')
+    line = ('66.249.66.1 example.com - [10/Oct/2026:13:55:36 +0000] "GET /a?b=c HTTP/1.1" '
+            '200 5120 "-" "Mozilla/5.0 (compatible; Googlebot/2.1)" 0.005 ---\n')
+    assert expression.match(line).groupdict() == {
+        'remote_addr': '66.249.66.1', 'host': 'example.com', 'remote_user': '-',
+        'time_local': '10/Oct/2026:13:55:36 +0000', 'request': 'GET /a?b=c HTTP/1.1',
+        'status': '200', 'body_bytes_sent': '5120', 'http_referer': '-',
+        'http_user_agent': 'Mozilla/5.0 (compatible; Googlebot/2.1)',
+        'request_time': '0.005', 'http_x_forwarded_for': '-'}
+
+
+def test_build_log_format_regex_not_matched():
+    expression = build_log_format_regex('combined')
+    assert expression.match('1.1.1.1 - - [10/Oct/2026:13:55:36 +0000] "GET / HTTP/1.1" 2OO 1 "-" "-"\n') is None
+    assert expression.match('1.1.1.1 - - [10/Oct/2026:13:55:36 +0000] "GET / HTTP/1.1" 200 1 "-"\n') is None
+
+
+def test_build_log_format_regex_crlf():
+    expression = build_log_format_regex('$remote_addr [$time_local] $status $request_time')
+    assert expression.match('1.1.1.1 [10/Oct/2026:13:55:36 +0000] 200 0.005\r\n').groupdict() == {
+        'remote_addr': '1.1.1.1', 'time_local': '10/Oct/2026:13:55:36 +0000',
+        'status': '200', 'request_time': '0.005'}
+    expression = build_apache_log_format_regex(DEFAULT_APACHE_LOG_FORMAT)
+    assert expression.match('1.1.1.1 - - [10/Oct/2026:13:55:36 +0000] "GET / HTTP/1.1" 200 1 "-" "-"\r\n')
+
+
+def test_build_apache_log_format_regex_default():
+    expression = build_apache_log_format_regex(DEFAULT_APACHE_LOG_FORMAT)
+    line = ('66.249.66.1 - frank [10/Oct/2026:13:55:36 -0700] "GET /a\\"b\\" HTTP/1.1" 200 - '
+            '"http://example.com/" "Mozilla/5.0 (compatible; Googlebot/2.1)"\n')
+    assert expression.match(line).groupdict() == {
+        'time_local': '10/Oct/2026:13:55:36 -0700', 'request': 'GET /a\\"b\\" HTTP/1.1', 'status': '200',
+        'body_bytes_sent': '-', 'http_user_agent': 'Mozilla/5.0 (compatible; Googlebot/2.1)'}
+
+
+def test_build_apache_log_format_regex_preferred_fields():
+    expression = build_apache_log_format_regex('%h %V %v %s %>s %B %b %T %D %{ms}T '
+                                               '"%{Host}i" "%{User-Agent}i" %t 100%%')
+    line = ('1.1.1.1 alias.example.com example.com 302 200 0 - 1 1500000 1500 '
+            '"alias.example.com" "bingbot" [10/Oct/2026:13:55:36 +0000] 100%\n')
+    assert expression.match(line).groupdict() == {
+        'host': 'example.com', 'status': '200', 'body_bytes_sent': '-', 'request_time_us': '1500000',
+        'http_user_agent': 'bingbot', 'time_local': '10/Oct/2026:13:55:36 +0000'}
+
+
+def test_build_apache_log_format_regex_custom_time():
+    expression = build_apache_log_format_regex('%400,501{User-agent}i [%{%d/%b/%Y %T}t] %>s %{ms}T')
+    assert expression.match('Googlebot [10/Oct/2026 13:55:36] 404 15\n').groupdict() == {
+        'http_user_agent': 'Googlebot', 'time_local': '10/Oct/2026 13:55:36',
+        'status': '404', 'request_time_ms': '15'}
+
+
 def test_extract_access_logs_format_name():
     config = '''
         http {
@@ -82,3 +142,41 @@ http {
     assert logs['main'] == '$remote_addr $host $remote_user [$time_local] ' \
                            '"$request" $status $body_bytes_sent "$http_referer" ' \
                            '"$http_user_agent" $request_time -$http_x_forwarded_for-'
+
+
+def test_detect_log_configs(tmpdir):
+    config = tmpdir.join("nginx.conf")
+    config.write(u'''
+http {
+  log_format main '$remote_addr $host [$time_local] "$request" $status "$http_user_agent"';
+  access_log /var/log/nginx/access.log main;
+  server {
+    access_log /var/log/nginx/vhost.log;
+  }
+}''')
+    configs = detect_log_configs(Namespace(nginx_config=str(config)))
+    assert configs == [
+        ('/var/log/nginx/access.log', '$remote_addr $host [$time_local] "$request" $status "$http_user_agent"'),
+        ('/var/log/nginx/vhost.log', LOG_FORMATS['combined'])]
+    config.write(u'access_log /var/log/nginx/access.log unknown;')
+    with pytest.raises(SystemExit):
+        detect_log_configs(Namespace(nginx_config=str(config)))
+
+
+def test_detect_syslog_log_format(tmpdir):
+    config = tmpdir.join("nginx.conf")
+    config.write(u'''
+http {
+  log_format main '$remote_addr $host [$time_local] "$request" $status "$http_user_agent"';
+  access_log /var/log/nginx/access.log;
+  access_log syslog:server=10.0.0.1:514,tag=nginx main;
+}''')
+    assert dict(extract_access_logs(config.read(), syslog=True)) == {'syslog:server=10.0.0.1:514,tag=nginx': 'main'}
+    assert detect_syslog_log_format(Namespace(nginx_config=str(config))) == \
+        '$remote_addr $host [$time_local] "$request" $status "$http_user_agent"'
+    config.write(u'access_log syslog:server=10.0.0.1 main; access_log syslog:server=10.0.0.2;')
+    with pytest.raises(SystemExit):
+        detect_syslog_log_format(Namespace(nginx_config=str(config)))
+    config.write(u'access_log /var/log/nginx/access.log;')
+    with pytest.raises(SystemExit):
+        detect_syslog_log_format(Namespace(nginx_config=str(config)))
@@ -0,0 +1,129 @@
+import io
+import gzip
+import zipfile
+import threading
+import socketserver
+from argparse import Namespace
+from email import message_from_bytes
+from tempfile import TemporaryFile
+import pytest
+from botstat.botstat import main
+from botstat.mail import send_mail
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    # just enough SMTP to accept messages, refuses nobody@ recipients
+
+    def reply(self, line):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 localhost")
+        message = None
+        for line in self.rfile:
+            command = line.strip().decode("ascii", "replace").upper()
+            if message is not None:
+                if line == b".\r\n":
+                    self.server.messages.append((recipient, b"".join(message)))
+                    message = None
+                    self.reply("250 OK")
+                else:
+                    message.append(line[1:] if line.startswith(b"..") else line)
+            elif command.startswith(("EHLO", "HELO")):
+                self.reply("250 localhost")
+            elif command.startswith("RCPT"):
+                recipient = line.decode("ascii").split(":", 1)[1].strip().strip("<>")
+                self.reply("550 No such user" if recipient.startswith("nobody@") else "250 OK")
+            elif command == "DATA":
+                message = []
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+@pytest.fixture
+def smtp_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), SMTPHandler)
+    server.daemon_threads = True
+    server.connections = 0
+    server.messages = []
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def mail_args(server, mail_to, compress=None):
+    return Namespace(mail_from="botstat@localhost", mail_to=mail_to, mail_subject="Bot statistics",
+                     smtp_host="127.0.0.1", smtp_port=server.server_address[1], mail_compress=compress)
+
+
+def report_stream(content):
+    stream = TemporaryFile(mode="w+")
+    stream.write(content)
+    stream.flush()
+    stream.seek(0)
+    return stream
+
+
+def attachment(message):
+    part = message.get_payload()[1]
+    return part.get_filename(), part.get_payload(decode=True)
+
+
+def test_send_mail_recipients(smtp_server):
+    content = "Date,Bot\n" + "2018/06/25,Google\n" * 10000
+    with report_stream(content) as stream:
+        send_mail(".hidden\nSearch bot statistics", [(stream, "report.csv")],
+                  mail_args(smtp_server, "first@localhost, second@localhost"))
+    assert smtp_server.connections == 1
+    assert [recipient for recipient, data in smtp_server.messages] == ["first@localhost", "second@localhost"]
+    message = message_from_bytes(smtp_server.messages[1][1])
+    assert message["To"] == "second@localhost"
+    assert message["Subject"] == "Bot statistics"
+    assert message.get_payload()[0].get_payload().splitlines() == [".hidden", "Search bot statistics"]
+    assert attachment(message) == ("report.csv", content.encode())
+
+
+@pytest.mark.parametrize("compress", ["gzip", "zip"])
+def test_send_mail_compressed(smtp_server, compress):
+    content = "Date,Bot\n" + "2018/06/25,Google\n" * 1000
+    with report_stream(content) as stream:
+        send_mail("Search bot statistics", [(stream, "report.csv")],
+                  mail_args(smtp_server, "first@localhost", compress))
+    filename, data = attachment(message_from_bytes(smtp_server.messages[0][1]))
+    if compress == "gzip":
+        assert filename == "report.csv.gz"
+        assert gzip.decompress(data) == content.encode()
+    else:
+        assert filename == "report.csv.zip"
+        assert zipfile.ZipFile(io.BytesIO(data)).read("report.csv") == content.encode()
+
+
+def test_send_mail_refused(smtp_server):
+    with report_stream("Date,Bot\n") as stream:
+        with pytest.raises(SystemExit):
+            send_mail("Search bot statistics", [(stream, "report.csv")],
+                      mail_args(smtp_server, "nobody@localhost,first@localhost"))
+    assert [recipient for recipient, data in smtp_server.messages] == ["first@localhost"]
+
+
+@pytest.mark.parametrize("mail_to", [None, " , "])
+def test_send_mail_no_recipients(smtp_server, mail_to):
+    with report_stream("Date,Bot\n") as stream:
+        with pytest.raises(SystemExit, match="use --mail-to"):
+            send_mail("Search bot statistics", [(stream, "report.csv")], mail_args(smtp_server, mail_to))
+    assert smtp_server.connections == 0
+
+
+def test_main_no_recipients(tmpdir):
+    log = tmpdir.join("access.log")
+    log.write("")
+    with pytest.raises(SystemExit, match="use --mail-to"):
+        main(["--access-log", str(log), "--log-format", "combined"])
@@ -0,0 +1,107 @@
+import json
+import time
+import argparse
+from datetime import date
+from http.client import HTTPConnection
+import pytest
+from botstat.aggregation import StatsStore
+from botstat.metrics import MetricsServer
+from botstat.metrics import parse_listen_address
+from botstat.metrics import render_json
+from botstat.metrics import render_prometheus
+
+
+DAY = date(2018, 6, 25)
+
+
+def make_store():
+    stats = StatsStore()
+    stats.add(DAY, 'Google', 'localhost', 200, 100, 0.5)
+    stats.add(DAY, 'Google', 'localhost', 201, 200, 1.5)
+    stats.add(DAY, 'Bing', 'v"host', 404, 50, 200000.0)
+    return stats
+
+
+def test_parse_listen_address():
+    assert parse_listen_address("127.0.0.1:9180") == ("127.0.0.1", 9180)
+    assert parse_listen_address(":9180") == (None, 9180)
+    assert parse_listen_address("[::1]:9180") == ("::1", 9180)
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_listen_address("9180")
+
+
+def test_render_prometheus():
+    lines = render_prometheus(make_store()).decode().splitlines()
+    labels = 'date="2018/06/25",bot="Google",host="localhost",status="2xx"'
+    assert "# TYPE botstat_requests_total counter" in lines
+    assert "botstat_requests_total{%s} 2" % labels in lines
+    assert "botstat_response_bytes_total{%s} 300" % labels in lines
+    assert "botstat_request_time_seconds_total{%s} 2.0" % labels in lines
+    buckets = [line for line in lines if line.startswith("botstat_request_time_seconds_bucket{%s" % labels)]
+    assert [line.rsplit(" ", 1)[1] for line in buckets] == ["1", "2", "2"]
+    assert buckets[-1] == 'botstat_request_time_seconds_bucket{%s,le="+Inf"} 2' % labels
+    # times above the largest bucket are counted in +Inf only
+    bing = [line for line in lines if 'host="v\\"host"' in line and "_bucket" in line]
+    assert bing == ['botstat_request_time_seconds_bucket{date="2018/06/25",bot="Bing",host="v\\"host",'
+                    'status="4xx",le="+Inf"} 1']
+
+
+def test_render_json():
+    rows = json.loads(render_json(make_store()).decode())["rows"]
+    assert rows[0]["bot"] == "Google"
+    assert (rows[0]["count"], rows[0]["bytes"], rows[0]["time"]) == (2, 300, 2.0)
+    assert [count for bound, count in rows[0]["latency"]] == [1, 1]
+    assert rows[1]["latency"] == [[None, 1]]
+
+
+def get(port, path, connection=None):
+    connection = connection or HTTPConnection("127.0.0.1", port, timeout=10)
+    connection.request("GET", path)
+    response = connection.getresponse()
+    return response.status, response.getheader("Content-Type"), response.read()
+
+
+def get_rendered(port, path, connection, previous):
+    # the previous body is served until the published snapshot is rendered
+    for attempt in range(500):
+        status, content_type, body = get(port, path, connection)
+        if body != previous:
+            return status, content_type, body
+        time.sleep(0.01)
+    raise AssertionError("%s is not rendered" % path)
+
+
+def test_metrics_server():
+    server = MetricsServer("127.0.0.1", 0)
+    port = server.start()
+    try:
+        status, content_type, body = get(port, "/metrics")
+        assert (status, body) == (200, b"\n")
+        stats = make_store()
+        server.publish(stats.copy())
+        connection = HTTPConnection("127.0.0.1", port, timeout=10)
+        status, content_type, body = get_rendered(port, "/metrics", connection, b"\n")
+        assert content_type.startswith("text/plain")
+        assert body == render_prometheus(stats)
+        # ingest changes its own store, not the published copy
+        stats.add(DAY, 'Google', 'localhost', 200, 1, 0.5)
+        status, content_type, body = get(port, "/metrics.json?pretty", connection)
+        assert (status, content_type) == (200, "application/json")
+        assert json.loads(body.decode())["rows"][0]["count"] == 2
+        server.publish(stats.copy())
+        body = get_rendered(port, "/metrics.json", connection, body)[2]
+        assert json.loads(body.decode())["rows"][0]["count"] == 3
+        assert get(port, "/missing", connection)[0] == 404
+        connection.close()
+    finally:
+        server.stop()
+
+
+def test_metrics_server_address_in_use():
+    server = MetricsServer("127.0.0.1", 0)
+    port = server.start()
+    try:
+        with pytest.raises(SystemExit):
+            MetricsServer("127.0.0.1", port).start()
+    finally:
+        server.stop()
@@ -0,0 +1,160 @@
+import os
+import gzip
+from datetime import date
+import pytest
+from botstat.botstat import make_all_logs_stats
+from botstat.botstat import make_parallel_stats
+from botstat.botstat import make_stats
+from botstat.botstat import process_apache
+from botstat.botstat import process_nginx
+from botstat.botstat import make_range_stats
+from botstat.parallel import TaskError
+from botstat.parallel import read_range
+from botstat.parallel import split_ranges
+from . import cli_args
+
+
+LINES = [u'127.0.0.1 - - [%02d/Jun/2018:14:06:%02d +0000] "GET /%d HTTP/1.1" %d %d "-" "%s"\n'
+         % (24 + i // 40, i % 60, i, (200, 301, 404, 500)[i % 4], i, ("Googlebot", "bingbot", "Mozilla")[i % 3])
+         for i in range(120)]
+
+
+def make_args(**kwargs):
+    return cli_args("--log-format", "combined", "--workers", "3", **kwargs)
+
+
+def write_log(tmpdir):
+    access_log = tmpdir.join("access.log")
+    access_log.write(u"".join(LINES))
+    return str(access_log)
+
+
+def test_split_ranges(tmpdir):
+    access_log = write_log(tmpdir)
+    ranges = split_ranges(access_log, 7)
+    assert len(ranges) == 7
+    assert ranges[0][0] == 0
+    lines = [line for begin, end in ranges for line in read_range(access_log, begin, end)]
+    assert lines == [line.encode() for line in LINES]
+
+
+def test_split_ranges_start(tmpdir):
+    access_log = write_log(tmpdir)
+    start = len(LINES[0]) + len(LINES[1])
+    lines = [line for begin, end in split_ranges(access_log, 4, start)
+             for line in read_range(access_log, begin, end)]
+    assert lines == [line.encode() for line in LINES[2:]]
+
+
+def test_split_ranges_more_parts_than_lines(tmpdir):
+    access_log = tmpdir.join("access.log")
+    access_log.write(u"1\n2\n")
+    assert split_ranges(str(access_log), 16) == [(0, 2), (2, 4)]
+
+
+def test_make_parallel_stats(tmpdir):
+    access_log = write_log(tmpdir)
+    for args in (make_args(), make_args(date_start="2018/06/25")):
+        expected = make_stats(process_nginx([access_log], args), args)
+        assert make_parallel_stats([access_log], args) == expected
+
+
+def test_bot_prefilter(tmpdir):
+    access_log = write_log(tmpdir)
+    expected = make_stats(process_nginx([access_log], make_args()), make_args())
+    args = make_args(bot_prefilter=True)
+    assert make_stats(process_nginx([access_log], args), args) == expected
+    assert make_parallel_stats([access_log], args) == expected
+
+
+def test_make_parallel_stats_many_logs(tmpdir):
+    access_log = write_log(tmpdir)
+    expected = make_stats(process_nginx([access_log], make_args()), make_args())
+    rotated = tmpdir.join("access.log.1.gz")
+    with gzip.open(str(rotated), "wt") as fobj:
+        fobj.write(u"".join(LINES[:50]))
+    current = tmpdir.join("access.log.0")
+    current.write(u"".join(LINES[50:]))
+    os.utime(str(rotated), (1, 1))
+    access_logs = [str(tmpdir.join("access.log.*"))]
+    assert make_stats(process_nginx(access_logs, make_args()), make_args()) == expected
+    assert make_parallel_stats(access_logs, make_args()) == expected
+
+
+def test_make_all_logs_stats(tmpdir):
+    first = tmpdir.join("first.log")
+    first.write(u"".join(LINES[:70]))
+    second = tmpdir.join("second.log")
+    second.write(u"".join(line.replace(u" - - ", u" - ") for line in LINES[70:]))
+    config = tmpdir.join("nginx.conf")
+    config.write(u"""
+http {
+  log_format short '$remote_addr - [$time_local] "$request" $status $body_bytes_sent "$http_referer" "$http_user_agent"';
+  access_log %s;
+  server {
+    access_log %s short;
+    access_log %s;
+    access_log %s;
+  }
+}""" % (first, second, tmpdir.join("missing.log"), tmpdir.join("$host.log")))
+    for workers in (1, 2):
+        args = make_args(nginx_config=str(config), all_logs=True, workers=workers)
+        stats = make_all_logs_stats(args)
+        expected = make_stats(process_nginx([str(first)], make_args()), make_args(), default_host="first.log")
+        hosts = sorted(set(host for date, bot, host, status, counter in stats.iter_counters()))
+        assert hosts == ["first.log", "second.log"]
+        assert stats.select(lambda key: key[2] == "first.log") == expected
+        assert sum(counter["count"] for date, bot, host, status, counter in stats.iter_counters()) == 80
+
+
+APACHE_LINES = [u'127.0.0.1 www.example.com - - [%02d/Jun/2018:14:06:%02d +0000] "GET /%d HTTP/1.1" %d %d "-" "%s" %d\n'
+                % (24 + i // 40, i % 60, i, (200, 301, 404, 500)[i % 4], i, ("Googlebot", "bingbot", "Mozilla")[i % 3],
+                   i * 1000) for i in range(120)]
+APACHE_LOG_FORMAT = '%h %v %l %u %t "%r" %>s %b "%{Referer}i" "%{User-agent}i" %D'
+
+
+def rounded(stats):
+    # request time sums depend on the order of parts
+    return dict(((date, bot, host, status), (counter["count"], counter["bytes"], round(counter["time"], 6)))
+                for date, bot, host, status, counter in stats.iter_counters())
+
+
+def test_make_parallel_stats_apache(tmpdir):
+    access_log = tmpdir.join("access.log")
+    access_log.write(u"".join(APACHE_LINES))
+    for args in (make_args(server_type="apache", log_format=APACHE_LOG_FORMAT),
+                 make_args(server_type="apache", log_format=APACHE_LOG_FORMAT, date_start="2018/06/25")):
+        records = list(process_apache([str(access_log)], args))
+        assert len(records) == (80 if args.date_start else 120)
+        assert records[-1]["request_time"] == 0.119
+        expected = make_stats(iter(records), args)
+        assert rounded(make_parallel_stats([str(access_log)], args)) == rounded(expected)
+
+
+def test_not_utf8_user_agent(tmpdir):
+    access_log = tmpdir.join("access.log")
+    lines = [line.encode() for line in LINES[:3]]
+    lines[1] = lines[1].replace(b'"bingbot"', b'"bingbot \xff\xfe"')
+    lines[2] = lines[2].replace(b'"Mozilla"', b'"\xe9Mozilla"')
+    access_log.write_binary(b"".join(lines))
+    for workers in (1, 2):
+        args = make_args(workers=workers)
+        stats = make_stats(process_nginx([str(access_log)], args), args) if workers == 1 \
+            else make_parallel_stats([str(access_log)], args)
+        assert sorted(bot for date, bot, host, counts, bytes_sent, times in stats.iter_rows()) == \
+            ["Bing", "Google"]
+
+
+def test_make_parallel_stats_wrong_format(tmpdir):
+    # workers must not hang on a format without required fields
+    access_log = write_log(tmpdir)
+    with pytest.raises(SystemExit, match="http_user_agent|status"):
+        make_parallel_stats([access_log], make_args(log_format='$remote_addr [$time_local] "$request"'))
+    with pytest.raises(SystemExit):
+        make_parallel_stats([access_log], make_args(bot=["=Ahrefs"]))
+
+
+def test_make_range_stats_task_error(tmpdir):
+    args = make_args(log_format='$remote_addr')
+    with pytest.raises(TaskError):
+        make_range_stats((write_log(tmpdir), 0, None, args.log_format, args))
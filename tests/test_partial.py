@@ -0,0 +1,80 @@
+import json
+from datetime import date
+import pytest
+from botstat.aggregation import StatsStore
+from botstat.botstat import main
+from botstat.partial import merge_partials
+from botstat.partial import write_partial
+
+
+DAY = date(2018, 6, 25)
+
+
+def make_store(host, count):
+    stats = StatsStore()
+    for idx in range(count):
+        stats.add(DAY, "Google", host, 200, 100, 0.25)
+        stats.add_url(DAY, "Google", host, b"/%d\xff" % (idx % 2), 4)
+    stats.add(date(2018, 6, 26), "Bing", host, 404, 50, 1.5)
+    return stats
+
+
+def test_write_merge_partial(tmpdir):
+    stats = make_store("web1", 3)
+    path = str(tmpdir.join("web1.jsonl.gz"))
+    write_partial(path, stats, "day", "web1")
+    merged, bucket = merge_partials([path])
+    assert (merged, bucket) == (stats, "day")
+    assert merged.latency(0) == stats.latency(0)
+    assert list(merged.top_urls(1)) == list(stats.top_urls(1))
+
+
+def test_merge_partials_associative(tmpdir):
+    paths = []
+    expected = StatsStore()
+    for idx, host in enumerate(("web1", "web2", "web1")):
+        stats = make_store(host, idx + 1)
+        expected.merge(stats)
+        paths.append(str(tmpdir.join("%d.jsonl" % idx)))
+        write_partial(paths[-1], stats, "day", host)
+    merged = merge_partials(paths)[0]
+    assert merged == expected
+    assert merged[DAY]["Google"]["web1"][200]["count"] == 4
+    # partials merged in groups and in any order give the same statistic
+    pair = str(tmpdir.join("pair.jsonl"))
+    write_partial(pair, merge_partials(paths[1:])[0], "day")
+    assert merge_partials([pair, paths[0]])[0] == expected
+    assert list(merge_partials([pair, paths[0]])[0].top_urls(2)) == list(expected.top_urls(2))
+
+
+def test_merge_partials_errors(tmpdir):
+    day_path, hour_path, old_path = (str(tmpdir.join(name)) for name in ("day.jsonl", "hour.jsonl", "old.jsonl"))
+    write_partial(day_path, make_store("web1", 1), "day")
+    write_partial(hour_path, StatsStore(), "hour")
+    with open(old_path, "w") as fobj:
+        fobj.write(json.dumps({"format": "botstat-partial", "version": 0}) + "\n")
+    with pytest.raises(SystemExit, match="hour buckets"):
+        merge_partials([day_path, hour_path])
+    with pytest.raises(SystemExit, match="unsupported version"):
+        merge_partials([old_path])
+    with pytest.raises(SystemExit, match="is not a botstat partial"):
+        merge_partials([__file__])
+    with open(day_path, "a") as fobj:
+        fobj.write('["counter", "2018-06-25"\n')
+    with pytest.raises(SystemExit, match="day.jsonl has malformed line 5"):
+        merge_partials([day_path])
+
+
+def test_main_merge(tmpdir):
+    for host in ("web1", "web2"):
+        write_partial(str(tmpdir.join("%s.jsonl.gz" % host)), make_store(host, 2), "day", host)
+    output = str(tmpdir.join("all.jsonl"))
+    main(["merge", "--partial-output", output, str(tmpdir.join("web*.jsonl.gz"))])
+    merged, bucket = merge_partials([output])
+    assert sorted(merged[DAY]["Google"]) == ["web1", "web2"]
+    assert merged[DAY]["Google"]["web2"][200] == {"count": 2, "bytes": 200, "time": 0.5}
+
+
+def test_main_merge_missing(tmpdir):
+    with pytest.raises(SystemExit, match="does not exist"):
+        main(["merge", "--partial-output", str(tmpdir.join("all.jsonl")), str(tmpdir.join("missing.jsonl"))])
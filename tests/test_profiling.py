@@ -0,0 +1,108 @@
+import json
+import time
+import pytest
+from botstat.botstat import make_parallel_stats
+from botstat.botstat import make_stats
+from botstat.botstat import process_nginx
+from botstat.profiling import NULL_PROFILER
+from botstat.profiling import Profiler
+from . import cli_args
+
+
+LINES = [u'127.0.0.1 - - [24/Jun/2018:14:06:%02d +0000] "GET /%d HTTP/1.1" 200 %d "-" "%s"\n'
+         % (i, i, i, ("Googlebot", "bingbot", "Mozilla")[i % 3]) for i in range(30)] + [u"broken line\n"]
+
+
+def make_args(**kwargs):
+    return cli_args("--log-format", "combined", "--profile-stats", "profile.json", **kwargs)
+
+
+def slow(items, delay):
+    for item in items:
+        time.sleep(delay)
+        yield item
+
+
+def test_nested_stages_exclusive_time():
+    profiler = Profiler()
+    inner = profiler.iterate("inner", slow(range(3), 0.01), "items")
+    outer = profiler.iterate("outer", slow(inner, 0.02))
+    assert list(outer) == [0, 1, 2]
+    assert profiler.breakdown["inner"]["calls"] == 4
+    assert 0.03 <= profiler.breakdown["inner"]["wall"] < 0.06
+    assert 0.06 <= profiler.breakdown["outer"]["wall"] < 0.09
+    assert profiler.counters["items"] == 3
+
+
+def test_wrap_and_stage():
+    profiler = Profiler()
+    double = profiler.wrap("double", lambda value: value * 2)
+    with profiler.stage("report"):
+        assert [double(value) for value in range(5)] == [0, 2, 4, 6, 8]
+    assert profiler.breakdown["double"]["calls"] == 5
+    assert set(profiler.stages["report"]) == {"wall", "cpu"}
+
+
+def test_null_profiler():
+    function = len
+    items = [1, 2]
+    assert NULL_PROFILER.wrap("stage", function) is function
+    assert NULL_PROFILER.iterate("stage", items, "count") is items
+    with NULL_PROFILER.stage("stage"):
+        pass
+
+
+def test_make_stats_counters(tmpdir):
+    access_log = tmpdir.join("access.log")
+    access_log.write(u"".join(LINES))
+    args = make_args()
+    profiler = Profiler()
+    with profiler.stage("stats"):
+        make_stats(process_nginx([str(access_log)], args, profiler), args, profiler)
+    summary = profiler.summary()
+    assert summary["counters"] == {"lines_read": 31, "bytes_read": access_log.size(),
+                                   "lines_matched": 30, "lines_unmatched": 1, "bot_hits": 20}
+    assert set(summary["stats_breakdown"]) == {"read", "parse", "date", "bot", "aggregate"}
+    assert summary["lines_per_sec"] > 0
+    profiler.write(str(tmpdir.join("profile.json")))
+    with open(str(tmpdir.join("profile.json"))) as fobj:
+        assert json.load(fobj)["counters"]["bot_hits"] == 20
+
+
+def test_numpy_bot_hits(tmpdir):
+    pytest.importorskip("numpy")
+    access_log = tmpdir.join("access.log")
+    access_log.write(u"".join(LINES))
+    args = make_args(engine="numpy")
+    profiler = Profiler()
+    make_stats(process_nginx([str(access_log)], args, profiler), args, profiler)
+    assert profiler.summary()["counters"]["bot_hits"] == 20
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_prefilter_counters(tmpdir, workers):
+    access_log = tmpdir.join("access.log")
+    access_log.write(u"".join(LINES))
+    args = make_args(bot_prefilter=True, workers=workers)
+    profiler = Profiler()
+    if workers > 1:
+        make_parallel_stats([str(access_log)], args, profiler)
+    else:
+        make_stats(process_nginx([str(access_log)], args, profiler), args, profiler)
+    counters = profiler.summary()["counters"]
+    assert counters == {"lines_read": 31, "bytes_read": access_log.size(), "lines_prefiltered": 20,
+                        "lines_matched": 20, "lines_unmatched": 0, "bot_hits": 20}
+    assert profiler.done_bytes == access_log.size()
+
+
+def test_parallel_counters(tmpdir):
+    access_log = tmpdir.join("access.log")
+    access_log.write(u"".join(LINES))
+    args = make_args(workers=3)
+    profiler = Profiler()
+    make_parallel_stats([str(access_log)], args, profiler)
+    summary = profiler.summary()
+    assert summary["counters"]["lines_read"] == 31
+    assert summary["counters"]["lines_unmatched"] == 1
+    assert summary["counters"]["bot_hits"] == 20
+    assert profiler.done_bytes == access_log.size()
@@ -0,0 +1,54 @@
+import os
+import bz2
+import gzip
+import lzma
+from datetime import date
+import pytest
+from botstat.reader import expand_log_paths
+from botstat.reader import is_compressed
+from botstat.reader import open_log
+from botstat.reader import order_log_files
+
+
+TEXT = u"1 Googlebot\n2 Mozilla\n3 bingbot\n"
+
+
+@pytest.mark.parametrize("suffix, opener", [(".gz", gzip.open), (".bz2", bz2.open), (".xz", lzma.open)])
+def test_open_compressed_log(tmpdir, suffix, opener):
+    path = str(tmpdir.join("access.log.1" + suffix))
+    with opener(path, "wt") as fobj:
+        fobj.write(TEXT)
+    assert is_compressed(path)
+    with open_log(path) as stream:
+        assert list(stream) == TEXT.splitlines(True)
+    with open_log(path, binary=True) as stream:
+        assert stream.read() == TEXT.encode()
+
+
+def test_open_plain_log(tmpdir):
+    path = tmpdir.join("access.log")
+    path.write(TEXT)
+    assert not is_compressed(str(path))
+    with open_log(str(path)) as stream:
+        assert stream.read() == TEXT
+
+
+def test_expand_log_paths(tmpdir):
+    for name in ("access.log", "access.log.1", "access.log.2.gz", "error.log"):
+        tmpdir.join(name).write(u"")
+    paths = expand_log_paths([str(tmpdir.join("access.log*")), str(tmpdir.join("access.log")),
+                              str(tmpdir.join("missing.log"))])
+    assert [os.path.basename(path) for path in paths] == \
+        ["access.log", "access.log.1", "access.log.2.gz", "missing.log"]
+
+
+def test_order_log_files(tmpdir):
+    paths = []
+    for name, mtime in (("access.log", 1530000000), ("access.log.1", 1520000000),
+                        ("access.log.2.gz", 1510000000)):
+        path = str(tmpdir.join(name))
+        open(path, "w").close()
+        os.utime(path, (mtime, mtime))
+        paths.append(path)
+    assert order_log_files(paths) == paths[::-1]
+    assert order_log_files(paths, date(2018, 1, 1)) == [paths[1], paths[0]]
@@ -128,3 +128,48 @@ def test_empty():
     stream = StringIO(u"")
     seek_to_date(stream, DATE, RE_PARSER)
     assert stream.readline() == u""
+
+
+def write_file(tmpdir, lines):
+    path = tmpdir.join("access.log")
+    path.write_binary(u"".join(lines).encode("utf-8"))
+    return str(path)
+
+
+def test_file_multibyte(tmpdir):
+    lines = [u"%d [2018/09/%02d 12:09:09] бот %s\n" % (i, 1 + i // 10, u"é" * i)
+             for i in range(50)]
+    with open(write_file(tmpdir, lines), encoding="utf-8") as stream:
+        probes = seek_to_date(stream, DATE, RE_PARSER)
+        assert stream.readline() == lines[20]
+        assert stream.readline() == lines[21]
+    assert 0 < probes < 10
+
+
+def test_file_all_are_less(tmpdir):
+    lines = [u"1 [2018/09/01 12:09:09]\n", u"2 [2018/09/02 12:09:09]"]
+    with open(write_file(tmpdir, lines)) as stream:
+        seek_to_date(stream, DATE, RE_PARSER)
+        assert stream.readline() == u""
+
+
+def test_file_empty(tmpdir):
+    with open(write_file(tmpdir, [])) as stream:
+        assert seek_to_date(stream, DATE, RE_PARSER) == 0
+        assert stream.readline() == u""
+
+
+def test_not_matched_lines():
+    stream = StringIO(
+        u"1 [2018/09/01 12:09:09]\n"
+        u"broken line\n"
+        u"broken line\n"
+        u"broken line\n"
+        u"2 [2018/09/02 12:09:09]\n"
+        u"broken line\n"
+        u"3 [2018/09/03 12:09:09]\n"
+        u"4 [2018/09/04 12:09:09]\n"
+    )
+    seek_to_date(stream, DATE, RE_PARSER)
+    assert stream.readline() == u"broken line\n"
+    assert stream.readline() == u"3 [2018/09/03 12:09:09]\n"
@@ -0,0 +1,125 @@
+import os
+from datetime import date
+from datetime import datetime
+from botstat.aggregation import StatsStore
+from botstat.botstat import make_incremental_stats
+from botstat.botstat import make_stats
+from botstat.botstat import process_nginx
+from botstat.state import complete_lines_end
+from botstat.state import load_state
+from botstat.state import plan_segments
+from botstat.state import save_state
+from . import cli_args
+
+
+def make_line(day, idx, user_agent="Googlebot"):
+    return u'127.0.0.1 - - [%02d/Jun/2018:14:06:%02d +0000] "GET /%d HTTP/1.1" 200 %d "-" "%s"\n' \
+        % (day, idx % 60, idx, idx, user_agent)
+
+
+def make_args(tmpdir, **kwargs):
+    return cli_args("--log-format", "combined", "--state-file", str(tmpdir.join("state.json")), **kwargs)
+
+
+def full_stats(lines, args):
+    # statistic made by parsing all lines at once
+    path = "%s.full" % args.state_file
+    with open(path, "w") as fobj:
+        fobj.write(u"".join(lines))
+    return make_stats(process_nginx([path], args), args)
+
+
+def test_complete_lines_end(tmpdir):
+    path = tmpdir.join("access.log")
+    path.write(u"123\n456\n78")
+    assert complete_lines_end(str(path), 0, 10) == 8
+    assert complete_lines_end(str(path), 8, 10) == 8
+    assert complete_lines_end(str(path), 0, 8) == 8
+
+
+def test_plan_segments_appended(tmpdir):
+    path = tmpdir.join("access.log")
+    path.write(u"123\n456\n")
+    log_state = {"inode": os.stat(str(path)).st_ino, "offset": 4}
+    assert plan_segments(str(path), log_state) == [(str(path), 4, 8)]
+
+
+def test_plan_segments_rotated(tmpdir):
+    path = tmpdir.join("access.log")
+    path.write(u"123\n456\n")
+    log_state = {"inode": os.stat(str(path)).st_ino, "offset": 4}
+    path.rename(tmpdir.join("access.log.1"))
+    path.write(u"789\n")
+    assert plan_segments(str(path), log_state) == [(str(tmpdir.join("access.log.1")), 4, 8), (str(path), 0, 4)]
+
+
+def test_plan_segments_truncated(tmpdir):
+    path = tmpdir.join("access.log")
+    path.write(u"123\n456\n")
+    log_state = {"inode": os.stat(str(path)).st_ino, "offset": 8}
+    path.write(u"789\n")
+    assert plan_segments(str(path), log_state) == [(str(path), 0, 4)]
+
+
+def test_save_load_state(tmpdir):
+    path = str(tmpdir.join("state.json"))
+    stats = StatsStore()
+    stats.add(date(2018, 6, 25), "Google", "localhost", 200, request_time=0.25)
+    stats.add(date(2018, 6, 25), "Google", "localhost", 200, request_time=0.25)
+    save_state(path, {"path": "/access.log", "inode": 1, "size": 10, "offset": 8}, stats)
+    state = load_state(path)
+    assert state["log"] == {"path": "/access.log", "inode": 1, "size": 10, "offset": 8}
+    assert state["stats"] == stats
+    assert state["stats"][date(2018, 6, 25)]["Google"]["localhost"][200] == {"count": 2, "time": 0.5}
+    assert state["stats"].latency(0) == stats.latency(0)
+
+
+def test_save_load_state_urls(tmpdir):
+    path = str(tmpdir.join("state.json"))
+    stats = StatsStore()
+    for url in (b"/a", b"/b\xff", b"/a"):
+        stats.add_url(date(2018, 6, 25), "Google", "localhost", url, 4)
+    save_state(path, {"path": "/access.log", "inode": 1, "size": 10, "offset": 8}, stats)
+    assert list(load_state(path)["stats"].top_urls(2)) == [("Google", "localhost", [(b"/a", 2, 0), (b"/b\xff", 1, 0)])]
+
+
+def test_incremental_stats(tmpdir):
+    args = make_args(tmpdir)
+    path = tmpdir.join("access.log")
+    lines = [make_line(25, idx) for idx in range(10)]
+    path.write(u"".join(lines) + u"127.0.0.1 - - [25/Jun/2018:")
+    assert make_incremental_stats([str(path)], args) == full_stats(lines, args)
+    lines += [make_line(26, idx, "bingbot") for idx in range(10, 20)]
+    path.write(u"".join(lines))
+    assert make_incremental_stats([str(path)], args) == full_stats(lines, args)
+    assert make_incremental_stats([str(path)], args) == full_stats(lines, args)
+
+
+def test_incremental_stats_bucket(tmpdir):
+    args = make_args(tmpdir, bucket="5m", date_start="2018/06/26")
+    path = tmpdir.join("access.log")
+    lines = [make_line(25 + idx // 40, idx) for idx in range(80)]
+    path.write(u"".join(lines[:50]))
+    assert make_incremental_stats([str(path)], args) == full_stats(lines[:50], args)
+    path.write(u"".join(lines))
+    stats = make_incremental_stats([str(path)], args)
+    assert stats == full_stats(lines, args)
+    assert sorted(stats) == [datetime(2018, 6, 26, 14, 5)]
+    day_args = make_args(tmpdir, date_start="2018/06/26")
+    assert make_incremental_stats([str(path)], day_args) == full_stats(lines, day_args)
+
+
+def test_incremental_stats_rotated(tmpdir):
+    args = make_args(tmpdir, date_start="2018/06/26")
+    path = tmpdir.join("access.log")
+    lines = [make_line(25 + idx // 10, idx) for idx in range(20)]
+    path.write(u"".join(lines))
+    assert make_incremental_stats([str(path)], args) == full_stats(lines, args)
+    lines += [make_line(27, idx) for idx in range(20, 25)]
+    path.write(u"".join(lines))
+    path.rename(tmpdir.join("access.log.1"))
+    new_lines = [make_line(27, idx, "bingbot") for idx in range(25, 30)]
+    path.write(u"".join(new_lines))
+    stats = make_incremental_stats([str(path)], args)
+    assert stats == full_stats(lines + new_lines, args)
+    assert sorted(stats) == [date(2018, 6, 26), date(2018, 6, 27)]
@@ -0,0 +1,113 @@
+import socket
+import asyncio
+from datetime import date
+from botstat import botstat
+from botstat.botstat import binary_regex
+from botstat.botstat import build_nginx_parser
+from botstat.botstat import receive_syslog
+from botstat.botstat import new_stats
+from botstat.botstat import syslog_records
+from botstat.follow import FollowControl
+from botstat.syslog import SyslogQueue
+from botstat.syslog import SyslogReceiver
+from botstat.syslog import syslog_regex
+from .test_state import make_args
+from .test_state import make_line
+
+
+LINE = make_line(25, 1).rstrip("\n").encode()
+
+
+def make_regex():
+    return syslog_regex(binary_regex(build_nginx_parser("combined")))
+
+
+def test_syslog_regex():
+    match = make_regex().match
+    record = match(b"<190>Jun 25 14:06:24 web1 nginx: " + LINE).groupdict()
+    assert (record["syslog_host"], record["status"]) == (b"web1", b"200")
+    record = match(b"<190>Jun  5 14:06:24 web2 nginx[123]:" + LINE).groupdict()
+    assert record["syslog_host"] == b"web2"
+    record = match(b'<190>1 2018-06-25T14:06:24Z web3 nginx - - [meta x="\\]"] ' + LINE).groupdict()
+    assert (record["syslog_host"], record["syslog_host_5424"]) == (None, b"web3")
+    record = match(LINE).groupdict()
+    assert (record["syslog_host"], record["syslog_host_5424"], record["status"]) == (None, None, b"200")
+    assert match(b"<190>Jun 25 14:06:24 web1 nginx: broken") is None
+
+
+def test_syslog_records():
+    messages = [b"<190>Jun 25 14:06:24 web1 nginx: " + LINE, b"<190>1 2018-06-25T14:06:24Z web2 nginx - - - " + LINE]
+    records = list(syslog_records(messages, make_regex(), SyslogReceiver("127.0.0.1", 0)))
+    assert [record["host"] for record in records] == [b"web1", b"web2"]
+    assert all("syslog_host" not in record and "syslog_host_5424" not in record for record in records)
+
+
+def test_syslog_queue():
+    queue = SyslogQueue(2)
+    assert [queue.put(message) for message in (b"1", b"2", b"3")] == [True, True, False]
+    assert (queue.received, queue.dropped) == (3, 1)
+    assert queue.take() == [b"1", b"2"]
+    assert queue.put(b"4")
+
+
+def test_receive_syslog(tmpdir, monkeypatch):
+    matchers = []
+    build = botstat.build_bot_matcher
+
+    def build_bot_matcher(args):
+        matchers.append(args)
+        return build(args)
+
+    monkeypatch.setattr("botstat.botstat.build_bot_matcher", build_bot_matcher)
+    args = make_args(tmpdir, flush_interval=3600)
+    receiver = SyslogReceiver("127.0.0.1", 0)
+    control = FollowControl()
+    flushes = []
+
+    def flush(stats, receiver, args):
+        flushes.append(stats.select(lambda key: True))
+        return stats
+
+    async def send():
+        while receiver.sock is None:
+            await asyncio.sleep(0.01)
+        udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        udp.sendto(b"<190>Jun 25 14:06:24 web1 nginx: " + LINE, ("127.0.0.1", receiver.port))
+        udp.sendto(b"<190>Jun 25 14:06:24 web1 nginx: not a log line", ("127.0.0.1", receiver.port))
+        udp.sendto(LINE, ("127.0.0.1", receiver.port))
+        udp.close()
+        reader, writer = await asyncio.open_connection("127.0.0.1", receiver.port)
+        message = b"<190>1 2018-06-25T14:06:24Z web2 nginx - - - " + LINE
+        # octet counting, split between writes, then newline framing
+        framed = b"%d %s" % (len(message), message) * 2 + message + b"\n"
+        writer.write(framed[:30])
+        await writer.drain()
+        await asyncio.sleep(0.05)
+        writer.write(framed[30:])
+        await writer.drain()
+        while receiver.queue.received < 6:
+            await asyncio.sleep(0.01)
+        control.request_flush()
+        while not flushes:
+            await asyncio.sleep(0.01)
+        control.stop()
+        writer.close()
+
+    async def run():
+        return await asyncio.gather(receive_syslog(receiver, new_stats(), args, make_regex(), control, flush), send())
+
+    loop = asyncio.new_event_loop()
+    try:
+        stats, _ = loop.run_until_complete(run())
+    finally:
+        loop.close()
+    day = date(2018, 6, 25)
+    counts = {host: counter["count"] for row_date, bot, host, status, counter in stats.iter_counters()
+              if (row_date, bot) == (day, "Google")}
+    assert counts == {"web1": 1, "web2": 3, socket.gethostname(): 1}
+    assert flushes[0] == stats
+    assert receiver.counters() == {"syslog_messages_received": 6, "syslog_messages_dropped": 0,
+                                   "syslog_messages_malformed": 1}
+    assert receiver.sock is None
+    # batches are added by one aggregator, the matcher keeps its cache
+    assert len(matchers) == 1
@@ -0,0 +1,60 @@
+from datetime import date
+from datetime import datetime
+from botstat.timestamp import TimeLocalParser
+
+
+def test_nginx_time_local():
+    time_parser = TimeLocalParser()
+    assert time_parser.parse_date("10/Oct/2026:13:55:36 +0000") == date(2026, 10, 10)
+
+
+def test_apache_time():
+    time_parser = TimeLocalParser()
+    assert time_parser.parse_date("[10/Oct/2026:13:55:36 -0700]") == date(2026, 10, 10)
+
+
+def test_without_timezone():
+    time_parser = TimeLocalParser()
+    assert time_parser.parse_date("25/Jun/2018:14:06:24") == date(2018, 6, 25)
+
+
+def test_day_change():
+    time_parser = TimeLocalParser()
+    assert time_parser.parse_date("31/Dec/2018:23:59:59 +0000") == date(2018, 12, 31)
+    assert time_parser.parse_date("31/Dec/2018:23:59:59 +0000") == date(2018, 12, 31)
+    assert time_parser.parse_date("01/Jan/2019:00:00:00 +0000") == date(2019, 1, 1)
+
+
+def test_unknown_layout_fallback():
+    time_parser = TimeLocalParser()
+    assert time_parser.parse_date("2018/09/03 12:09:11") == date(2018, 9, 3)
+    assert time_parser.parse_date("2018-09-04T12:09:11+00:00") == date(2018, 9, 4)
+
+
+def test_invalid_date_fallback():
+    time_parser = TimeLocalParser()
+    assert time_parser.parse_date("03/Sep/2018 12:09:11") == date(2018, 9, 3)
+
+
+def test_date_format():
+    time_parser = TimeLocalParser("%d.%m.%Y %H:%M")
+    assert time_parser.parse_date("03.09.2018 12:09") == date(2018, 9, 3)
+
+
+def test_bytes():
+    time_parser = TimeLocalParser()
+    assert time_parser.parse_date(b"[10/Oct/2026:13:55:36 -0700]") == date(2026, 10, 10)
+    assert time_parser.parse_date(b"10/Oct/2026:23:55:36 -0700") == date(2026, 10, 10)
+    assert time_parser.parse_date(b"2018-09-04T12:09:11+00:00") == date(2018, 9, 4)
+    assert TimeLocalParser("%d.%m.%Y %H:%M").parse_date(b"03.09.2018 12:09") == date(2018, 9, 3)
+
+
+def test_bucket():
+    time_parser = TimeLocalParser(bucket="15m")
+    assert time_parser.parse_bucket("10/Oct/2026:13:55:36 +0000") == datetime(2026, 10, 10, 13, 45)
+    assert time_parser.parse_bucket(b"[10/Oct/2026:13:59:59 +0000]") == datetime(2026, 10, 10, 13, 45)
+    assert time_parser.parse_bucket("10/Oct/2026:14:00:00 +0000") == datetime(2026, 10, 10, 14, 0)
+    assert TimeLocalParser(bucket="hour").parse_bucket("10/Oct/2026:13:55:36") == datetime(2026, 10, 10, 13)
+    assert TimeLocalParser(bucket="1m").parse_bucket("2018-09-04T12:09:11+00:00") == datetime(2018, 9, 4, 12, 9)
+    assert TimeLocalParser("%d.%m.%Y %H:%M", "5m").parse_bucket(b"03.09.2018 12:09") == datetime(2018, 9, 3, 12, 5)
+    assert TimeLocalParser(bucket="day").parse_bucket("10/Oct/2026:13:55:36") == date(2026, 10, 10)